@@ -0,0 +1,149 @@
+"""Price-threshold alerts indexed per coin so a price tick only touches the alerts that fire."""
+from bisect import bisect_left, insort
+
+
+class Alert:
+    """One-shot alert: fires when the price reaches `threshold` from below (`above`) or from above."""
+    __slots__ = ("user_id", "alert_id", "coin_id", "threshold", "above")
+
+    def __init__(self, user_id: int, alert_id: int, coin_id: str, threshold: float, above: bool):
+        self.user_id = user_id
+        self.alert_id = alert_id
+        self.coin_id = coin_id
+        self.threshold = threshold
+        self.above = above
+
+    def to_dict(self) -> dict:
+        """Form stored in the user's settings (user_data["alerts"])."""
+        return {"id": self.alert_id, "coin": self.coin_id, "price": self.threshold, "above": self.above}
+
+    @classmethod
+    def from_dict(cls, user_id: int, data: dict) -> "Alert":
+        return cls(user_id, data["id"], data["coin"], float(data["price"]), bool(data["above"]))
+
+
+class _CoinAlerts:
+    """Both lists are sorted so the alerts that fire at a given price are always a suffix.
+
+    above: keys (-threshold, user_id, alert_id); fires when threshold <= price.
+    below: keys (threshold, user_id, alert_id); fires when threshold >= price.
+    """
+    __slots__ = ("above", "below", "alerts")
+
+    def __init__(self):
+        self.above = []
+        self.below = []
+        self.alerts = {} # (user_id, alert_id) -> Alert
+
+    def __len__(self):
+        return len(self.alerts)
+
+
+class AlertBook:
+    """All active alerts; `check(coin_id, price)` costs O(log n + k) for n alerts on the coin, k fired.
+
+    A fired alert stays in the user's stored settings until the caller removes it there and calls
+    `settle()`; until then `resync()` and `set_user_alerts()` skip it, so settings read in between
+    cannot bring it back and fire it twice.
+    """
+
+    def __init__(self):
+        self._coins = {} # coin_id -> _CoinAlerts
+        self._users = {} # user_id -> {alert_id: coin_id}
+        self._fired = {} # user_id -> alert ids fired but not yet settled
+
+    def __len__(self):
+        return sum(len(book) for book in self._coins.values())
+
+    def coins(self) -> list:
+        return list(self._coins)
+
+    @staticmethod
+    def _key(alert: Alert) -> tuple:
+        return (-alert.threshold if alert.above else alert.threshold, alert.user_id, alert.alert_id)
+
+    def add(self, alert: Alert):
+        """Adds `alert`, replacing an alert of the same user with the same id."""
+        previous_coin = self._users.get(alert.user_id, {}).get(alert.alert_id)
+        if previous_coin is not None:
+            self.remove(alert.user_id, alert.alert_id, previous_coin)
+        book = self._coins.get(alert.coin_id)
+        if book is None:
+            book = self._coins[alert.coin_id] = _CoinAlerts()
+        book.alerts[(alert.user_id, alert.alert_id)] = alert
+        insort(book.above if alert.above else book.below, self._key(alert))
+        self._users.setdefault(alert.user_id, {})[alert.alert_id] = alert.coin_id
+
+    def remove(self, user_id: int, alert_id: int, coin_id: str) -> bool:
+        book = self._coins.get(coin_id)
+        alert = book.alerts.pop((user_id, alert_id), None) if book else None
+        if alert is None:
+            return False
+        self._forget(user_id, alert_id)
+        keys, key = (book.above if alert.above else book.below), self._key(alert)
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+        if not book.alerts:
+            del self._coins[coin_id]
+        return True
+
+    def _forget(self, user_id: int, alert_id: int):
+        alerts = self._users.get(user_id)
+        if alerts is not None:
+            alerts.pop(alert_id, None)
+            if not alerts:
+                del self._users[user_id]
+
+    def _add_stored(self, user_id: int, stored):
+        fired = self._fired.get(user_id, ())
+        for data in stored or ():
+            if data["id"] not in fired:
+                self.add(Alert.from_dict(user_id, data))
+
+    def resync(self, users):
+        """Rebuilds the book from (user_id, stored alert dicts) pairs, e.g. at startup."""
+        self._coins = {}
+        self._users = {}
+        for user_id, stored in users:
+            self._add_stored(user_id, stored)
+
+    def set_user_alerts(self, user_id: int, stored):
+        """Replaces one user's alerts with their stored alert dicts (settings changed elsewhere)."""
+        for alert_id, coin_id in list(self._users.get(user_id, {}).items()):
+            self.remove(user_id, alert_id, coin_id)
+        self._add_stored(user_id, stored)
+
+    def settle(self, user_id: int, alert_id: int):
+        """Marks a fired alert as removed from the user's stored settings."""
+        fired = self._fired.get(user_id)
+        if fired is not None:
+            fired.discard(alert_id)
+            if not fired:
+                del self._fired[user_id]
+
+    def check(self, coin_id: str, price: float) -> list:
+        """Removes and returns the alerts on `coin_id` that `price` triggers."""
+        book = self._coins.get(coin_id)
+        if book is None:
+            return []
+        fired = []
+        for keys, start in ((book.above, bisect_left(book.above, (-price,))),
+                            (book.below, bisect_left(book.below, (price,)))):
+            for _, user_id, alert_id in keys[start:]:
+                fired.append(book.alerts.pop((user_id, alert_id)))
+                self._forget(user_id, alert_id)
+                self._fired.setdefault(user_id, set()).add(alert_id)
+            del keys[start:]
+        if not book.alerts:
+            del self._coins[coin_id]
+        return fired
+
+    def check_many(self, prices: dict, currency: str = "usd") -> list:
+        """Checks a /simple/price payload; only coins that have alerts are looked at."""
+        fired = []
+        for coin_id in self._coins.keys() & prices.keys():
+            price = prices[coin_id].get(currency) if isinstance(prices[coin_id], dict) else None
+            if isinstance(price, (int, float)):
+                fired.extend(self.check(coin_id, float(price)))
+        return fired
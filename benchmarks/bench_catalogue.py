@@ -0,0 +1,105 @@
+"""Memory footprint and lookup cost: raw /coins/list dicts vs CoinCatalogue + CoinIndex.
+
+Usage (from the repository root):
+    python benchmarks/bench_catalogue.py                       # synthetic 18k-coin list
+    python benchmarks/bench_catalogue.py --snapshot coin_list.json.gz
+    python benchmarks/bench_catalogue.py --coins 50000
+"""
+import os
+import sys
+import json
+import random
+import string
+import argparse
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coin_index import CoinCatalogue, CoinIndex, DERIVATIVE_FILTERS  # noqa: E402
+from coin_snapshot import load_snapshot  # noqa: E402
+
+
+def synthetic_payload(count: int, seed: int = 7) -> str:
+    """JSON text shaped like /coins/list, with realistic id/symbol/name lengths and some derivatives."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(4000)]
+    coins = []
+    for i in range(count):
+        name_words = rng.sample(words, rng.randint(1, 3))
+        if rng.random() < 0.08:
+            name_words.insert(0, rng.choice(DERIVATIVE_FILTERS))
+        coin_id = "-".join(name_words) + ("" if rng.random() < 0.8 else f"-{i}")
+        symbol = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 5)))
+        coins.append({"id": coin_id, "symbol": symbol, "name": " ".join(w.capitalize() for w in name_words)})
+    coins.append({"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"})
+    return json.dumps(coins)
+
+
+def measure(build):
+    """Returns (result, bytes still allocated by `build()`)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def linear_search(coins: list, query: str) -> list:
+    """The pre-index search from handle_message_input, kept for comparison."""
+    potential_matches = []
+    for coin in coins:
+        coin_id_lower = coin.get('id', '').lower()
+        coin_symbol_lower = coin.get('symbol', '').lower()
+        coin_name_lower = coin.get('name', '').lower()
+        if not coin_id_lower or not coin_symbol_lower or not coin.get('name'): continue
+        if any(f_word in coin_id_lower for f_word in DERIVATIVE_FILTERS): continue
+        if query == coin_symbol_lower or query == coin_id_lower or query in coin_name_lower:
+            potential_matches.append(coin)
+    return sorted(potential_matches, key=lambda c: (query != c.get('symbol', '').lower(), query != c.get('id', '').lower(), query not in c.get('name', '').lower()))
+
+
+def per_call_us(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--coins", type=int, default=18000, help="size of the synthetic coin list")
+    parser.add_argument("--snapshot", help="use a coin_list.json.gz snapshot instead of synthetic data")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        rows = load_snapshot(args.snapshot)["coins"]
+        payload = json.dumps([{"id": i, "symbol": s, "name": n} for i, s, n in rows])
+    else:
+        payload = synthetic_payload(args.coins)
+
+    raw, raw_bytes = measure(lambda: json.loads(payload))
+    catalogue, catalogue_bytes = measure(lambda: CoinCatalogue.from_coins(json.loads(payload)))
+    index, index_bytes = measure(lambda: CoinIndex(catalogue))
+    assert [c["id"] for c in linear_search(raw, "btc")[:5]] == [c["id"] for c in index.search("btc", 5)]
+
+    print(f"coins: {len(raw)}")
+    print("\n== memory ==")
+    print(f"list of dicts (coin_list_cache before)   {raw_bytes / 2**20:8.2f} MiB")
+    print(f"CoinCatalogue                            {catalogue_bytes / 2**20:8.2f} MiB")
+    print(f"CoinIndex (search structures)            {index_bytes / 2**20:8.2f} MiB")
+    print(f"catalogue + index                        {(catalogue_bytes + index_bytes) / 2**20:8.2f} MiB")
+
+    some_id = raw[len(raw) // 2]["id"]
+    last_id = raw[-1]["id"]
+    name_part = raw[len(raw) // 3]["name"].lower()[:5]
+    print("\n== lookup cost (per call) ==")
+    print(f"id -> coin, linear next() (mid list)     {per_call_us(lambda: next((c for c in raw if c.get('id') == some_id), None), 20):10.2f} us")
+    print(f"id -> coin, catalogue.get()              {per_call_us(lambda: catalogue.get(some_id), 100000):10.2f} us")
+    print(f"display_name() (end of list)             {per_call_us(lambda: index.display_name(last_id, with_symbol=True), 100000):10.2f} us")
+    for query in ("btc", "a", name_part, "zzzzzz"):
+        linear = per_call_us(lambda: linear_search(raw, query)[:5], 3)
+        indexed = per_call_us(lambda: index.search(query, 5), 10000)
+        print(f"search {query!r:<12} linear {linear:10.1f} us   indexed {indexed:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Local stand-ins for the Telegram Bot API and CoinGecko used by the benchmarks.
+
+Both servers add a configurable latency to every call and can answer a fraction of calls
+with 429 so the bot's rate-limit handling is exercised without touching the real services.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_catalogue import synthetic_payload  # noqa: E402
+
+# Telegram methods that deliver something to a chat; only these get synthetic 429s.
+SEND_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup", "sendPhoto"}
+POPULAR_COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "solana", "symbol": "sol", "name": "Solana"},
+    {"id": "dogecoin", "symbol": "doge", "name": "Dogecoin"},
+]
+
+
+async def start_site(app: web.Application, port: int = 0):
+    """Serves `app` on 127.0.0.1; returns (runner, bound port)."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+class _FakeServer:
+    def __init__(self, latency: float = 0.0, rate_limit_ratio: float = 0.0, retry_after: int = 1, seed: int = 1):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self._random = random.Random(seed)
+        self._runner = None
+        self.base_url = None
+
+    def _should_rate_limit(self) -> bool:
+        return self.rate_limit_ratio > 0 and self._random.random() < self.rate_limit_ratio
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def make_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self, port: int = 0, prefix: str = "") -> str:
+        self._runner, bound_port = await start_site(self.make_app(), port)
+        self.base_url = f"http://127.0.0.1:{bound_port}{prefix}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeTelegram(_FakeServer):
+    """Answers /bot<token>/<method> like the Bot API, echoing sent messages back as Message objects."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.webhook_url = ""
+        self.pending_update_count = 0
+        self._message_ids = itertools.count(1_000_000)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        await self._delay()
+        data = await request.post()
+        if method in SEND_METHODS and self._should_rate_limit():
+            self.rate_limited[method] += 1
+            return web.json_response(status=429, data={
+                "ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}})
+        return web.json_response({"ok": True, "result": self._result(method, data)})
+
+    def _result(self, method: str, data):
+        if method in SEND_METHODS:
+            chat_id = int(data.get("chat_id", 0))
+            message_id = int(data["message_id"]) if data.get("message_id") else next(self._message_ids)
+            return {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+                    "text": data.get("text", "")}
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench Bot", "username": "bench_bot"}
+        if method == "setWebhook":
+            self.webhook_url = data.get("url", "")
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url, "has_custom_certificate": False,
+                    "pending_update_count": self.pending_update_count}
+        return True
+
+
+class FakeCoinGecko(_FakeServer):
+    """Serves /coins/list (with ETag), /simple/price with deterministic synthetic prices and /exchange_rates."""
+
+    def __init__(self, coins: int = 15000, **kwargs):
+        super().__init__(**kwargs)
+        popular_ids = {c["id"] for c in POPULAR_COINS}
+        coin_list = POPULAR_COINS + [c for c in json.loads(synthetic_payload(coins)) if c["id"] not in popular_ids]
+        self.coin_list_body = json.dumps(coin_list)
+        self.etag = f'"bench-{len(coin_list)}"'
+        self.requested_ids = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v3/coins/list", self.coins_list)
+        app.router.add_get("/api/v3/simple/price", self.simple_price)
+        app.router.add_get("/api/v3/exchange_rates", self.exchange_rates)
+        return app
+
+    async def start(self, port: int = 0, prefix: str = "/api/v3") -> str:
+        return await super().start(port, prefix)
+
+    def _rate_limited(self, path: str):
+        self.rate_limited[path] += 1
+        return web.json_response(status=429, headers={"Retry-After": str(self.retry_after)},
+                                 data={"status": {"error_code": 429, "error_message": "You've exceeded the Rate Limit."}})
+
+    async def coins_list(self, request: web.Request) -> web.Response:
+        self.calls["/coins/list"] += 1
+        await self._delay()
+        if self._should_rate_limit():
+            return self._rate_limited("/coins/list")
+        if request.headers.get("If-None-Match") == self.etag:
+            return web.Response(status=304, headers={"ETag": self.etag})
+        return web.Response(text=self.coin_list_body, content_type="application/json", headers={"ETag": self.etag})
+
+    async def simple_price(self, request: web.Request) -> web.Response:
+        self.calls["/simple/price"] += 1
+        await self._delay()
+        if self._should_rate_limit():
+            return self._rate_limited("/simple/price")
+        ids = [i for i in request.query.get("ids", "").split(",") if i]
+        currencies = [c for c in request.query.get("vs_currencies", "usd").split(",") if c]
+        self.requested_ids += len(ids)
+        minute = int(time.time() // 60)
+        return web.json_response({
+            coin_id: {c: round(1 + (hash((coin_id, c, minute)) % 1_000_000) / 100, 2) for c in currencies}
+            for coin_id in ids})
+
+    async def exchange_rates(self, request: web.Request) -> web.Response:
+        self.calls["/exchange_rates"] += 1
+        await self._delay()
+        if self._should_rate_limit():
+            return self._rate_limited("/exchange_rates")
+        values = {"btc": 1.0, "usd": 65000.0, "eur": 60000.0, "uah": 2700000.0, "gbp": 51000.0, "pln": 260000.0}
+        return web.json_response({"rates": {code: {"name": code.upper(), "unit": code, "value": value, "type": "fiat"}
+                                            for code, value in values.items()}})
@@ -0,0 +1,279 @@
+"""Offline load test: replays synthetic Telegram updates into the bot's webhook app.
+
+Starts fake Telegram Bot API and CoinGecko servers, imports main.py configured against them,
+serves create_app() on a local port and drives N virtual users through the full flow:
+/start -> inline queries while typing ("s", "so", "sol") -> coin search text -> addselcoin_ -> removeselcoin_/addselcoin_ -> "готово" -> setfreq_ -> get_prices.
+Webhook requests are handled in the foreground, so each request's latency is its handler's
+end-to-end latency (including Telegram/CoinGecko round trips and rate limiting).
+
+With --workers N the bot runs as `python main.py` with WEB_WORKERS=N (shared SQLite settings in a
+temporary directory) instead of in this process, to measure multi-worker scaling. Webhooks are then
+answered before they are handled, so the wall time runs until the fake Telegram API goes quiet and
+per-handler latencies only cover the webhook acknowledgement.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py --users 200 --concurrency 50
+    SEND_CHAT_RATE=1000 SEND_GLOBAL_RATE=100000 python benchmarks/load_test.py --users 500 --workers 4
+    python benchmarks/load_test.py --tg-latency 0.05 --cg-latency 0.2 --cg-429 0.1 --json bench_output.txt
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import itertools
+from collections import defaultdict
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+WORK_DIR = tempfile.mkdtemp(prefix="cryptoday-bench-")
+# Set before anything imports coin_snapshot, so a snapshot in the repository root is never used.
+os.environ["COIN_LIST_SNAPSHOT_PATH"] = os.path.join(WORK_DIR, "coin_list.json.gz")
+
+from fake_servers import FakeTelegram, FakeCoinGecko, start_site  # noqa: E402
+
+BENCH_TOKEN = "123456:BENCHMARK-TOKEN"
+WEBHOOK_MAX_RETRIES = 50
+MAIN_PATH = os.path.join(os.path.dirname(BENCH_DIR), "main.py")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class UpdateFactory:
+    """Builds Telegram Update payloads with unique update_ids."""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id}", "language_code": "uk"}
+
+    def message(self, user_id: int, text: str) -> dict:
+        return {"update_id": next(self._update_ids), "message": {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id), "text": text}}
+
+    def callback(self, user_id: int, data: str, message_id: int = 1) -> dict:
+        update_id = next(self._update_ids)
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": self._user(user_id), "chat_instance": str(user_id), "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"}, "text": "..."}}}
+
+    def inline_query(self, user_id: int, query: str) -> dict:
+        update_id = next(self._update_ids)
+        return {"update_id": update_id, "inline_query": {
+            "id": str(update_id), "from": self._user(user_id), "query": query, "offset": ""}}
+
+
+def user_script(factory: UpdateFactory, user_id: int, price_checks: int):
+    """(handler name, update) steps for one virtual user, in the order a real user would send them."""
+    yield "cmd_start", factory.message(user_id, "/start")
+    for query in ("s", "so", "sol"):
+        yield "inline_query", factory.inline_query(user_id, query)
+    yield "handle_message_input", factory.message(user_id, "btc")
+    yield "addselcoin", factory.callback(user_id, "addselcoin_bitcoin")
+    yield "handle_message_input", factory.message(user_id, "sol")
+    yield "addselcoin", factory.callback(user_id, "addselcoin_solana")
+    yield "removeselcoin", factory.callback(user_id, "removeselcoin_solana")
+    yield "addselcoin", factory.callback(user_id, "addselcoin_ethereum")
+    yield "handle_message_input", factory.message(user_id, "готово")
+    yield "setfreq", factory.callback(user_id, "setfreq_2h")
+    for _ in range(price_checks):
+        yield "get_prices", factory.callback(user_id, "get_prices")
+
+
+async def run_user(http, webhook_url, steps, think_time, results, errors):
+    for name, update in steps:
+        started = time.perf_counter()
+        for _ in range(WEBHOOK_MAX_RETRIES): # Like Telegram, redeliver updates the bot answered with 503 (queue full)
+            try:
+                async with http.post(webhook_url, json=update) as resp:
+                    await resp.read()
+                    ok = resp.status == 200
+                    if resp.status != 503:
+                        break
+            except aiohttp.ClientError:
+                ok = False
+                break
+            await asyncio.sleep(0.1)
+        results[name].append(time.perf_counter() - started)
+        if not ok:
+            errors[name] += 1
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def wait_for_coin_list(main_module, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while not main_module.coin_list_cache or main_module.coin_index is None:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Coin list was not loaded from the fake CoinGecko server in time.")
+        await asyncio.sleep(0.05)
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60, workers: int = 1) -> dict:
+    """Polls /readyz until the bot reports ready with a coin list; returns its last body.
+
+    Every poll uses a new connection, so with several workers it has to succeed `workers * 5` times
+    in a row (each connection may reach a different worker).
+    """
+    deadline, streak, body = time.monotonic() + timeout, 0, None
+    while streak < workers * 5:
+        try:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as http:
+                async with http.get(f"{base_url}/readyz") as resp:
+                    body = await resp.json()
+                    ok = resp.status == 200 and body["coin_list_size"] > 0
+        except aiohttp.ClientError: # Not listening yet
+            ok = False
+        streak = streak + 1 if ok else 0
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Bot did not become ready in time: {body}")
+        await asyncio.sleep(0.05 if ok else 0.2)
+    return body
+
+
+async def wait_until_drained(tg, quiet: float = 1.0) -> float:
+    """Waits until the fake Telegram API received no call for `quiet` seconds; returns when the last one came."""
+    last_total, last_change = None, time.perf_counter()
+    while time.perf_counter() - last_change < quiet:
+        total = sum(tg.calls.values())
+        if total != last_total:
+            last_total, last_change = total, time.perf_counter()
+        await asyncio.sleep(0.02)
+    return last_change
+
+
+def report(results, errors, wall_time, tg, cg, main_module) -> dict:
+    summary = {"wall_time_s": round(wall_time, 3), "handlers": {}}
+    total = sum(len(v) for v in results.values())
+    print(f"\n{total} updates in {wall_time:.2f}s -> {total / wall_time:.1f} updates/s\n")
+    print(f"{'handler':<22}{'count':>7}{'errors':>8}{'upd/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, latencies in results.items():
+        values = sorted(latencies)
+        row = {
+            "count": len(values), "errors": errors[name], "throughput": len(values) / wall_time,
+            "p50_ms": percentile(values, 50) * 1000, "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000, "max_ms": values[-1] * 1000,
+        }
+        summary["handlers"][name] = {k: round(v, 3) for k, v in row.items()}
+        print(f"{name:<22}{row['count']:>7}{row['errors']:>8}{row['throughput']:>9.1f}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    summary["telegram_calls"] = dict(tg.calls)
+    summary["telegram_429"] = dict(tg.rate_limited)
+    summary["coingecko_calls"] = dict(cg.calls)
+    summary["coingecko_429"] = dict(cg.rate_limited)
+    print(f"\nTelegram API calls: {dict(tg.calls)} (429s: {dict(tg.rate_limited)})")
+    print(f"CoinGecko calls:    {dict(cg.calls)} (429s: {dict(cg.rate_limited)}, ids requested: {cg.requested_ids})")
+    if main_module is not None: # Not available when the bot runs in worker processes
+        summary["send_queue"] = main_module.send_queue.stats()
+        print(f"Send queue:         {summary['send_queue']}")
+    return summary
+
+
+async def run(args):
+    tg = FakeTelegram(latency=args.tg_latency, rate_limit_ratio=args.tg_429)
+    cg = FakeCoinGecko(coins=args.coins, latency=args.cg_latency, rate_limit_ratio=args.cg_429)
+    tg_url, cg_url = await tg.start(), await cg.start()
+
+    bot_port = free_port()
+    os.environ.update({
+        "BOT_TOKEN": BENCH_TOKEN, "WEBHOOK_HOST": f"http://127.0.0.1:{bot_port}", "TELEGRAM_API_URL": tg_url,
+        "COINGECKO_BASE_URL": cg_url, "SETTINGS_BACKEND": "memory", "LOG_LEVEL": args.log_level.upper(),
+        "LOG_FORMAT": os.environ.get("LOG_FORMAT", "text"),
+    })
+    if args.workers:
+        main, runner = None, await asyncio.create_subprocess_exec(sys.executable, MAIN_PATH, env=dict(
+            os.environ, WEB_WORKERS=str(args.workers), PORT=str(bot_port), SETTINGS_BACKEND="sqlite",
+            SETTINGS_DB_PATH=os.path.join(WORK_DIR, "settings.db"),
+            LEADER_LOCK_PATH=os.path.join(WORK_DIR, "leader.lock")))
+    else:
+        import main  # Reads the environment above at import time
+        runner, _ = await start_site(main.create_app(handle_in_background=False), bot_port)
+    ready = await wait_until_ready(f"http://127.0.0.1:{bot_port}", workers=max(1, args.workers))
+    print(f"Bot ready, startup timings (s): {ready['startup_seconds']}")
+    if main is not None:
+        await wait_for_coin_list(main)
+    webhook_url = f"http://127.0.0.1:{bot_port}/webhook/{BENCH_TOKEN.split(':')[0]}"
+
+    factory = UpdateFactory()
+    results, errors = defaultdict(list), defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_user(user_id):
+        async with semaphore:
+            await run_user(http, webhook_url, user_script(factory, user_id, args.price_checks),
+                           args.think_time, results, errors)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(one_user(1000 + i) for i in range(args.users)))
+        finished = await wait_until_drained(tg) if args.workers else time.perf_counter()
+        wall_time = finished - started
+        if args.metrics:
+            async with http.get(f"http://127.0.0.1:{bot_port}/metrics") as resp:
+                with open(args.metrics, "w", encoding="utf-8") as f:
+                    f.write(await resp.text())
+
+    summary = report(results, errors, wall_time, tg, cg, main)
+    summary["config"] = vars(args)
+    if main is None:
+        runner.terminate()
+        await runner.wait()
+    else:
+        await runner.cleanup()
+    await tg.stop()
+    await cg.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"\nResults written to {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="virtual users, each runs the full flow once")
+    parser.add_argument("--concurrency", type=int, default=25, help="users active at the same time")
+    parser.add_argument("--price-checks", type=int, default=3, help="get_prices presses per user")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds a user waits between steps")
+    parser.add_argument("--coins", type=int, default=15000, help="size of the fake /coins/list")
+    parser.add_argument("--tg-latency", type=float, default=0.01, help="fake Telegram latency per call (s)")
+    parser.add_argument("--tg-429", type=float, default=0.0, help="fraction of Telegram sends answered with 429")
+    parser.add_argument("--cg-latency", type=float, default=0.05, help="fake CoinGecko latency per call (s)")
+    parser.add_argument("--cg-429", type=float, default=0.0, help="fraction of CoinGecko calls answered with 429")
+    parser.add_argument("--log-level", default="WARNING", help="bot log level during the run")
+    parser.add_argument("--json", help="also write the results as JSON to this path")
+    parser.add_argument("--metrics", help="save the bot's /metrics output after the run to this path")
+    parser.add_argument("--workers", type=int, default=0, help="run the bot as `main.py` with WEB_WORKERS=N (0: in this process)")
+    args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=args.log_level)
+    logging.getLogger().setLevel(args.log_level)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
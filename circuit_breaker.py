@@ -0,0 +1,94 @@
+"""Circuit breaker that stops calling an upstream while it is failing or rate limiting us."""
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpenError(Exception):
+    """The call was not attempted; `retry_after` is the number of seconds until the next probe is allowed."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open, next probe in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures (or at once on a rate limit).
+
+    While open every call is rejected with CircuitOpenError. Once the open period has passed, a
+    single probe call is let through (half-open): success closes the circuit, failure reopens it
+    with the open period doubled up to `max_recovery_time`. A server Retry-After hint overrides
+    the computed period.
+
+    Usage: `probe = breaker.before_call()`, then exactly one of `record_success(probe)`,
+    `record_failure(..., probe=probe)` or `release(probe)` (call abandoned, e.g. cancelled).
+    Only the probe's outcome moves the circuit out of half-open; calls that started while it was
+    closed and finish later cannot close it, reopen it or let a second probe through.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 30,
+                 max_recovery_time: float = 600):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.max_recovery_time = max_recovery_time
+        self.state = CLOSED
+        self.failures = 0 # Consecutive failures while closed
+        self.opened_count = 0 # Consecutive openings without a successful probe, drives the backoff
+        self.rejected = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        return max(0.0, self._open_until - time.monotonic())
+
+    def before_call(self) -> bool:
+        """Returns True if the call is the half-open probe; raises CircuitOpenError if it may not be made."""
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN and time.monotonic() >= self._open_until:
+            self.state = HALF_OPEN
+            logger.info(f"🟡 {self.name} circuit half-open, sending a probe request.")
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        raise CircuitOpenError(self.name, self.retry_in())
+
+    def record_success(self, probe: bool = False):
+        if probe:
+            self._probe_in_flight = False
+            logger.info(f"🟢 {self.name} circuit closed, upstream recovered.")
+            self.state = CLOSED
+            self.opened_count = 0
+        if self.state == CLOSED:
+            self.failures = 0
+
+    def record_failure(self, retry_after: float = None, rate_limited: bool = False, probe: bool = False):
+        if probe:
+            self._probe_in_flight = False
+            self._open(retry_after)
+            return
+        if self.state != CLOSED: # A call started while closed; it must not reopen a half-open circuit
+            if self.state == OPEN and retry_after is not None:
+                self._open_until = max(self._open_until, time.monotonic() + retry_after)
+            return
+        self.failures += 1
+        if rate_limited or self.failures >= self.failure_threshold:
+            self._open(retry_after)
+
+    def release(self, probe: bool = False):
+        if probe:
+            self._probe_in_flight = False
+
+    def _open(self, retry_after: float = None):
+        backoff = min(self.max_recovery_time, self.recovery_time * (2 ** self.opened_count))
+        period = max(1.0, retry_after) if retry_after is not None else backoff
+        self.opened_count += 1
+        self.failures = 0
+        self.state = OPEN
+        self._open_until = time.monotonic() + period
+        logger.warning(f"🔴 {self.name} circuit open for {period:.0f}s.")
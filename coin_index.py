@@ -0,0 +1,197 @@
+"""Compact coin catalogue and the index over it used for fast id lookup and search."""
+from array import array
+
+# Coins whose id contains any of these words are wrapped/pooled/derivative tokens
+# and are hidden from search results.
+DERIVATIVE_FILTERS = ('wrapped', 'amm', 'pool', 'bpt', 'tokenized', 'wormhole', 'peg', 'staked', 'leveraged')
+
+# Substrings up to this length are indexed directly; longer queries intersect n-gram postings.
+NGRAM_SIZE = 3
+
+
+class _StringColumn:
+    """Many short strings stored as one str plus an offsets array (no per-string object)."""
+    __slots__ = ("_blob", "_offsets")
+
+    def __init__(self, values):
+        offsets, position = array('I', [0]), 0
+        for value in values:
+            position += len(value)
+            offsets.append(position)
+        self._blob = "".join(values)
+        self._offsets = offsets
+
+    def __getitem__(self, handle: int) -> str:
+        return self._blob[self._offsets[handle]:self._offsets[handle + 1]]
+
+    def contains(self, handle: int, text: str) -> bool:
+        """`text in self[handle]` without slicing."""
+        return self._blob.find(text, self._offsets[handle], self._offsets[handle + 1]) != -1
+
+
+class CoinCatalogue:
+    """The coin list as columns; a coin is an integer handle (its position in /coins/list).
+
+    Ids stay real strings (they key the id -> handle map); symbols and names live in string
+    columns. Replaces the raw /coins/list payload (one dict per coin) after load, and `coin()`
+    builds a dict on demand for the few coins a handler actually displays.
+    """
+    __slots__ = ("ids", "symbols", "names", "_handle_by_id")
+
+    def __init__(self, rows):
+        ids, symbols, names = [], [], []
+        for coin_id, symbol, name in rows:
+            if not coin_id:
+                continue
+            ids.append(coin_id)
+            symbols.append(symbol or '')
+            names.append(name or '')
+        self.ids = ids
+        self.symbols = _StringColumn(symbols)
+        self.names = _StringColumn(names)
+        self._handle_by_id = {}
+        for handle, coin_id in enumerate(ids):
+            self._handle_by_id.setdefault(coin_id, handle)
+
+    @classmethod
+    def from_coins(cls, coins: list) -> "CoinCatalogue":
+        """Builds the catalogue from the raw /coins/list payload (list of dicts)."""
+        return cls((c.get('id'), c.get('symbol'), c.get('name')) for c in coins)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self):
+        """Yields [id, symbol, name] per coin (snapshot format)."""
+        return ([coin_id, self.symbols[h], self.names[h]] for h, coin_id in enumerate(self.ids))
+
+    def handle(self, coin_id: str):
+        return self._handle_by_id.get(coin_id)
+
+    def coin(self, handle: int) -> dict:
+        return {'id': self.ids[handle], 'symbol': self.symbols[handle], 'name': self.names[handle]}
+
+    def get(self, coin_id: str):
+        """Returns {'id', 'symbol', 'name'} for `coin_id`, or None."""
+        handle = self._handle_by_id.get(coin_id)
+        return self.coin(handle) if handle is not None else None
+
+
+def _grams(text: str, size: int) -> set:
+    """Every distinct substring of `text` with length 1..size."""
+    return {text[i:i + n] for n in range(1, size + 1) for i in range(len(text) - n + 1)}
+
+
+def _pack(postings: dict) -> dict:
+    """Single handles are stored as a bare int, longer postings as arrays."""
+    return {key: handles[0] if len(handles) == 1 else array('I', handles) for key, handles in postings.items()}
+
+
+def _unpack(value):
+    if value is None:
+        return ()
+    return (value,) if isinstance(value, int) else value
+
+
+class CoinIndex:
+    """Immutable search structures built once per catalogue.
+
+    Search keeps the original ranking: exact symbol match first, then exact id match,
+    then name substring match, ties broken by position in the coin list.
+    Postings hold catalogue handles in catalogue order.
+    """
+
+    def __init__(self, catalogue: CoinCatalogue):
+        self.catalogue = catalogue
+        self._searchable = bytearray(len(catalogue)) # 1 for coins that pass the derivative filter
+        by_symbol, extra_ids, grams, lower_names = {}, {}, {}, []
+
+        for handle, coin_id in enumerate(catalogue.ids):
+            coin_id_lower = coin_id.lower()
+            coin_symbol_lower = catalogue.symbols[handle].lower()
+            name = catalogue.names[handle]
+            if not coin_id_lower or not coin_symbol_lower or not name or \
+                    any(f_word in coin_id_lower for f_word in DERIVATIVE_FILTERS):
+                lower_names.append('')
+                continue
+
+            self._searchable[handle] = 1
+            coin_name_lower = name.lower()
+            lower_names.append(coin_name_lower)
+            by_symbol.setdefault(coin_symbol_lower, []).append(handle)
+            if coin_id_lower != coin_id or catalogue.handle(coin_id) != handle: # Not reachable via the id map
+                extra_ids.setdefault(coin_id_lower, []).append(handle)
+            for gram in _grams(coin_name_lower, NGRAM_SIZE):
+                posting = grams.get(gram)
+                if posting is None:
+                    grams[gram] = [handle]
+                else:
+                    posting.append(handle)
+
+        self._names = _StringColumn(lower_names)
+        self._by_symbol = _pack(by_symbol)
+        self._extra_ids = _pack(extra_ids)
+        self._grams = _pack(grams)
+
+    def __len__(self):
+        return len(self.catalogue)
+
+    def get(self, coin_id: str):
+        """Returns the coin dict for `coin_id`, or None."""
+        return self.catalogue.get(coin_id)
+
+    def _name_matches(self, query: str):
+        """Yields handles whose name contains `query`, in coin list order."""
+        if len(query) <= NGRAM_SIZE:
+            yield from _unpack(self._grams.get(query))
+            return
+        postings = []
+        for start in range(len(query) - NGRAM_SIZE + 1):
+            posting = self._grams.get(query[start:start + NGRAM_SIZE])
+            if posting is None:
+                return
+            postings.append(_unpack(posting))
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return
+        for handle in sorted(candidates):
+            if self._names.contains(handle, query):
+                yield handle
+
+    def search_handles(self, query: str, limit: int = None) -> list:
+        """Like search(), but returns catalogue handles."""
+        if not query:
+            return []
+        cat = self.catalogue
+        exact = set(_unpack(self._by_symbol.get(query)))
+        exact.update(_unpack(self._extra_ids.get(query)))
+        id_handle = cat.handle(query)
+        if id_handle is not None and self._searchable[id_handle]:
+            exact.add(id_handle)
+        ranked = sorted(exact, key=lambda h: (query != cat.symbols[h].lower(),
+                                              query != cat.ids[h].lower(),
+                                              not self._names.contains(h, query), h))
+        if limit is not None and len(ranked) >= limit:
+            return ranked[:limit]
+        for handle in self._name_matches(query):
+            if handle in exact:
+                continue
+            ranked.append(handle)
+            if limit is not None and len(ranked) >= limit:
+                break
+        return ranked
+
+    def search(self, query: str, limit: int = None) -> list:
+        """Returns searchable coins matching `query` (already lower-cased and stripped), best first."""
+        return [self.catalogue.coin(h) for h in self.search_handles(query, limit)]
+
+    def display_name(self, coin_id: str, with_symbol: bool = False) -> str:
+        """Human readable coin name, falling back to the capitalized id."""
+        handle = self.catalogue.handle(coin_id)
+        if handle is None:
+            return coin_id.capitalize()
+        name = self.catalogue.names[handle] or coin_id.capitalize()
+        return f"{name} ({(self.catalogue.symbols[handle] or 'N/A').upper()})" if with_symbol else name
@@ -0,0 +1,43 @@
+"""On-disk snapshot of the last good CoinGecko coin list."""
+import os
+import gzip
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+COIN_LIST_SNAPSHOT_PATH = os.getenv("COIN_LIST_SNAPSHOT_PATH", "coin_list.json.gz")
+COIN_LIST_REFRESH_INTERVAL = float(os.getenv("COIN_LIST_REFRESH_INTERVAL", 6 * 3600)) # Seconds between background refreshes
+COIN_LIST_RETRY_INTERVAL = 60 # Seconds before retrying when no coin list is available at all
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(rows, etag: str = None, last_modified: str = None, path: str = COIN_LIST_SNAPSHOT_PATH):
+    """Writes [id, symbol, name] rows (CoinCatalogue.rows()) gzipped, replacing the old file atomically."""
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "etag": etag,
+        "last_modified": last_modified,
+        "coins": list(rows),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp" # Per process, in case two workers save at once
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str = COIN_LIST_SNAPSHOT_PATH):
+    """Returns {"coins": [[id, symbol, name], ...], "etag", "last_modified", "saved_at"} or None if missing/unreadable."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Ignoring unreadable coin list snapshot {path}: {e}")
+        return None
+    if payload.get("version") != SNAPSHOT_VERSION or not payload.get("coins"):
+        return None
+    return payload
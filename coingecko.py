@@ -0,0 +1,159 @@
+"""Shared CoinGecko HTTP client with a pooled, keep-alive connection."""
+import os
+import time
+import asyncio
+import logging
+
+import aiohttp
+
+from metrics import COINGECKO_LATENCY, COINGECKO_RESPONSES
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_BASE_URL = os.getenv("COINGECKO_BASE_URL", "https://api.coingecko.com/api/v3").rstrip("/")
+COINGECKO_POOL_SIZE = int(os.getenv("COINGECKO_POOL_SIZE", 20))
+COINGECKO_TIMEOUT = float(os.getenv("COINGECKO_TIMEOUT", 10))
+COINGECKO_COIN_LIST_TIMEOUT = float(os.getenv("COINGECKO_COIN_LIST_TIMEOUT", 15))
+COINGECKO_BREAKER_THRESHOLD = int(os.getenv("COINGECKO_BREAKER_THRESHOLD", 5)) # Consecutive failures that open the circuit
+COINGECKO_BREAKER_RECOVERY = float(os.getenv("COINGECKO_BREAKER_RECOVERY", 30)) # First open period (s), doubled per failed probe
+COINGECKO_BREAKER_MAX_RECOVERY = float(os.getenv("COINGECKO_BREAKER_MAX_RECOVERY", 600))
+
+
+class CoinGeckoError(Exception):
+    """Non-200 response from CoinGecko."""
+
+    def __init__(self, status: int, body: str = ""):
+        super().__init__(f"CoinGecko API error {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+
+class RateLimitError(CoinGeckoError):
+    """429 response; `retry_after` is the server hint in seconds, if any."""
+
+    def __init__(self, body: str = "", retry_after: float = None):
+        super().__init__(429, body)
+        self.retry_after = retry_after
+
+
+class CoinGeckoClient:
+    """One long-lived aiohttp session for all CoinGecko calls.
+
+    Every call goes through one circuit breaker (CoinGecko rate limits per client, not per
+    endpoint): while it is open, request() raises CircuitOpenError without touching the network.
+    Call `start()` from the running event loop (bot startup) and `close()` on shutdown.
+    """
+
+    def __init__(self, base_url: str = COINGECKO_BASE_URL, pool_size: int = COINGECKO_POOL_SIZE,
+                 timeout: float = COINGECKO_TIMEOUT, dns_ttl: int = 300, keepalive: float = 30):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.breaker = CircuitBreaker("CoinGecko", COINGECKO_BREAKER_THRESHOLD, COINGECKO_BREAKER_RECOVERY,
+                                      COINGECKO_BREAKER_MAX_RECOVERY)
+        self._session = None
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.pool_size,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"Accept": "application/json"},
+        )
+        logger.info(f"CoinGecko client started (base URL: {self.base_url}, pool size: {self.pool_size}).")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(self, path: str, params: dict = None, headers: dict = None, timeout: float = None):
+        """GETs `path` under the base URL; returns (status, decoded JSON or None for 304, response headers).
+
+        Raises CircuitOpenError while the breaker is open, RateLimitError on 429, CoinGeckoError
+        on any other status except 200/304, and lets aiohttp.ClientError / asyncio.TimeoutError propagate.
+        """
+        probe = self.breaker.before_call()
+        try:
+            result = await self._request(path, params, headers, timeout)
+        except RateLimitError as e:
+            self.breaker.record_failure(e.retry_after, rate_limited=True, probe=probe)
+            raise
+        except CoinGeckoError as e:
+            if e.status >= 500:
+                self.breaker.record_failure(probe=probe)
+            else:
+                self.breaker.record_success(probe) # 4xx: CoinGecko is up, the request itself was wrong
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.breaker.record_failure(probe=probe)
+            raise
+        except BaseException:
+            self.breaker.release(probe)
+            raise
+        self.breaker.record_success(probe)
+        return result
+
+    async def _request(self, path: str, params: dict = None, headers: dict = None, timeout: float = None):
+        if self._session is None or self._session.closed:
+            await self.start()
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        started, status = time.perf_counter(), "error"
+        try:
+            async with self._session.get(f"{self.base_url}{path}", params=params, headers=headers, timeout=request_timeout) as resp:
+                status = resp.status
+                if resp.status == 200:
+                    return resp.status, await resp.json(content_type=None), resp.headers
+                if resp.status == 304:
+                    return resp.status, None, resp.headers
+                body = await resp.text()
+                if resp.status == 429:
+                    raise RateLimitError(body, _parse_retry_after(resp.headers.get("Retry-After")))
+                raise CoinGeckoError(resp.status, body)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            raise
+        finally:
+            COINGECKO_LATENCY.observe(time.perf_counter() - started, path)
+            COINGECKO_RESPONSES.inc(path, status)
+
+    async def get_json(self, path: str, params: dict = None, timeout: float = None):
+        """GETs `path` under the base URL and returns the decoded JSON body (see request())."""
+        _, data, _ = await self.request(path, params=params, timeout=timeout)
+        return data
+
+    async def get_coin_list(self) -> list:
+        return await self.get_json("/coins/list", timeout=COINGECKO_COIN_LIST_TIMEOUT)
+
+    async def get_coin_list_if_changed(self, etag: str = None, last_modified: str = None):
+        """Conditional /coins/list; returns (coins or None if unchanged, etag, last_modified)."""
+        headers = {}
+        if etag: headers["If-None-Match"] = etag
+        if last_modified: headers["If-Modified-Since"] = last_modified
+        _, data, resp_headers = await self.request("/coins/list", headers=headers, timeout=COINGECKO_COIN_LIST_TIMEOUT)
+        return data, resp_headers.get("ETag", etag), resp_headers.get("Last-Modified", last_modified)
+
+    async def get_simple_price(self, coin_ids, vs_currencies=("usd",)) -> dict:
+        params = {"ids": ",".join(coin_ids), "vs_currencies": ",".join(vs_currencies)}
+        return await self.get_json("/simple/price", params=params)
+
+    async def get_exchange_rates(self) -> dict:
+        """BTC-to-currency rates ({"rates": {"usd": {"value": ...}, ...}})."""
+        return await self.get_json("/exchange_rates")
+
+
+def _parse_retry_after(value):
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
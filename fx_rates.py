@@ -0,0 +1,83 @@
+"""Exchange rates so prices fetched once in USD can be shown in each user's display currency."""
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = "usd" # The only currency asked from /simple/price
+FX_REFRESH_INTERVAL = float(os.getenv("FX_REFRESH_INTERVAL", 600)) # Seconds between /exchange_rates refreshes
+FX_RETRY_INTERVAL = 60 # Seconds before retrying a failed refresh
+
+# Display currencies offered to users: code -> (button label, amount format)
+CURRENCIES = {
+    "usd": ("🇺🇸 USD", "${:,.2f}"),
+    "eur": ("🇪🇺 EUR", "€{:,.2f}"),
+    "uah": ("🇺🇦 UAH", "{:,.2f} ₴"),
+    "gbp": ("🇬🇧 GBP", "£{:,.2f}"),
+    "pln": ("🇵🇱 PLN", "{:,.2f} zł"),
+}
+
+
+def format_amount(amount: float, currency: str) -> str:
+    return CURRENCIES.get(currency, CURRENCIES[BASE_CURRENCY])[1].format(amount)
+
+
+class FxRates:
+    """Multipliers from the base currency to every display currency, from one /exchange_rates call.
+
+    `fetcher()` must return the CoinGecko /exchange_rates payload ({"rates": {code: {"value": ...}}},
+    values relative to BTC). The table is refreshed in the background and the last good one is kept
+    when a refresh fails; until the first table arrives only the base currency can be shown.
+    """
+
+    def __init__(self, fetcher, base: str = BASE_CURRENCY, refresh_interval: float = FX_REFRESH_INTERVAL):
+        self.fetcher = fetcher
+        self.base = base
+        self.refresh_interval = refresh_interval
+        self._rates = {base: 1.0}
+        self.updated_at = None # Wall clock of the last successful refresh
+        self.failures = 0
+
+    def rate(self, currency: str):
+        """Units of `currency` per unit of the base currency, or None if unknown."""
+        return self._rates.get(currency)
+
+    def convert(self, amount: float, currency: str):
+        rate = self._rates.get(currency)
+        return amount * rate if rate is not None else None
+
+    def format(self, amount: float, currency: str) -> str:
+        """`amount` (in the base currency) shown in `currency`, or in the base currency if there is no rate."""
+        converted = self.convert(amount, currency)
+        if converted is None:
+            return format_amount(amount, self.base)
+        return format_amount(converted, currency)
+
+    async def refresh(self) -> bool:
+        try:
+            data = await self.fetcher()
+            rates = data["rates"]
+            base_value = float(rates[self.base]["value"])
+            table = {code: float(info["value"]) / base_value for code, info in rates.items()
+                     if isinstance(info, dict) and isinstance(info.get("value"), (int, float))}
+        except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+            self.failures += 1
+            logger.error(f"❌ Unexpected /exchange_rates payload: {e!r}")
+            return False
+        except Exception as e: # CoinGeckoError, CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError
+            self.failures += 1
+            logger.warning(f"⚠️ Exchange rates refresh failed, keeping the last table: {e!r}")
+            return False
+        table[self.base] = 1.0
+        self._rates = table
+        self.updated_at = time.time()
+        logger.info(f"Exchange rates updated: {len(table)} currencies.")
+        return True
+
+    async def run(self):
+        """Refreshes forever; the first refresh happens immediately."""
+        while True:
+            ok = await self.refresh()
+            await asyncio.sleep(self.refresh_interval if ok else FX_RETRY_INTERVAL)
@@ -0,0 +1,80 @@
+"""Inline-mode coin suggestions (`@bot sol`) from an LRU of ranked results, rebuilt when the coin list changes."""
+import os
+from collections import OrderedDict
+
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+
+INLINE_RESULTS_LIMIT = 20 # Suggestions per answer (Telegram allows up to 50)
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", 5000)) # Queries whose ranked results are kept
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300)) # Seconds Telegram may reuse an answer for the same query
+INLINE_QUERY_MAX_LENGTH = 64
+WARM_QUERIES = "abcdefghijklmnopqrstuvwxyz0123456789" # Always ranked ahead of time; the first keystroke is the most common query
+
+
+def normalize_query(query: str) -> str:
+    return query.lower().strip()[:INLINE_QUERY_MAX_LENGTH]
+
+
+class InlineSuggestions:
+    """Ranked catalogue handles per normalized query, for one CoinIndex at a time.
+
+    Only handles are cached (a few bytes per result); the answer objects are built per query,
+    which is cheap next to ranking. `prepare()` does not touch the live cache, so a new coin list
+    can be ranked in a worker thread and swapped in with `install()` on the event loop.
+    """
+
+    def __init__(self, max_size: int = INLINE_CACHE_SIZE, limit: int = INLINE_RESULTS_LIMIT):
+        self.max_size = max_size
+        self.limit = limit
+        self._index = None
+        self._ranked = OrderedDict() # query -> tuple of handles, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._ranked)
+
+    def hot_queries(self) -> list:
+        """Queries to rank for the next coin list: the warm set, then cached ones, most recent first."""
+        queries = dict.fromkeys(WARM_QUERIES)
+        queries.update(dict.fromkeys(reversed(self._ranked)))
+        return list(queries)[:self.max_size]
+
+    def prepare(self, index, queries) -> OrderedDict:
+        ranked = OrderedDict()
+        for query in reversed(queries): # Least recently used first, as in the live cache
+            ranked[query] = tuple(index.search_handles(query, self.limit))
+        return ranked
+
+    def install(self, index, ranked: OrderedDict):
+        self._index, self._ranked = index, ranked
+
+    def rebuild(self, index):
+        self.install(index, self.prepare(index, self.hot_queries()))
+
+    def handles(self, query: str) -> tuple:
+        query = normalize_query(query)
+        if not query or self._index is None:
+            return ()
+        ranked = self._ranked.get(query)
+        if ranked is not None:
+            self.hits += 1
+            self._ranked.move_to_end(query)
+            return ranked
+        self.misses += 1
+        ranked = self._ranked[query] = tuple(self._index.search_handles(query, self.limit))
+        if len(self._ranked) > self.max_size:
+            self._ranked.popitem(last=False)
+        return ranked
+
+    def answer(self, query: str) -> list:
+        """InlineQueryResultArticle per suggestion; choosing one sends the coin id as a message."""
+        if self._index is None:
+            return []
+        catalogue, results = self._index.catalogue, []
+        for handle in self.handles(query):
+            coin_id, symbol = catalogue.ids[handle], catalogue.symbols[handle].upper()
+            results.append(InlineQueryResultArticle(
+                id=str(handle), title=f"{catalogue.names[handle]} ({symbol})", description=coin_id,
+                input_message_content=InputTextMessageContent(message_text=coin_id)))
+        return results
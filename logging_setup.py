@@ -0,0 +1,109 @@
+"""Logging off the event loop: records go through a queue to a listener thread that formats and writes them.
+
+Per-update detail is logged at DEBUG and kept only for a sampled fraction of updates
+(LOG_SAMPLE_RATE), decided once per update so a sampled update keeps all of its lines.
+Use %-style arguments (`logger.debug("x %s", value)`) so nothing is formatted for dropped records;
+arguments are formatted later on the listener thread, so pass values that won't be mutated.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+from aiogram import BaseMiddleware
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json") # "json" (one object per line) or "text"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01)) # Fraction of updates whose DEBUG lines are kept
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# {"update_id": ..., "user_id": ..., "sampled": bool} for the update being handled, set by UpdateLogContextMiddleware.
+update_log_context = contextvars.ContextVar("update_log_context", default=None)
+
+# LogRecord attributes that are not "extra" fields.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including `extra=` fields and the update context."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _UpdateContextFilter(logging.Filter):
+    """Runs in the calling thread: drops unsampled DEBUG records and attaches update_id/user_id."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = update_log_context.get()
+        if context is None:
+            return True
+        if record.levelno <= logging.DEBUG and not context["sampled"]:
+            return False
+        record.update_id = context["update_id"]
+        record.user_id = context["user_id"]
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread (the stock one formats in prepare())."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> QueueListener:
+    """Replaces the root handlers with a queue handler; returns the started listener (stopped at exit)."""
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(_UpdateContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop) # Flushes records still in the queue
+    return listener
+
+
+class UpdateLogContextMiddleware(BaseMiddleware):
+    """Outer update middleware: makes the sampling decision and sets the log context for one update."""
+
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        token = update_log_context.set({
+            "update_id": event.update_id,
+            "user_id": user.id if user else None,
+            "sampled": random.random() < self.sample_rate,
+        })
+        try:
+            return await handler(event, data)
+        finally:
+            update_log_context.reset(token)
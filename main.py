@@ -1,20 +1,47 @@
 import os
+import re
 import json
+import time
 import asyncio
 import logging
+import functools
+from collections import Counter
 from aiohttp import web
 from datetime import datetime, timedelta
 import aiohttp
 
 from aiogram import Bot, Dispatcher, Router, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.storage.memory import MemoryStorage
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+from coin_index import CoinCatalogue, CoinIndex
+from coingecko import CoinGeckoClient, CoinGeckoError, RateLimitError
+from circuit_breaker import CircuitOpenError
+from coin_snapshot import load_snapshot, save_snapshot, COIN_LIST_SNAPSHOT_PATH, COIN_LIST_REFRESH_INTERVAL, COIN_LIST_RETRY_INTERVAL
+from price_cache import PriceCache
+from price_batcher import PriceBatcher
+from price_history import PriceHistory
+from alerts import Alert, AlertBook
+from fx_rates import FxRates, CURRENCIES, BASE_CURRENCY, FX_RETRY_INTERVAL
+from inline_search import InlineSuggestions, INLINE_CACHE_TIME
+from scheduler import AutoUpdateScheduler
+from settings_store import create_settings_store, SettingsScopeMiddleware, SqliteFsmStorage
+from send_queue import SendQueue, RateLimitMiddleware, send_priority, PRIORITY_BULK, SEND_GLOBAL_RATE
+from update_queue import UpdateScheduler, OrderedRequestHandler
+from metrics import REGISTRY, CallbackMetric, HandlerMetricsMiddleware, handle_metrics
+from logging_setup import setup_logging, UpdateLogContextMiddleware
+from render_cache import MessageFingerprints
+from workers import WEB_WORKERS, LEADER_POLL_INTERVAL, LeaderLock, run_workers
+
+STARTED_AT = time.monotonic() # Startup timings are measured from here
+
+# Configure logging (LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE); records are written by a listener thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # --- Environment Variables & Configuration ---
@@ -32,38 +59,79 @@ if not WEBHOOK_HOST.startswith(("http://", "https://")):
 WEBHOOK_PATH = f"/webhook/{TOKEN.split(':')[0]}"
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
 PORT = int(os.environ.get("PORT", 8080)) # Render.com sets PORT env var
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL") # Optional Bot API base URL (local Bot API server, or a fake one in benchmarks)
 
 logger.info(f"🚀 Starting on port {PORT}")
 logger.info(f"Webhook URL configured: {WEBHOOK_URL}")
 
 # --- Bot Initialization ---
-bot = Bot(TOKEN, parse_mode=ParseMode.HTML)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+# bot, send_queue, dp and settings_store are built by init_worker() in the process that serves the
+# webhook, so a run_workers() parent opens no sessions or SQLite connections.
+bot = None
+send_queue = None # Global/per-chat Telegram rate limits (global one split between workers); interactive replies go before bulk sends
+dp = None
 router = Router()
-dp.include_router(router)
+update_scheduler = UpdateScheduler(paused=True) # Webhook updates: parallel across users, in order per user, duplicates dropped; held until ready
+coingecko = CoinGeckoClient() # Session is opened in on_startup and closed in on_shutdown
+price_batcher = PriceBatcher(coingecko.get_simple_price) # Merges concurrent cache misses into one /simple/price call
+price_history = PriceHistory() # 24h of points per coin, recorded from every successful price fetch
+alert_book = AlertBook() # Price-threshold alerts by coin, rebuilt from user settings by the leader
+price_cache = PriceCache(price_batcher.fetch) # TTL from PRICE_CACHE_TTL, concurrent misses share one request
+fx_rates = FxRates(coingecko.get_exchange_rates) # USD -> display currency table, refreshed every FX_REFRESH_INTERVAL
 
 # --- Global Variables & Caches ---
-user_settings = {} # Stores {"coins": [], "frequency": None, "current_step": "INIT"}
-coin_list_cache = None
+# Last rendered text/keyboard per message, to skip no-op edits. Off with several workers: another
+# worker may have edited the message since, so a remembered render proves nothing.
+message_renders = MessageFingerprints() if WEB_WORKERS == 1 else MessageFingerprints(max_size=0)
+inline_suggestions = InlineSuggestions() # Ranked inline-mode answers per query, rebuilt with every coin list
+settings_store = None # SETTINGS_BACKEND: "sqlite" (default, survives restarts) or "memory"
+coin_list_cache = None # CoinCatalogue of the last good coin list (compact, no raw JSON dicts kept)
+coin_index = None # CoinIndex built over coin_list_cache on every successful load
+coin_list_etag = None # Validators of the loaded list, sent as If-None-Match / If-Modified-Since on refresh
+coin_list_last_modified = None
+coin_list_updated_at = None # When the loaded list was last confirmed current (fetch, 304 or snapshot time)
+coin_list_refresh_task = None
+coin_list_refresher = None
+coin_list_snapshot_mtime = None # Snapshot file version a follower worker last loaded
+alert_checker = None
+leader_lock = LeaderLock() if WEB_WORKERS > 1 else None
+is_leader = WEB_WORKERS == 1 # The leader downloads the coin list and runs auto-updates and alerts
+leader_watch = None
+settings_sync = None
+WORKER_SYNC_INTERVAL = float(os.getenv("WORKER_SYNC_INTERVAL", 10)) # Seconds between the leader's reads of settings changed by other workers
+WORKER_SYNC_OVERLAP = 5 # Seconds re-read on every sync, for rows committed after a later one was seen
+fx_refresher = None
+startup_pipeline = None
+startup_timings = {} # phase -> seconds since STARTED_AT
+webhook_registered = False
+bot_ready = False # Set once the startup pipeline finished (or timed out); gates /readyz and update processing
+STARTUP_WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", 30)) # Seconds to wait for warm-up before serving anyway
+STARTUP_PREFETCH_COINS = 250 # Most selected coins whose prices are fetched before serving
+alert_deliveries = set() # Running deliver_alerts tasks (kept referenced until done)
+ALERTS_PER_USER = 10
+ALERT_CHECK_INTERVAL = float(os.getenv("ALERT_CHECK_INTERVAL", 60)) # Seconds between price checks for coins that have alerts
 COIN_LIST_LOAD_ATTEMPTED = False # Flag to ensure we don't get stuck in loops if API is down
 
 # --- Helper Functions ---
 def get_user_data(user_id):
     """Helper to get user data, initializing if not present."""
-    return user_settings.setdefault(user_id, {"coins": [], "frequency": None, "current_step": "INIT"})
+    return settings_store.setdefault(user_id, {"coins": [], "frequency": None, "current_step": "INIT"})
+
+def save_user_data(user_id, user_data):
+    """Queues the user's settings for the next write-behind flush. Call after mutating them."""
+    settings_store.mark_dirty(user_id, user_data)
 
 async def ensure_coin_list_loaded(message_or_callback: types.Union[types.Message, types.CallbackQuery]):
     """Checks if coin list is loaded and valid, sends message if not."""
     # Check if the list is not populated or not a list type, or explicitly empty
-    if not coin_list_cache or not isinstance(coin_list_cache, list) or not coin_list_cache: # Added check for empty list
+    if not coin_list_cache or not isinstance(coin_list_cache, CoinCatalogue): # Missing or empty catalogue
         text = "⚠️ Список монет наразі недоступний. "
         if COIN_LIST_LOAD_ATTEMPTED: # If an attempt was made (e.g. during startup or /start) and it's still not available
             text += "Можливо, є проблеми з API CoinGecko або перевищено ліміт запитів. Спробуйте команду /start трохи пізніше, щоб оновити."
         else: # This case should be rare if /start always attempts a load.
             text += "Завантаження списку ще не відбулося. Спробуйте команду /start."
         
-        logger.warning(f"ensure_coin_list_loaded: Coin list is not available. Cache is list: {isinstance(coin_list_cache, list)}, Cache empty: {not coin_list_cache if isinstance(coin_list_cache, list) else 'N/A'}. Load attempted: {COIN_LIST_LOAD_ATTEMPTED}")
+        logger.warning(f"ensure_coin_list_loaded: Coin list is not available. Cache is catalogue: {isinstance(coin_list_cache, CoinCatalogue)}, Cache empty: {not coin_list_cache if isinstance(coin_list_cache, CoinCatalogue) else 'N/A'}. Load attempted: {COIN_LIST_LOAD_ATTEMPTED}")
 
         try:
             target_chat_id = message_or_callback.from_user.id
@@ -79,6 +147,57 @@ async def ensure_coin_list_loaded(message_or_callback: types.Union[types.Message
     return True
 
 
+def format_price_age(fetched_at: float) -> str:
+    """Short Ukrainian description of how long ago a price was fetched."""
+    age = max(0, int(datetime.now().timestamp() - fetched_at))
+    if age < 5: return "щойно"
+    if age < 60: return f"{age} с тому"
+    return f"{age // 60} хв тому"
+
+
+def format_price_movement(coin_id: str, currency: str = BASE_CURRENCY) -> str:
+    """1h/24h change, 24h range and sparkline from the in-process history ("" until there are two points)."""
+    summary = price_history.summary(coin_id, time.time())
+    parts = []
+    if summary.change_1h is not None: parts.append(f"1г: {summary.change_1h:+.2f}%")
+    if summary.change_24h is not None: parts.append(f"24г: {summary.change_24h:+.2f}%")
+    if summary.sparkline: parts.append(summary.sparkline)
+    if not parts: return ""
+    line = "   📊 " + " · ".join(parts)
+    if summary.low_24h is not None and summary.high_24h is not None and summary.low_24h != summary.high_24h:
+        line += f"\n   ↕️ 24г: {fx_rates.format(summary.low_24h, currency)} – {fx_rates.format(summary.high_24h, currency)}"
+    return line
+
+
+def build_price_lines(coin_ids: list, price_entries: dict, currency: str = BASE_CURRENCY) -> list:
+    """One line per coin with its price converted from USD to `currency`, plus a freshness footer."""
+    lines = []
+    for coin_id in coin_ids:
+        entry = price_entries.get(coin_id)
+        price_data = entry.prices if entry else None
+        coin_name_display, sym_display = coin_id.capitalize(),""
+        if coin_list_cache and coin_index: 
+            info = coin_index.get(coin_id)
+            if info: coin_name_display, sym_display = info.get('name',coin_id.capitalize()), f" ({info.get('symbol','').upper()})"
+        
+        if price_data and BASE_CURRENCY in price_data:
+            lines.append(f"<b>{coin_name_display}</b>{sym_display}: {fx_rates.format(price_data[BASE_CURRENCY], currency)}")
+            movement = format_price_movement(coin_id, currency)
+            if movement: lines.append(movement)
+        else: lines.append(f"<b>{coin_name_display}</b>{sym_display}: ❌ Помилка даних")
+    fetched_times = [e.fetched_at for e in price_entries.values() if e]
+    if fetched_times: lines.append(f"\n🕒 <i>Оновлено {format_price_age(min(fetched_times))}</i>")
+    if any(e.stale for e in price_entries.values() if e):
+        lines.append("⚠️ <i>CoinGecko тимчасово недоступний, показано останні відомі ціни.</i>")
+    if fx_rates.rate(currency) is None:
+        lines.append(f"⚠️ <i>Курс {currency.upper()} ще недоступний, ціни показано в USD.</i>")
+    return lines
+
+def shown_currency(currency: str) -> str:
+    """Currency prices actually appear in: USD until a rate for `currency` is known."""
+    return currency if fx_rates.rate(currency) is not None else BASE_CURRENCY
+
+
 def create_mock_message_from_callback(callback: types.CallbackQuery) -> types.Message:
     """Creates a mock Message object from a CallbackQuery for handler reuse."""
     return types.Message(
@@ -89,38 +208,82 @@ def create_mock_message_from_callback(callback: types.CallbackQuery) -> types.Me
     )
 
 # --- CoinGecko API Interaction ---
+def build_coin_list(data: list, inline_queries=(), rows: bool = False):
+    """Raw /coins/list payload (or snapshot rows) -> (CoinCatalogue, CoinIndex, ranked inline suggestions
+    for `inline_queries`). The raw dicts can be dropped afterwards."""
+    catalogue = CoinCatalogue(data) if rows else CoinCatalogue.from_coins(data)
+    index = CoinIndex(catalogue)
+    return catalogue, index, inline_suggestions.prepare(index, inline_queries)
+
+async def set_coin_list(data, updated_at=None, rows: bool = False):
+    """Builds catalogue, index and inline suggestions off the event loop, then swaps them in together."""
+    global coin_list_cache, coin_index, coin_list_updated_at
+    catalogue, new_index, ranked = await asyncio.to_thread(build_coin_list, data, inline_suggestions.hot_queries(), rows)
+    coin_list_cache, coin_index = catalogue, new_index
+    inline_suggestions.install(new_index, ranked)
+    coin_list_updated_at = updated_at or time.time()
+    clear_render_cache() # Coin names may have changed
+
+def load_coin_list_snapshot():
+    """Loads the last good coin list from disk at startup; returns True if one was found."""
+    global coin_list_cache, coin_index, coin_list_etag, coin_list_last_modified, coin_list_updated_at, coin_list_snapshot_mtime
+    started = time.perf_counter()
+    snapshot = load_snapshot()
+    if not snapshot:
+        logger.info("No coin list snapshot on disk, waiting for the first download.")
+        return False
+    coin_list_cache = CoinCatalogue(snapshot["coins"])
+    coin_index = CoinIndex(coin_list_cache)
+    coin_list_snapshot_mtime = os.path.getmtime(COIN_LIST_SNAPSHOT_PATH)
+    inline_suggestions.rebuild(coin_index)
+    clear_render_cache()
+    coin_list_etag, coin_list_last_modified = snapshot.get("etag"), snapshot.get("last_modified")
+    coin_list_updated_at = snapshot.get("saved_at")
+    logger.info(f"✅ Coin list snapshot loaded in {(time.perf_counter() - started) * 1000:.0f} ms. Total: {len(coin_list_cache)} coins.")
+    return True
+
 async def load_coin_list():
-    global coin_list_cache, COIN_LIST_LOAD_ATTEMPTED
+    global coin_list_cache, coin_list_etag, coin_list_last_modified, coin_list_updated_at, COIN_LIST_LOAD_ATTEMPTED
     COIN_LIST_LOAD_ATTEMPTED = True 
     max_retries = 3
     base_delay = 10 
 
     for attempt in range(max_retries):
+        retry_after = None # Server/breaker hint; never retry sooner than this
         try:
             logger.info(f"Attempting to load coin list (Attempt {attempt + 1}/{max_retries})...")
-            async with aiohttp.ClientSession() as session:
-                url = "https://api.coingecko.com/api/v3/coins/list"
-                async with session.get(url, timeout=15) as resp: 
-                    if resp.status == 200:
-                        data = await resp.json()
-                        if isinstance(data, list) and data: # Ensure data is a non-empty list
-                            coin_list_cache = data
-                            logger.info(f"✅ Coin list loaded successfully. Total: {len(coin_list_cache)} coins.")
-                            return True 
-                        else:
-                            logger.error(f"⚠️ Coin list loaded but is not a valid list or is empty. Type: {type(data)}. Data: {str(data)[:200]}")
-                            coin_list_cache = [] 
-                    elif resp.status == 429:
-                        logger.warning(f"⚠️ Rate limit exceeded (429) on attempt {attempt + 1}. Waiting to retry...")
-                    else:
-                        logger.error(f"⚠️ Failed to load coin list. Status: {resp.status}, Response: {await resp.text()}")
-                        coin_list_cache = []
-                        if attempt < max_retries -1 and resp.status not in [401, 403, 404]: # Don't retry auth/not found errors
-                             pass # Will go to sleep and retry
-                        else: # For critical errors or last attempt
-                            logger.error(f"Stopping retries for status {resp.status}.")
-                            return False # Failed, stop retrying for this status
-
+            if coin_list_cache: # Only revalidate when we actually hold the list the validators describe
+                data, etag, last_modified = await coingecko.get_coin_list_if_changed(coin_list_etag, coin_list_last_modified)
+            else:
+                data, etag, last_modified = await coingecko.get_coin_list_if_changed()
+            if data is None and coin_list_cache:
+                coin_list_updated_at = time.time()
+                logger.info(f"✅ Coin list not modified (304). Keeping {len(coin_list_cache)} coins.")
+                return True
+            if isinstance(data, list) and data: # Ensure data is a non-empty list
+                await set_coin_list(data)
+                coin_list_etag, coin_list_last_modified = etag, last_modified
+                logger.info(f"✅ Coin list loaded successfully. Total: {len(coin_list_cache)} coins.")
+                try:
+                    await asyncio.to_thread(save_snapshot, coin_list_cache.rows(), etag, last_modified)
+                except OSError as e:
+                    logger.warning(f"⚠️ Could not save coin list snapshot: {e}")
+                return True 
+            else:
+                logger.error(f"⚠️ Coin list loaded but is not a valid list or is empty. Type: {type(data)}. Data: {str(data)[:200]}")
+                coin_list_cache = coin_list_cache or CoinCatalogue(()) # Keep the last good list
+        except CircuitOpenError as e:
+            retry_after = e.retry_after
+            logger.warning(f"⚠️ CoinGecko circuit open on attempt {attempt + 1}, not calling upstream for {retry_after:.0f}s.")
+        except RateLimitError as e:
+            retry_after = e.retry_after
+            logger.warning(f"⚠️ Rate limit exceeded (429) on attempt {attempt + 1}. Waiting to retry...")
+        except CoinGeckoError as e:
+            logger.error(f"⚠️ Failed to load coin list. Status: {e.status}, Response: {e.body}")
+            coin_list_cache = coin_list_cache or CoinCatalogue(())
+            if attempt >= max_retries - 1 or e.status in [401, 403, 404]: # Don't retry auth/not found errors
+                logger.error(f"Stopping retries for status {e.status}.")
+                return False # Failed, stop retrying for this status
         except aiohttp.ClientError as e: 
             logger.error(f"⚠️ ClientError loading coin list on attempt {attempt + 1}: {e}")
         except asyncio.TimeoutError:
@@ -129,73 +292,71 @@ async def load_coin_list():
             logger.error(f"⚠️ Unexpected error loading coin list on attempt {attempt + 1}: {e}")
         
         if attempt < max_retries - 1:
-            delay = base_delay * (2 ** attempt) 
+            delay = max(base_delay * (2 ** attempt), retry_after or 0)
             logger.info(f"Waiting {delay} seconds before next attempt...")
             await asyncio.sleep(delay)
         else:
             logger.error("Max retries reached for loading coin list. List remains unavailable.")
     
-    coin_list_cache = [] # Ensure it's an empty list if all retries fail
+    coin_list_cache = coin_list_cache or CoinCatalogue(()) # Ensure it's a catalogue if all retries fail, keeping the last good one
     return False
 
+async def reload_coin_list_snapshot():
+    """Follower workers: loads the snapshot the leader saved, if it changed since the last load."""
+    global coin_list_snapshot_mtime, coin_list_etag, coin_list_last_modified
+    try:
+        mtime = os.path.getmtime(COIN_LIST_SNAPSHOT_PATH)
+    except OSError:
+        return bool(coin_list_cache) # The leader has not saved one yet
+    if mtime == coin_list_snapshot_mtime and coin_list_cache:
+        return True
+    snapshot = await asyncio.to_thread(load_snapshot)
+    if not snapshot:
+        return bool(coin_list_cache)
+    await set_coin_list(snapshot["coins"], snapshot.get("saved_at"), rows=True)
+    coin_list_snapshot_mtime = mtime
+    coin_list_etag, coin_list_last_modified = snapshot.get("etag"), snapshot.get("last_modified")
+    logger.info(f"✅ Coin list reloaded from the leader's snapshot. Total: {len(coin_list_cache)} coins.")
+    return True
 
-# --- Sequential Setup Steps ---
+def trigger_coin_list_refresh():
+    """Starts a background coin list load unless one is already running. Never awaited by handlers.
+    Only the leader downloads the list; followers reload the snapshot it saves."""
+    global coin_list_refresh_task
+    if coin_list_refresh_task is None or coin_list_refresh_task.done():
+        coin_list_refresh_task = asyncio.create_task(load_coin_list() if is_leader else reload_coin_list_snapshot())
+    return coin_list_refresh_task
 
-async def start_coin_selection(message_or_callback: types.Union[types.Message, types.CallbackQuery]):
-    user_id = message_or_callback.from_user.id
-    logger.info(f"[User {user_id}] Entering start_coin_selection. Type: {type(message_or_callback)}")
-    user_data = get_user_data(user_id)
-    user_data["current_step"] = "SELECTING_COINS"
-    user_data["selected_coins_buffer"] = list(user_data.get("coins", [])) 
+async def refresh_coin_list_periodically():
+    while True:
+        if not is_leader:
+            await trigger_coin_list_refresh()
+            await asyncio.sleep(COIN_LIST_RETRY_INTERVAL if coin_list_cache else LEADER_POLL_INTERVAL)
+            continue
+        if coin_list_updated_at is None or time.time() - coin_list_updated_at >= COIN_LIST_REFRESH_INTERVAL:
+            await trigger_coin_list_refresh()
+        next_due = (coin_list_updated_at or 0) + COIN_LIST_REFRESH_INTERVAL
+        await asyncio.sleep(max(COIN_LIST_RETRY_INTERVAL, next_due - time.time()))
 
-    if not await ensure_coin_list_loaded(message_or_callback):
-        return
 
-    current_coins_text_parts = []
-    # coin_list_cache is now guaranteed to be a list by ensure_coin_list_loaded, but could be empty
-    if coin_list_cache: 
-        for coin_id_in_buffer in user_data["selected_coins_buffer"]:
-            found_coin = next((c for c in coin_list_cache if c.get('id') == coin_id_in_buffer), None)
-            current_coins_text_parts.append(
-                f"{found_coin.get('name', coin_id_in_buffer.capitalize())} ({found_coin.get('symbol','N/A').upper()})" if found_coin else coin_id_in_buffer.capitalize()
-            )
+# --- Screen Rendering (memoized by the state shown; cleared when the coin list changes) ---
+@functools.lru_cache(maxsize=4096)
+def render_coin_selection(selected_coins: tuple) -> str:
+    if coin_list_cache and coin_index: 
+        current_coins_text_parts = [coin_index.display_name(coin_id, with_symbol=True) for coin_id in selected_coins]
     else: 
-         current_coins_text_parts = [c.capitalize() for c in user_data["selected_coins_buffer"]]
-
-
+        current_coins_text_parts = [c.capitalize() for c in selected_coins]
     current_coins_text = ", ".join(current_coins_text_parts) if current_coins_text_parts else "не обрано"
-    
-    text = (
+    return (
         "👋 Давайте налаштуємо вашого крипто-помічника!\n\n"
         "<b>Крок 1: Оберіть монети</b> (максимум 3)\n"
         f"Поточний вибір: {current_coins_text}\n\n"
         "Введіть назву або символ монети (наприклад, bitcoin, solana, doge).\n"
         "Коли завершите, введіть 'готово'."
     )
-    
-    try:
-        target_chat_id = message_or_callback.from_user.id
-        if isinstance(message_or_callback, types.Message):
-            await message_or_callback.answer(text, parse_mode=ParseMode.HTML)
-        elif isinstance(message_or_callback, types.CallbackQuery):
-            # Edit if possible, otherwise send new (e.g. if original message deleted or too old)
-            try:
-                await message_or_callback.message.edit_text(text, parse_mode=ParseMode.HTML)
-            except Exception:
-                await bot.send_message(target_chat_id, text, parse_mode=ParseMode.HTML)
-            await message_or_callback.answer()
-        logger.info(f"[User {user_id}] Sent coin selection prompt.")
-    except Exception as e:
-        logger.error(f"[User {user_id}] Error sending/editing message in start_coin_selection: {e}")
 
-
-async def start_frequency_selection(message_or_callback: types.Union[types.Message, types.CallbackQuery]):
-    user_id = message_or_callback.from_user.id
-    logger.info(f"[User {user_id}] Entering start_frequency_selection.")
-    user_data = get_user_data(user_id)
-    user_data["current_step"] = "SELECTING_FREQUENCY"
-
-    current_freq_code = user_data.get("frequency")
+@functools.lru_cache(maxsize=8)
+def render_frequency_selection(current_freq_code) -> tuple:
     frequency_options_display = {
         "2h": "Один раз на 2 години", "12h": "Один раз на 12 годин", "24h": "Один раз на добу"
     }
@@ -206,36 +367,25 @@ async def start_frequency_selection(message_or_callback: types.Union[types.Messa
         [InlineKeyboardButton(text=freq_text(frequency_options_display["24h"], "24h"), callback_data="setfreq_24h")]
     ])
     text = ("<b>Крок 2: Оберіть частоту оновлення цін</b>\n\n"
-            "Як часто ви бажаєте отримувати автоматичні оновлення? (Ця функція буде додана пізніше, зараз це налаштування зберігається для майбутнього використання).")
-    try:
-        target_chat_id = message_or_callback.from_user.id
-        if isinstance(message_or_callback, types.Message):
-            await message_or_callback.answer(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
-        elif isinstance(message_or_callback, types.CallbackQuery):
-            try:
-                await message_or_callback.message.edit_text(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
-            except Exception:
-                 await bot.send_message(target_chat_id, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
-            await message_or_callback.answer()
-        logger.info(f"[User {user_id}] Sent frequency selection prompt.")
-    except Exception as e:
-        logger.error(f"[User {user_id}] Error sending/editing message in start_frequency_selection: {e}")
+            "Як часто ви бажаєте отримувати автоматичні оновлення цін обраних монет?")
+    return text, keyboard
 
+@functools.lru_cache(maxsize=8)
+def render_currency_selection(current_currency: str) -> tuple:
+    def currency_text(code): return f"✅ {CURRENCIES[code][0]}" if code == current_currency else CURRENCIES[code][0]
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=currency_text(code), callback_data=f"setcur_{code}")] for code in CURRENCIES
+    ] + [[InlineKeyboardButton(text="↩️ Головне меню", callback_data="main_menu")]])
+    text = ("💱 <b>Валюта відображення</b>\n\n"
+            "Ціни отримуються в USD і перераховуються за курсом, що оновлюється кожні кілька хвилин.")
+    return text, keyboard
 
-async def display_main_menu(message_or_callback: types.Union[types.Message, types.CallbackQuery]):
-    user_id = message_or_callback.from_user.id
-    logger.info(f"[User {user_id}] Entering display_main_menu.")
-    user_data = get_user_data(user_id)
-    user_data["current_step"] = "SETUP_COMPLETE"
-    selected_coins = user_data.get("coins", [])
-    frequency_code = user_data.get("frequency")
+@functools.lru_cache(maxsize=4096)
+def render_main_menu(selected_coins: tuple, frequency_code, currency: str = BASE_CURRENCY) -> tuple:
     frequency_options_display = {"2h": "кожні 2 години", "12h": "кожні 12 годин", "24h": "щодня"}
     freq_display = frequency_options_display.get(frequency_code, "не встановлено")
-    coins_display_parts = []
-    if coin_list_cache: 
-        for coin_id in selected_coins:
-            coin_info = next((c for c in coin_list_cache if c.get('id') == coin_id), None)
-            coins_display_parts.append(coin_info.get('name', coin_id.capitalize()) if coin_info else coin_id.capitalize())
+    if coin_list_cache and coin_index: 
+        coins_display_parts = [coin_index.display_name(coin_id) for coin_id in selected_coins]
     else: 
         coins_display_parts = [c.capitalize() for c in selected_coins]
         if selected_coins: 
@@ -243,22 +393,81 @@ async def display_main_menu(message_or_callback: types.Union[types.Message, type
 
     coins_text = ", ".join(coins_display_parts) if coins_display_parts else "не обрано"
     text = (f"✅ Налаштування завершено!\n\n<b>Обрані монети:</b> {coins_text}\n"
-            f"<b>Частота (для майбутніх авто-оновлень):</b> {freq_display}\n\nТепер ви можете:")
+            f"<b>Частота авто-оновлень:</b> {freq_display}\n<b>Валюта:</b> {currency.upper()}\n\nТепер ви можете:")
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📈 Дивитися ціни зараз", callback_data="get_prices")],
+        [InlineKeyboardButton(text="🔔 Сповіщення про ціну", callback_data="alerts_menu")],
+        [InlineKeyboardButton(text="💱 Валюта відображення", callback_data="currency_menu")],
         [InlineKeyboardButton(text="🔄 Скинути налаштування", callback_data="reset_settings_sequential")]
     ])
+    return text, keyboard
+
+def clear_render_cache():
+    for render in (render_coin_selection, render_frequency_selection, render_main_menu, render_currency_selection):
+        render.cache_clear()
+
+# --- Sequential Setup Steps ---
+
+async def start_coin_selection(message_or_callback: types.Union[types.Message, types.CallbackQuery]):
+    user_id = message_or_callback.from_user.id
+    logger.debug("[User %s] Entering start_coin_selection. Type: %s", user_id, type(message_or_callback))
+    user_data = get_user_data(user_id)
+    # Seed the buffer only when entering the step; add/remove callbacks re-render with the buffer they just changed.
+    if user_data.get("current_step") != "SELECTING_COINS" or "selected_coins_buffer" not in user_data:
+        user_data["selected_coins_buffer"] = list(user_data.get("coins", [])) 
+    user_data["current_step"] = "SELECTING_COINS"
+    save_user_data(user_id, user_data)
+
+    if not await ensure_coin_list_loaded(message_or_callback):
+        return
+
+    text = render_coin_selection(tuple(user_data["selected_coins_buffer"]))
+    try:
+        if isinstance(message_or_callback, types.Message):
+            await message_renders.send(message_or_callback, text, parse_mode=ParseMode.HTML)
+        elif isinstance(message_or_callback, types.CallbackQuery):
+            # Skipped when the prompt already shows this selection; a new message only if the edit really fails
+            await message_renders.edit_or_send(message_or_callback.message, text, parse_mode=ParseMode.HTML)
+            await message_or_callback.answer()
+        logger.debug("[User %s] Sent coin selection prompt.", user_id)
+    except Exception as e:
+        logger.error(f"[User {user_id}] Error sending/editing message in start_coin_selection: {e}")
+
+
+async def start_frequency_selection(message_or_callback: types.Union[types.Message, types.CallbackQuery]):
+    user_id = message_or_callback.from_user.id
+    logger.debug("[User %s] Entering start_frequency_selection.", user_id)
+    user_data = get_user_data(user_id)
+    user_data["current_step"] = "SELECTING_FREQUENCY"
+    save_user_data(user_id, user_data)
+
+    text, keyboard = render_frequency_selection(user_data.get("frequency"))
+    try:
+        if isinstance(message_or_callback, types.Message):
+            await message_renders.send(message_or_callback, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+        elif isinstance(message_or_callback, types.CallbackQuery):
+            await message_renders.edit_or_send(message_or_callback.message, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+            await message_or_callback.answer()
+        logger.debug("[User %s] Sent frequency selection prompt.", user_id)
+    except Exception as e:
+        logger.error(f"[User {user_id}] Error sending/editing message in start_frequency_selection: {e}")
+
+
+async def display_main_menu(message_or_callback: types.Union[types.Message, types.CallbackQuery]):
+    user_id = message_or_callback.from_user.id
+    logger.debug("[User %s] Entering display_main_menu.", user_id)
+    user_data = get_user_data(user_id)
+    user_data["current_step"] = "SETUP_COMPLETE"
+    save_user_data(user_id, user_data)
+    text, keyboard = render_main_menu(tuple(user_data.get("coins", [])), user_data.get("frequency"),
+                                      user_data.get("currency", BASE_CURRENCY))
     try:
-        target_chat_id = message_or_callback.from_user.id
         if isinstance(message_or_callback, types.Message):
-            await message_or_callback.answer(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+            await message_renders.send(message_or_callback, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
         elif isinstance(message_or_callback, types.CallbackQuery):
-            try:
-                await message_or_callback.message.edit_text(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
-            except Exception:
-                await bot.send_message(target_chat_id, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+            await message_renders.edit_or_send(message_or_callback.message, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
             await message_or_callback.answer()
-        logger.info(f"[User {user_id}] Displayed main menu.")
+        logger.debug("[User %s] Displayed main menu.", user_id)
     except Exception as e:
         logger.error(f"[User {user_id}] Error sending/editing message in display_main_menu: {e}")
 
@@ -266,29 +475,30 @@ async def display_main_menu(message_or_callback: types.Union[types.Message, type
 @router.message(Command("start"))
 async def cmd_start(message: types.Message):
     user_id = message.from_user.id
-    logger.info(f"[User {user_id}] Received /start command.")
+    logger.debug("[User %s] Received /start command.", user_id)
     user_data = get_user_data(user_id)
     
-    # If coin list is not available (None, not a list, or empty list), try to load it.
-    if not coin_list_cache or not isinstance(coin_list_cache, list) or not coin_list_cache:
-        logger.info(f"[User {user_id}] /start: Coin list is unavailable. Triggering load_coin_list.")
-        load_successful = await load_coin_list() 
-        
-        if not load_successful:
-            logger.warning(f"[User {user_id}] /start: Coin list still unavailable after explicit load attempt. Informing user.")
-            try:
-                await message.answer("⚠️ На жаль, не вдалося завантажити список монет зараз. Сервіс CoinGecko може бути тимчасово перевантажений або недоступний. Будь ласка, спробуйте команду /start трохи пізніше.")
-            except Exception as e:
-                logger.error(f"[User {user_id}] /start: Error sending coin list load failure message: {e}")
-            return 
+    # If coin list is not available (None, not a list, or empty list), load it in the background; never wait for it here.
+    if not coin_list_cache or not isinstance(coin_list_cache, CoinCatalogue):
+        logger.debug("[User %s] /start: Coin list is unavailable. Triggering background load_coin_list.", user_id)
+        trigger_coin_list_refresh()
+        try:
+            await message.answer("⚠️ На жаль, список монет зараз недоступний. Ми вже завантажуємо його з CoinGecko. Будь ласка, спробуйте команду /start за хвилину.")
+        except Exception as e:
+            logger.error(f"[User {user_id}] /start: Error sending coin list load failure message: {e}")
+        return 
 
     if user_data.get("current_step") == "SETUP_COMPLETE" and user_data.get("coins") and user_data.get("frequency"):
-        logger.info(f"[User {user_id}] /start: Setup complete. Displaying main menu.")
+        logger.debug("[User %s] /start: Setup complete. Displaying main menu.", user_id)
         await display_main_menu(message)
     else:
-        logger.info(f"[User {user_id}] /start: Setup not complete or explicit /start. Resetting and starting coin selection.")
+        logger.debug("[User %s] /start: Setup not complete or explicit /start. Resetting and starting coin selection.", user_id)
         user_data["coins"] = [] 
         user_data["frequency"] = None 
+        user_data.pop("selected_coins_buffer", None)
+        drop_user_alerts(user_id, user_data)
+        save_user_data(user_id, user_data)
+        auto_updates.unsubscribe(user_id)
         await start_coin_selection(message)
 
 @router.callback_query(F.data == "reset_settings_sequential")
@@ -298,72 +508,280 @@ async def handle_reset_settings_sequential(callback: types.CallbackQuery):
     user_data["coins"] = []
     user_data["frequency"] = None
     user_data["current_step"] = "INIT"
-    logger.info(f"User {user_id} reset settings via callback.")
+    drop_user_alerts(user_id, user_data)
+    save_user_data(user_id, user_data)
+    auto_updates.unsubscribe(user_id)
+    logger.info("User %s reset settings via callback.", user_id)
     await callback.answer("🔄 Налаштування скинуто.")
     await start_coin_selection(callback)
 
+# --- Price Alerts ---
+THOUSANDS_GROUPS = re.compile(r"[1-9]\d{0,2}(,\d{3})+$")
+
+def is_grouped_price(text: str) -> bool:
+    """True if parse_price() read `text` as comma-grouped thousands ("1,500"), which could also be a decimal comma."""
+    return bool(THOUSANDS_GROUPS.match(text.strip().lstrip("$").replace(" ", "")))
+
+def parse_price(text: str):
+    """"70000", "70 000", "$70,000.5", "70,000", "0,05" -> float, or None.
+
+    Without a dot, a comma before groups of exactly three digits ("70,000", "1,250,000") is a
+    thousands separator; any other comma is the decimal separator. cmd_alert rejects that reading
+    for coins under $1, where "1,500" more likely means 1.5.
+    """
+    text = text.strip().lstrip("$").replace(" ", "")
+    if "." in text or is_grouped_price(text):
+        text = text.replace(",", "")
+    else:
+        text = text.replace(",", ".")
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+def find_user_coin(user_data: dict, query: str):
+    """Resolves `query` (id, symbol or name) among the user's selected coins."""
+    query = query.lower().strip()
+    for coin_id in user_data.get("coins", []):
+        info = coin_index.get(coin_id) if coin_index else None
+        names = {coin_id.lower()} | ({info.get("symbol", "").lower(), info.get("name", "").lower()} if info else set())
+        if query in names:
+            return coin_id
+    return None
+
+def drop_user_alerts(user_id: int, user_data: dict):
+    for stored in user_data.pop("alerts", []):
+        alert_book.remove(user_id, stored["id"], stored["coin"])
+
+def build_alerts_screen(user_data: dict) -> tuple:
+    alerts = user_data.get("alerts", [])
+    lines = ["🔔 <b>Сповіщення про ціну</b>\n"]
+    buttons = []
+    for stored in alerts:
+        sign = "≥" if stored["above"] else "≤"
+        name = coin_index.display_name(stored["coin"]) if coin_index else stored["coin"].capitalize()
+        lines.append(f"• {name} {sign} ${stored['price']:,.2f}")
+        buttons.append([InlineKeyboardButton(text=f"❌ {name} {sign} ${stored['price']:,.2f}", callback_data=f"delalert_{stored['id']}")])
+    if not alerts: lines.append("Активних сповіщень немає.")
+    lines.append(f"\nЩоб додати, надішліть: <code>/alert btc 70000</code> (для однієї з обраних монет, максимум {ALERTS_PER_USER}).\n"
+                 "Сповіщення спрацьовує один раз, коли ціна перетинає поріг.")
+    buttons.append([InlineKeyboardButton(text="↩️ Головне меню", callback_data="main_menu")])
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@router.message(Command("alert"))
+async def cmd_alert(message: types.Message):
+    user_id = message.from_user.id
+    user_data = get_user_data(user_id)
+    if user_data.get("current_step") != "SETUP_COMPLETE" or not user_data.get("coins"):
+        await message.answer("Спочатку завершіть налаштування монет: /start"); return
+    args = (message.text or "").split(maxsplit=1)[1:]
+    parts = args[0].rsplit(maxsplit=1) if args else []
+    if len(parts) != 2 or parse_price(parts[1]) is None:
+        await message.answer("Формат: <code>/alert btc 70000</code> — монета з вашого списку і ціна в USD.", parse_mode=ParseMode.HTML); return
+    coin_id, threshold = find_user_coin(user_data, parts[0]), parse_price(parts[1])
+    if coin_id is None:
+        await message.answer("⚠️ Сповіщення можна додати лише для обраних монет. Змініть список через /start."); return
+    alerts = user_data.setdefault("alerts", [])
+    if len(alerts) >= ALERTS_PER_USER:
+        await message.answer(f"⚠️ Можна мати максимум {ALERTS_PER_USER} сповіщень. Видаліть зайві в меню сповіщень."); return
+
+    try:
+        entry = (await price_cache.get_prices([coin_id])).get(coin_id)
+    except (CoinGeckoError, CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"[User {user_id}] Could not get the current price for a new alert on {coin_id}: {e!r}")
+        entry = None
+    current = entry.prices.get("usd") if entry and entry.prices else None
+    if current is None:
+        await message.answer("❌ Не вдалося отримати поточну ціну. Спробуйте пізніше."); return
+    if threshold == current:
+        await message.answer("ℹ️ Ціна вже на цьому рівні. Вкажіть інший поріг."); return
+    if current < 1 and is_grouped_price(parts[1]): # "1,500" may be a decimal comma for a sub-dollar coin
+        await message.answer(f"⚠️ Незрозуміло, чи <code>{parts[1]}</code> — це ${threshold:,.0f}, чи дробова ціна. "
+                             "Для монет дешевших за $1 вкажіть ціну з крапкою (<code>1.5</code>) або без розділювачів (<code>1500</code>).",
+                             parse_mode=ParseMode.HTML); return
+
+    alert_id = user_data.get("next_alert_id", 1)
+    alert = Alert(user_id, alert_id, coin_id, threshold, above=threshold > current)
+    user_data["next_alert_id"] = alert_id + 1
+    alerts.append(alert.to_dict())
+    save_user_data(user_id, user_data)
+    if is_leader: # Followers: the leader picks the alert up from the shared settings
+        alert_book.add(alert)
+    logger.info("User %s added alert %s on %s at %s (%s).", user_id, alert_id, coin_id, threshold, "above" if alert.above else "below")
+    name = coin_index.display_name(coin_id) if coin_index else coin_id.capitalize()
+    direction = "підніметься до" if alert.above else "опуститься до"
+    await message.answer(f"✅ Повідомлю, коли {name} {direction} ${threshold:,.2f} (зараз ${current:,.2f}).")
+
+@router.callback_query(F.data == "alerts_menu")
+async def handle_alerts_menu_callback(callback: types.CallbackQuery):
+    text, keyboard = build_alerts_screen(get_user_data(callback.from_user.id))
+    await message_renders.edit_or_send(callback.message, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("delalert_"))
+async def handle_delete_alert_callback(callback: types.CallbackQuery):
+    user_id = callback.from_user.id
+    user_data = get_user_data(user_id)
+    suffix = callback.data.removeprefix("delalert_")
+    alert_id = int(suffix) if suffix.isdigit() else None
+    stored = next((a for a in user_data.get("alerts", []) if a["id"] == alert_id), None)
+    if stored is not None:
+        user_data["alerts"].remove(stored)
+        save_user_data(user_id, user_data)
+        alert_book.remove(user_id, alert_id, stored["coin"])
+        await callback.answer("🗑 Сповіщення видалено.")
+    else: await callback.answer("ℹ️ Це сповіщення вже спрацювало або видалене.")
+    text, keyboard = build_alerts_screen(user_data)
+    await message_renders.edit_or_send(callback.message, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+
+@router.callback_query(F.data == "main_menu")
+async def handle_main_menu_callback(callback: types.CallbackQuery):
+    user_data = get_user_data(callback.from_user.id)
+    if user_data.get("current_step") != "SETUP_COMPLETE" or not user_data.get("coins"):
+        await callback.answer("Спочатку завершіть налаштування монет.", show_alert=True); return # Stale button on an old screen
+    await display_main_menu(callback)
+
+def on_prices_fetched(payload: dict, fetched_at: float):
+    """PriceCache hook: every successful fetch feeds the price history and is an alert tick."""
+    price_history.record_many(payload, fetched_at)
+    if not is_leader: # Alerts are checked and delivered by the leader only
+        return
+    fired = alert_book.check_many(payload)
+    if fired:
+        task = asyncio.create_task(deliver_alerts(fired, payload))
+        alert_deliveries.add(task)
+        task.add_done_callback(alert_deliveries.discard)
+
+price_cache.on_prices = on_prices_fetched
+
+async def deliver_alerts(fired: list, payload: dict):
+    """Sends fired alerts through the send queue (bulk priority) and removes them from user settings."""
+    send_priority.set(PRIORITY_BULK)
+    for alert in fired:
+        def drop(data, alert_id=alert.alert_id):
+            data["alerts"] = [a for a in data.get("alerts", []) if a["id"] != alert_id]
+        try:
+            await settings_store.update(alert.user_id, drop)
+            alert_book.settle(alert.user_id, alert.alert_id)
+        except Exception as e:
+            logger.error(f"[User {alert.user_id}] Failed to remove fired alert {alert.alert_id} from settings: {e!r}")
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📈 Дивитися ціни", callback_data="get_prices")],
+        [InlineKeyboardButton(text="🔔 Мої сповіщення", callback_data="alerts_menu")]])
+
+    async def send(alert: Alert):
+        name = coin_index.display_name(alert.coin_id, with_symbol=True) if coin_index else alert.coin_id.capitalize()
+        direction = "піднялася до" if alert.above else "опустилася до"
+        text = (f"🚨 <b>{name}</b>: ціна {direction} ${alert.threshold:,.2f}\n"
+                f"Поточна ціна: ${payload[alert.coin_id]['usd']:,.2f}")
+        await bot.send_message(alert.user_id, text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
+    results = await asyncio.gather(*(send(alert) for alert in fired), return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    logger.info(f"🚨 Delivered {len(fired) - len(failed)}/{len(fired)} price alerts.")
+    for error in failed[:3]:
+        logger.error(f"Price alert delivery failed: {error!r}")
+
+async def check_alerts_periodically():
+    """Keeps prices of coins with alerts fresh; the fetches themselves trigger the alerts."""
+    while True:
+        await asyncio.sleep(ALERT_CHECK_INTERVAL)
+        coins = alert_book.coins()
+        if not coins:
+            continue
+        try:
+            await price_cache.get_prices(coins)
+        except Exception as e:
+            logger.warning(f"⚠️ Alert price check failed for {len(coins)} coins: {e!r}")
+
+# --- Inline Mode ---
+@router.inline_query()
+async def handle_inline_query(inline_query: types.InlineQuery):
+    """`@bot sol`: ranked coin suggestions (derivatives filtered like in coin selection).
+    Choosing one sends the coin id, which works as a search while selecting coins."""
+    if not coin_index:
+        trigger_coin_list_refresh()
+        await inline_query.answer([], cache_time=5, is_personal=False); return
+    await inline_query.answer(inline_suggestions.answer(inline_query.query), cache_time=INLINE_CACHE_TIME, is_personal=False)
+
+# --- Display Currency ---
+@router.callback_query(F.data == "currency_menu")
+async def handle_currency_menu_callback(callback: types.CallbackQuery):
+    text, keyboard = render_currency_selection(get_user_data(callback.from_user.id).get("currency", BASE_CURRENCY))
+    await message_renders.edit_or_send(callback.message, text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("setcur_"))
+async def handle_set_currency_callback(callback: types.CallbackQuery):
+    user_id = callback.from_user.id
+    currency = callback.data.removeprefix("setcur_")
+    if currency not in CURRENCIES:
+        await callback.answer("Ця валюта не підтримується.", show_alert=True); return
+    user_data = get_user_data(user_id)
+    if user_data.get("current_step") != "SETUP_COMPLETE" or not user_data.get("coins"):
+        await callback.answer("Спочатку завершіть налаштування монет.", show_alert=True); return # Stale button on an old screen
+    user_data["currency"] = currency
+    save_user_data(user_id, user_data)
+    logger.info("User %s set display currency to %s.", user_id, currency)
+    await display_main_menu(callback)
+
 # --- Coin Selection Handlers ---
 @router.message(F.text)
 async def handle_message_input(message: types.Message):
     user_id = message.from_user.id
     user_data = get_user_data(user_id)
-    logger.info(f"[User {user_id}] Received text: '{message.text}'. Current step: {user_data.get('current_step')}")
+    logger.debug("[User %s] Received text: '%s'. Current step: %s", user_id, message.text, user_data.get('current_step'))
 
     if user_data.get("current_step") == "SELECTING_COINS":
-        logger.info(f"[User {user_id}] In SELECTING_COINS step.")
+        logger.debug("[User %s] In SELECTING_COINS step.", user_id)
         if not await ensure_coin_list_loaded(message):
             logger.warning(f"[User {user_id}] Coin list not loaded, exiting handle_message_input for coin selection.")
             return 
 
         coin_input_text = message.text.lower().strip()
-        logger.info(f"[User {user_id}] Coin input text: '{coin_input_text}'")
+        logger.debug("[User %s] Coin input text: '%s'", user_id, coin_input_text)
 
         if coin_input_text == "готово":
             user_data["coins"] = list(user_data.get("selected_coins_buffer", []))
+            save_user_data(user_id, user_data)
             if not user_data["coins"]:
-                logger.info(f"[User {user_id}] 'готово' entered but no coins selected.")
+                logger.debug("[User %s] 'готово' entered but no coins selected.", user_id)
                 try: await message.answer("⚠️ Будь ласка, оберіть хоча б одну монету перед тим, як продовжити, або введіть 'скасувати', щоб почати знову з /start.")
                 except Exception as e: logger.error(f"Error sending 'no coins selected' message: {e}")
                 return
-            logger.info(f"[User {user_id}] 'готово' entered. Coins: {user_data['coins']}. Proceeding to frequency selection.")
+            logger.info("[User %s] 'готово' entered. Coins: %s. Proceeding to frequency selection.", user_id, user_data['coins'])
             if "selected_coins_buffer" in user_data: del user_data["selected_coins_buffer"]
+            save_user_data(user_id, user_data)
             await start_frequency_selection(message)
             return
         
         if coin_input_text == "скасувати":
-            logger.info(f"[User {user_id}] 'скасувати' entered during coin selection.")
+            logger.debug("[User %s] 'скасувати' entered during coin selection.", user_id)
             user_data["current_step"] = "INIT"
             if "selected_coins_buffer" in user_data: del user_data["selected_coins_buffer"]
+            save_user_data(user_id, user_data)
             try: await message.answer("🚫 Вибір монет скасовано. Введіть /start, щоб почати знову.")
             except Exception as e: logger.error(f"Error sending 'coin selection cancelled' message: {e}")
             return
 
         query = coin_input_text
-        logger.info(f"[User {user_id}] Searching for coin: '{query}'")
-        derivative_filters = ['wrapped', 'amm', 'pool', 'bpt', 'tokenized', 'wormhole', 'peg', 'staked', 'leveraged']
-        potential_matches = []
-        # coin_list_cache is guaranteed to be a list by ensure_coin_list_loaded, but check if empty
-        if not coin_list_cache: # Should have been caught by ensure_coin_list_loaded
+        logger.debug("[User %s] Searching for coin: '%s'", user_id, query)
+        # coin_list_cache is guaranteed to be a CoinCatalogue by ensure_coin_list_loaded, but check if empty
+        if not coin_list_cache or not coin_index: # Should have been caught by ensure_coin_list_loaded
              logger.error(f"[User {user_id}] coin_list_cache is unexpectedly empty in handle_message_input after ensure_coin_list_loaded passed.")
              await message.answer("Помилка: список монет порожній. Спробуйте /start пізніше.")
              return
 
-        for coin in coin_list_cache: 
-            coin_id_lower = coin.get('id', '').lower()
-            coin_symbol_lower = coin.get('symbol', '').lower()
-            coin_name_lower = coin.get('name', '').lower()
-            if not coin_id_lower or not coin_symbol_lower or not coin.get('name'): continue
-            if any(f_word in coin_id_lower for f_word in derivative_filters): continue
-            if query == coin_symbol_lower or query == coin_id_lower or query in coin_name_lower:
-                potential_matches.append(coin)
-        matches = sorted(potential_matches, key=lambda c: (query != c.get('symbol','').lower(), query != c.get('id','').lower(), query not in c.get('name','').lower()))
+        matches = coin_index.search(query, limit=5)
 
         try:
             if not matches:
-                logger.info(f"[User {user_id}] No matches found for '{query}'.")
+                logger.debug("[User %s] No matches found for '%s'.", user_id, query)
                 await message.answer(f"❌ Монету '{message.text}' не знайдено. Спробуйте іншу назву або символ.")
             else:
-                logger.info(f"[User {user_id}] Matches found for '{query}': {[m.get('id') for m in matches[:5]]}. Creating keyboard.")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[User %s] Matches found for '%s': %s. Creating keyboard.", user_id, query, [m.get('id') for m in matches[:5]])
                 keyboard_buttons = []
                 for c in matches[:5]:
                     coin_id, coin_name, coin_symbol = c.get('id'), c.get('name', 'Unknown Coin'), c.get('symbol', 'N/A').upper()
@@ -373,11 +791,7 @@ async def handle_message_input(message: types.Message):
                 
                 buffer_display_parts = []
                 for s_id in user_data.get("selected_coins_buffer", []):
-                    coin_info = next((ci for ci in coin_list_cache if ci.get('id') == s_id), None)
-                    if coin_info:
-                        buffer_display_parts.append(f"{coin_info.get('name', s_id.capitalize())} ({coin_info.get('symbol','N/A').upper()})")
-                    else: 
-                        buffer_display_parts.append(s_id.capitalize())
+                    buffer_display_parts.append(coin_index.display_name(s_id, with_symbol=True))
                 current_coins_text = ", ".join(buffer_display_parts) if buffer_display_parts else "не обрано"
 
                 await message.answer(
@@ -385,13 +799,13 @@ async def handle_message_input(message: types.Message):
                     "Оберіть одну зі списку, введіть іншу назву, 'готово' або 'скасувати':",
                     reply_markup=keyboard, parse_mode=ParseMode.HTML
                 )
-                logger.info(f"[User {user_id}] Sent coin options keyboard for '{query}'.")
+                logger.debug("[User %s] Sent coin options keyboard for '%s'.", user_id, query)
         except Exception as e:
             logger.error(f"[User {user_id}] Error sending message in coin search result: {e}")
             try: await message.answer("Помилка під час відображення результатів пошуку. Спробуйте ще раз.")
             except Exception as e2: logger.error(f"Error sending fallback error message: {e2}")
     else:
-        logger.info(f"[User {user_id}] Text received but not in SELECTING_COINS step. Sending 'Не розумію вас'.")
+        logger.debug("[User %s] Text received but not in SELECTING_COINS step. Sending 'Не розумію вас'.", user_id)
         try: await message.answer("Не розумію вас. Будь ласка, використовуйте команди або кнопки. Введіть /start, щоб почати.")
         except Exception as e: logger.error(f"Error sending 'Не розумію вас' message: {e}")
 
@@ -400,7 +814,7 @@ async def handle_message_input(message: types.Message):
 async def handle_add_sel_coin_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     user_data = get_user_data(user_id)
-    logger.info(f"[User {user_id}] addselcoin callback: {callback.data}. Current step: {user_data.get('current_step')}")
+    logger.debug("[User %s] addselcoin callback: %s. Current step: %s", user_id, callback.data, user_data.get('current_step'))
     if user_data.get("current_step") != "SELECTING_COINS":
         await callback.answer("Помилка: не той етап для додавання монет.", show_alert=True); return
     
@@ -412,8 +826,9 @@ async def handle_add_sel_coin_callback(callback: types.CallbackQuery):
     elif len(buffer) >= 3: await callback.answer("⚠️ Можна обрати максимум 3 монети.", show_alert=True)
     else:
         buffer.append(coin_id_to_add)
-        coin_info = next((c for c in coin_list_cache if c.get('id') == coin_id_to_add), None) if coin_list_cache else None
-        await callback.answer(f"✅ Додано: {coin_info.get('name', coin_id_to_add.capitalize()) if coin_info else coin_id_to_add.capitalize()}", show_alert=False)
+        save_user_data(user_id, user_data)
+        coin_name = coin_index.display_name(coin_id_to_add) if coin_index else coin_id_to_add.capitalize()
+        await callback.answer(f"✅ Додано: {coin_name}", show_alert=False)
     await start_coin_selection(callback)
 
 
@@ -421,7 +836,7 @@ async def handle_add_sel_coin_callback(callback: types.CallbackQuery):
 async def handle_remove_sel_coin_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     user_data = get_user_data(user_id)
-    logger.info(f"[User {user_id}] removeselcoin callback: {callback.data}. Current step: {user_data.get('current_step')}")
+    logger.debug("[User %s] removeselcoin callback: %s. Current step: %s", user_id, callback.data, user_data.get('current_step'))
     if user_data.get("current_step") != "SELECTING_COINS":
         await callback.answer("Помилка: не той етап для видалення монет.", show_alert=True); return
 
@@ -431,8 +846,9 @@ async def handle_remove_sel_coin_callback(callback: types.CallbackQuery):
     buffer = user_data.setdefault("selected_coins_buffer", [])
     if coin_id_to_remove in buffer:
         buffer.remove(coin_id_to_remove)
-        coin_info = next((c for c in coin_list_cache if c.get('id') == coin_id_to_remove), None) if coin_list_cache else None
-        await callback.answer(f"➖ Видалено: {coin_info.get('name', coin_id_to_remove.capitalize()) if coin_info else coin_id_to_remove.capitalize()}", show_alert=False)
+        save_user_data(user_id, user_data)
+        coin_name = coin_index.display_name(coin_id_to_remove) if coin_index else coin_id_to_remove.capitalize()
+        await callback.answer(f"➖ Видалено: {coin_name}", show_alert=False)
     else: await callback.answer("ℹ️ Цієї монети немає у списку.", show_alert=True)
     await start_coin_selection(callback)
 
@@ -441,19 +857,22 @@ async def handle_remove_sel_coin_callback(callback: types.CallbackQuery):
 async def handle_set_frequency_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     user_data = get_user_data(user_id)
-    logger.info(f"[User {user_id}] setfreq callback: {callback.data}. Current step: {user_data.get('current_step')}")
+    logger.debug("[User %s] setfreq callback: %s. Current step: %s", user_id, callback.data, user_data.get('current_step'))
     if user_data.get("current_step") != "SELECTING_FREQUENCY":
         await callback.answer("Помилка: не той етап для вибору частоти.", show_alert=True); return
     user_data["frequency"] = callback.data.replace("setfreq_", "")
-    logger.info(f"User {user_id} set frequency to {user_data['frequency']}.")
+    save_user_data(user_id, user_data)
+    logger.info("User %s set frequency to %s.", user_id, user_data['frequency'])
     await display_main_menu(callback)
+    if is_leader: # Followers: the leader picks the frequency up from the shared settings
+        auto_updates.subscribe(user_id, user_data["frequency"])
 
 
 @router.callback_query(F.data == "get_prices")
 async def handle_get_prices_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     user_data = get_user_data(user_id)
-    logger.info(f"[User {user_id}] get_prices callback. Current step: {user_data.get('current_step')}")
+    logger.debug("[User %s] get_prices callback. Current step: %s", user_id, user_data.get('current_step'))
     if user_data.get("current_step") != "SETUP_COMPLETE" or not user_data.get("coins"):
         await callback.answer("Спочатку завершіть налаштування монет.", show_alert=True); return
     
@@ -462,39 +881,26 @@ async def handle_get_prices_callback(callback: types.CallbackQuery):
 
     coins_to_fetch = user_data["coins"]
     await callback.answer("⏳ Отримую ціни...") 
-    text_parts = ["📈 <b>Поточні ціни (USD):</b>\n"]
+    currency = user_data.get("currency", BASE_CURRENCY)
+    text_parts = [f"📈 <b>Поточні ціни ({shown_currency(currency).upper()}):</b>\n"]
     try:
-        async with aiohttp.ClientSession() as session:
-            ids_param = ",".join(coins_to_fetch)
-            url = f"https://api.coingecko.com/api/v3/simple/price?ids={ids_param}&vs_currencies=usd"
-            async with session.get(url, timeout=10) as resp: 
-                if resp.status == 200:
-                    data = await resp.json()
-                    for coin_id in coins_to_fetch:
-                        price_data = data.get(coin_id)
-                        coin_name_display, sym_display = coin_id.capitalize(),""
-                        if coin_list_cache: 
-                            info = next((c for c in coin_list_cache if c.get('id')==coin_id),None)
-                            if info: coin_name_display, sym_display = info.get('name',coin_id.capitalize()), f" ({info.get('symbol','').upper()})"
-                        
-                        if price_data and "usd" in price_data: text_parts.append(f"<b>{coin_name_display}</b>{sym_display}: ${price_data['usd']:,.2f}")
-                        else: text_parts.append(f"<b>{coin_name_display}</b>{sym_display}: ❌ Помилка даних")
-                elif resp.status == 429:
-                    logger.warning(f"Rate limit (429) hit during get_prices for user {user_id}.")
-                    text_parts.append("❌ Перевищено ліміт запитів до API. Спробуйте пізніше.")
-                else:
-                    logger.error(f"CoinGecko API error for {user_id} during get_prices: {resp.status} - {await resp.text()}")
-                    text_parts.append(f"❌ Помилка API CoinGecko (статус {resp.status}).")
+        try:
+            price_entries = await price_cache.get_prices(coins_to_fetch)
+            text_parts.extend(build_price_lines(coins_to_fetch, price_entries, currency))
+        except CircuitOpenError as e:
+            logger.warning(f"CoinGecko circuit open during get_prices for user {user_id}, no cached prices to serve.")
+            text_parts.append(f"❌ CoinGecko тимчасово недоступний. Спробуйте через {max(1, int(e.retry_after // 60) + 1)} хв.")
+        except RateLimitError:
+            logger.warning(f"Rate limit (429) hit during get_prices for user {user_id}.")
+            text_parts.append("❌ Перевищено ліміт запитів до API. Спробуйте пізніше.")
+        except CoinGeckoError as e:
+            logger.error(f"CoinGecko API error for {user_id} during get_prices: {e.status} - {e.body}")
+            text_parts.append(f"❌ Помилка API CoinGecko (статус {e.status}).")
         final_text = "\n".join(text_parts)
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🔄 Оновити ціни", callback_data="get_prices")],
             [InlineKeyboardButton(text="⚙️ Змінити налаштування (скинути)", callback_data="reset_settings_sequential")]])
-        try:
-            if callback.message.text != final_text or callback.message.reply_markup != keyboard :
-                await callback.message.edit_text(final_text.strip(), parse_mode=ParseMode.HTML, reply_markup=keyboard)
-            else: await callback.answer() 
-        except Exception: 
-             await callback.message.answer(final_text.strip(), parse_mode=ParseMode.HTML, reply_markup=keyboard)
+        await message_renders.edit_or_send(callback.message, final_text.strip(), reply_markup=keyboard, parse_mode=ParseMode.HTML)
     except aiohttp.ClientError as e:
         logger.error(f"ClientError in get_prices for {user_id}: {e}")
         text_parts = [text_parts[0], "❌ Мережева помилка при отриманні цін."] # Keep header, replace rest
@@ -510,37 +916,317 @@ async def handle_get_prices_callback(callback: types.CallbackQuery):
         error_keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="↩️ Головне меню", callback_data="back_to_main_menu_from_error")]
         ])
-        try:
-            await callback.message.edit_text(final_text_on_error.strip(), parse_mode=ParseMode.HTML, reply_markup=error_keyboard)
-        except Exception:
-            await bot.send_message(callback.from_user.id, final_text_on_error.strip(), parse_mode=ParseMode.HTML, reply_markup=error_keyboard)
+        await message_renders.edit_or_send(callback.message, final_text_on_error.strip(), reply_markup=error_keyboard, parse_mode=ParseMode.HTML)
 
 
 @router.callback_query(F.data == "back_to_main_menu_from_error")
 async def handle_back_to_main_from_error(callback: types.CallbackQuery):
-    logger.info(f"[User {callback.from_user.id}] Going back to main menu from error.")
+    logger.debug("[User %s] Going back to main menu from error.", callback.from_user.id)
     mock_msg = create_mock_message_from_callback(callback)
     await display_main_menu(mock_msg) 
     await callback.answer()
 
+# --- Auto-Updates ---
+async def get_auto_update_coins(user_ids) -> dict:
+    """Coins to send in a scheduled update per user; users who no longer have auto-updates are left out."""
+    users = await settings_store.get_many(user_ids)
+    return {user_id: list(data["coins"]) for user_id, data in users.items()
+            if data.get("current_step") == "SETUP_COMPLETE" and data.get("frequency") and data.get("coins")}
+
+async def deliver_auto_update(user_id, coin_ids, price_entries):
+    send_priority.set(PRIORITY_BULK) # Scoped to this delivery's task context
+    user_data = get_user_data(user_id)
+    currency = user_data.get("currency", BASE_CURRENCY)
+    text = "\n".join([f"🔔 <b>Авто-оновлення цін ({shown_currency(currency).upper()}):</b>\n"] + build_price_lines(coin_ids, price_entries, currency))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Оновити ціни", callback_data="get_prices")]])
+    await bot.send_message(user_id, text.strip(), parse_mode=ParseMode.HTML, reply_markup=keyboard)
+    # The send may have waited minutes in the queue; user_data can be stale by now, so only this field is written.
+    sent_at = time.time()
+    await settings_store.update(user_id, lambda data: data.update(last_update_at=sent_at))
+
+auto_updates = AutoUpdateScheduler(get_auto_update_coins, price_cache.get_prices, deliver_auto_update)
+
+# --- Metrics (values that already live on these objects are read at scrape time) ---
+router.message.middleware(HandlerMetricsMiddleware())
+router.callback_query.middleware(HandlerMetricsMiddleware())
+router.inline_query.middleware(HandlerMetricsMiddleware())
+REGISTRY.register(CallbackMetric(
+    "cryptoday_coin_list_size", "Coins in the loaded coin list.", lambda: len(coin_list_cache) if coin_list_cache else 0))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_coin_list_age_seconds", "Seconds since the coin list was last confirmed current.",
+    lambda: time.time() - coin_list_updated_at if coin_list_updated_at else None))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_price_cache_requests_total", "Price cache lookups by result.",
+    lambda: {("hit",): price_cache.hits, ("miss",): price_cache.misses}, kind="counter", labelnames=("result",)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_price_cache_stale_served_total", "Price lookups answered with stale prices after a failed refresh.",
+    lambda: price_cache.stale_served, kind="counter"))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_coingecko_circuit_open", "1 while the CoinGecko circuit breaker rejects calls (open or half-open).",
+    lambda: int(coingecko.breaker.state != "closed")))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_coingecko_circuit_rejected_total", "CoinGecko calls rejected by the open circuit breaker.",
+    lambda: coingecko.breaker.rejected, kind="counter"))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_price_batcher_calls_total", "Price fetches requested vs /simple/price calls made.",
+    lambda: {("requested",): price_batcher.requests, ("upstream",): price_batcher.upstream_calls},
+    kind="counter", labelnames=("kind",)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_send_queue", "Telegram send queue state (see SendQueue.stats()).",
+    lambda: {(key,): value for key, value in send_queue.stats().items()}, labelnames=("stat",)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_update_scheduler", "Webhook update scheduler state (see UpdateScheduler.stats()).",
+    lambda: {(key,): value for key, value in update_scheduler.stats().items()}, labelnames=("stat",)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_message_renders_total", "Screen updates by outcome (skipped = unchanged, no API call).",
+    lambda: {("edited",): message_renders.edited, ("skipped",): message_renders.skipped, ("resent",): message_renders.resent},
+    kind="counter", labelnames=("outcome",)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_price_history_coins", "Coins with an in-process price history.", lambda: len(price_history)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_price_alerts", "Active price-threshold alerts.", lambda: len(alert_book)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_inline_cache_requests_total", "Inline query rankings by cache result.",
+    lambda: {("hit",): inline_suggestions.hits, ("miss",): inline_suggestions.misses}, kind="counter", labelnames=("result",)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_fx_rates_age_seconds", "Seconds since the exchange rate table was last refreshed.",
+    lambda: time.time() - fx_rates.updated_at if fx_rates.updated_at else None))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_worker_leader", "1 if this worker process is the leader (scrapes reach one worker each).",
+    lambda: int(is_leader)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_startup_seconds", "Seconds from process start to each startup phase.",
+    lambda: {(phase,): seconds for phase, seconds in startup_timings.items()}, labelnames=("phase",)))
+REGISTRY.register(CallbackMetric(
+    "cryptoday_auto_update_subscribers", "Users with scheduled auto-updates.", lambda: len(auto_updates)))
+
+# --- Startup Pipeline ---
+def mark_startup(phase: str):
+    startup_timings[phase] = round(time.monotonic() - STARTED_AT, 3)
+    logger.info(f"⏱️ Startup: {phase} after {startup_timings[phase]:.2f}s")
+
+update_scheduler.on_first_processed = lambda: mark_startup("first_response")
+
+async def ensure_webhook():
+    """Registers the webhook only if Telegram has a different URL. Pending updates are never dropped:
+    Telegram delivers them once we answer, and the paused update scheduler holds them until ready."""
+    global webhook_registered
+    allowed_updates = dp.resolve_used_update_types() # Includes inline_query
+    for attempt in range(3):
+        try:
+            info = await bot.get_webhook_info()
+            if info.url == WEBHOOK_URL and (info.allowed_updates is None or set(info.allowed_updates) >= set(allowed_updates)):
+                logger.info(f"Webhook already set, {info.pending_update_count} pending update(s) will be delivered.")
+            else:
+                logger.info(f"Setting webhook to: {WEBHOOK_URL} (was: {info.url or 'not set'}, {info.pending_update_count} pending update(s) kept)")
+                await bot.set_webhook(WEBHOOK_URL, allowed_updates=allowed_updates)
+            webhook_registered = True
+            return True
+        except Exception as e:
+            logger.error(f"⚠️ Webhook check failed on attempt {attempt + 1}: {e}")
+            await asyncio.sleep(2 ** attempt)
+    return False
+
+async def warm_coin_list():
+    if not coin_list_cache: # A snapshot already covers startup; the periodic refresher revalidates it
+        await trigger_coin_list_refresh()
+
+async def warm_price_cache(coin_ids: list):
+    if not coin_ids:
+        return
+    try:
+        await price_cache.get_prices(coin_ids)
+        logger.info(f"Price cache warmed for {len(coin_ids)} coins.")
+    except Exception as e:
+        logger.warning(f"⚠️ Price cache warm-up failed: {e!r}")
+
+async def run_startup_pipeline(prefetch_coins: list, fx_warmup: asyncio.Task):
+    """Webhook check and cache warm-up in parallel, then starts processing the held updates."""
+    global bot_ready, leader_watch
+    steps = {
+        asyncio.create_task(ensure_webhook()): "webhook",
+        asyncio.create_task(warm_coin_list()): "coin_list",
+        asyncio.create_task(warm_price_cache(prefetch_coins)): "prices",
+        fx_warmup: "fx_rates",
+    }
+    for task, phase in steps.items():
+        task.add_done_callback(lambda _, phase=phase: mark_startup(phase))
+    _, still_running = await asyncio.wait(steps, timeout=STARTUP_WARMUP_TIMEOUT)
+    if still_running: # Left running in the background; handlers cope with a missing coin list
+        logger.warning(f"⚠️ Startup warm-up still running after {STARTUP_WARMUP_TIMEOUT:.0f}s: {sorted(steps[t] for t in still_running)}. Serving anyway.")
+    bot_ready = True
+    update_scheduler.resume()
+    if is_leader:
+        start_leader_jobs()
+    else:
+        leader_watch = asyncio.create_task(wait_for_leadership())
+    mark_startup("ready")
+
+async def run_fx_refresher(fx_warmup: asyncio.Task):
+    """Periodic exchange rate refreshes after the one in the startup warm-up, retried sooner if that one failed."""
+    ok = await asyncio.shield(fx_warmup)
+    await asyncio.sleep(fx_rates.refresh_interval if ok else FX_RETRY_INTERVAL)
+    await fx_rates.run()
+
+# --- Worker Roles (WEB_WORKERS > 1) ---
+def completed_users() -> list:
+    """(user_id, settings) of every user who finished setup."""
+    return [(uid, data) for uid, data in settings_store.items() if data.get("current_step") == "SETUP_COMPLETE"]
+
+def resync_from_settings(completed: list = None):
+    """Leader: rebuilds the auto-update schedule and the alert book from stored settings."""
+    completed = completed if completed is not None else completed_users()
+    auto_updates.resync((uid, data.get("frequency"), data.get("last_update_at")) for uid, data in completed)
+    alert_book.resync((uid, data.get("alerts")) for uid, data in completed)
+    logger.info(f"Price alerts loaded: {len(alert_book)} on {len(alert_book.coins())} coins.")
+
+def start_leader_jobs():
+    global alert_checker, settings_sync
+    auto_updates.start()
+    alert_checker = asyncio.create_task(check_alerts_periodically())
+    if leader_lock:
+        settings_sync = asyncio.create_task(sync_shared_settings())
+
+async def wait_for_leadership():
+    """Followers: takes over once the leader's lock is free (the leader stopped or crashed)."""
+    global is_leader
+    await leader_lock.wait()
+    is_leader = True
+    logger.info(f"👑 Worker {os.getpid()} is now the leader.")
+    resync_from_settings()
+    start_leader_jobs()
+
+def apply_user_settings(user_id: int, data: dict):
+    """Leader: brings the schedule and alert book in line with settings another worker wrote."""
+    complete = data.get("current_step") == "SETUP_COMPLETE"
+    frequency = data.get("frequency") if complete else None
+    if frequency is None:
+        auto_updates.unsubscribe(user_id)
+    elif auto_updates.frequency(user_id) != frequency:
+        auto_updates.subscribe(user_id, frequency)
+    alert_book.set_user_alerts(user_id, data.get("alerts") if complete else ())
+
+async def sync_shared_settings():
+    """Leader: polls the shared settings for rows changed by any worker (WORKER_SYNC_INTERVAL)."""
+    cursor, applied = time.time(), {} # applied: user_id -> updated_at of the row last applied
+    while True:
+        await asyncio.sleep(WORKER_SYNC_INTERVAL)
+        try:
+            rows = settings_store.changed_since(cursor - WORKER_SYNC_OVERLAP)
+        except Exception as e:
+            logger.error(f"❌ Reading changed settings failed: {e}")
+            continue
+        for user_id, data, updated_at in rows:
+            cursor = max(cursor, updated_at)
+            if applied.get(user_id, 0) >= updated_at:
+                continue
+            applied[user_id] = updated_at
+            apply_user_settings(user_id, data)
+        applied = {uid: ts for uid, ts in applied.items() if ts > cursor - WORKER_SYNC_OVERLAP}
+        if rows:
+            logger.debug("Applied settings of %s users changed by other workers.", len(rows))
+
+async def handle_healthz(request: web.Request) -> web.Response:
+    """Liveness: the process is up and the event loop answers."""
+    return web.json_response({"status": "ok"})
+
+async def handle_readyz(request: web.Request) -> web.Response:
+    """Readiness: 503 until the startup pipeline has finished, so traffic can be gated on it."""
+    body = {
+        "ready": bot_ready,
+        "webhook_registered": webhook_registered,
+        "coin_list_size": len(coin_list_cache) if coin_list_cache else 0,
+        "held_updates": update_scheduler.pending if update_scheduler.paused else 0,
+        "role": "leader" if is_leader else "follower",
+        "startup_seconds": startup_timings,
+    }
+    return web.json_response(body, status=200 if bot_ready else 503)
+
 # --- Webhook Setup & Application Start ---
-async def on_startup(bot_instance: Bot): 
-    logger.info(f"Setting webhook to: {WEBHOOK_URL}")
-    await bot_instance.set_webhook(WEBHOOK_URL, drop_pending_updates=True)
-    asyncio.create_task(load_coin_list()) 
+async def on_startup(bot: Bot): 
+    """Only the fast, local steps run here (aiohttp does not listen until this returns); the rest is run_startup_pipeline."""
+    global coin_list_refresher, fx_refresher, startup_pipeline, is_leader
+    if leader_lock:
+        is_leader = leader_lock.try_acquire()
+        logger.info(f"👷 Worker {os.getpid()} of {WEB_WORKERS} starting as {'leader' if is_leader else 'follower'}.")
+    load_coin_list_snapshot()
+    send_queue.start()
+    await asyncio.gather(settings_store.start(), coingecko.start())
+    coin_list_refresher = asyncio.create_task(refresh_coin_list_periodically())
+    completed = completed_users()
+    if is_leader: # Followers never deliver auto-updates or alerts, so they keep neither
+        resync_from_settings(completed)
+    popular = Counter(coin_id for _, data in completed for coin_id in data.get("coins", []))
+    prefetch_coins = list(dict.fromkeys([c for c, _ in popular.most_common(STARTUP_PREFETCH_COINS)] + alert_book.coins()))
+    fx_warmup = asyncio.create_task(fx_rates.refresh())
+    startup_pipeline = asyncio.create_task(run_startup_pipeline(prefetch_coins, fx_warmup))
+    fx_refresher = asyncio.create_task(run_fx_refresher(fx_warmup))
+    mark_startup("listening")
 
-async def on_shutdown(bot_instance: Bot): 
+async def on_shutdown(bot: Bot): 
     logger.info("Shutting down...")
-    await bot_instance.session.close()
+    if startup_pipeline and not startup_pipeline.done(): startup_pipeline.cancel()
+    if leader_watch: leader_watch.cancel()
+    if settings_sync: settings_sync.cancel()
+    await update_scheduler.close()
+    if coin_list_refresher: coin_list_refresher.cancel()
+    if alert_checker: alert_checker.cancel()
+    if fx_refresher: fx_refresher.cancel()
+    await auto_updates.stop()
+    await send_queue.stop()
+    await settings_store.close()
+    logger.info(f"Send queue stats at shutdown: {send_queue.stats()}")
+    await coingecko.close()
+    await bot.session.close()
+    if leader_lock: leader_lock.release()
 
-if __name__ == "__main__":
-    dp.startup.register(lambda: on_startup(bot))
-    dp.shutdown.register(lambda: on_shutdown(bot))
+def init_worker():
+    """Builds this process's bot, dispatcher and settings store."""
+    global bot, send_queue, dp, settings_store
+    bot_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(TOKEN, session=bot_session, parse_mode=ParseMode.HTML)
+    send_queue = SendQueue(global_rate=SEND_GLOBAL_RATE / WEB_WORKERS)
+    bot.session.middleware(RateLimitMiddleware(send_queue))
+    storage = SqliteFsmStorage() if WEB_WORKERS > 1 else MemoryStorage() # FSM state must be visible to every worker
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateLogContextMiddleware()) # Per-update log context and DEBUG sampling
+    dp.include_router(router)
+    settings_store = create_settings_store(shared=WEB_WORKERS > 1)
+    if WEB_WORKERS > 1:
+        dp.update.outer_middleware(SettingsScopeMiddleware(settings_store)) # Settings are read and written per update
+
+def create_app(handle_in_background: bool = True) -> web.Application:
+    """Builds the worker (init_worker) and the aiohttp app serving WEBHOOK_PATH, with on_startup/on_shutdown
+    wired to its lifecycle.
+
+    handle_in_background=False makes each webhook request wait for its handler (used by benchmarks
+    to measure handler latency end to end).
+    """
+    init_worker()
+    dp.startup.register(on_startup) # aiogram passes `bot` from setup_application's workflow data
+    dp.shutdown.register(on_shutdown)
 
     app = web.Application()
-    webhook_requests_handler = SimpleRequestHandler(
+    webhook_requests_handler = OrderedRequestHandler(
         dispatcher=dp,
         bot=bot,
+        scheduler=update_scheduler,
+        handle_in_background=handle_in_background,
     )
     webhook_requests_handler.register(app, path=WEBHOOK_PATH)
-    web.run_app(app, host="0.0.0.0", port=PORT)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/healthz", handle_healthz)
+    app.router.add_get("/readyz", handle_readyz)
+    setup_application(app, dp, bot=bot)
+    return app
+
+def serve():
+    """One webhook server process; with WEB_WORKERS > 1 every worker binds PORT with SO_REUSEPORT."""
+    web.run_app(create_app(), host="0.0.0.0", port=PORT, reuse_port=WEB_WORKERS > 1)
+
+if __name__ == "__main__":
+    if WEB_WORKERS > 1:
+        run_workers(serve)
+    else:
+        serve()
@@ -0,0 +1,176 @@
+"""Minimal in-process metrics rendered in the Prometheus text format at /metrics.
+
+Recording is a dict lookup plus a couple of additions (no locks, the bot runs on one event loop).
+Values that already exist elsewhere (cache counters, coin list size, queue stats) are read by
+callbacks at scrape time instead of being recorded on the hot path.
+"""
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+
+# Seconds; covers cached replies (ms) up to slow CoinGecko calls hitting the client timeout.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ACTIVE_USER_WINDOWS = (("5m", 300), ("1h", 3600), ("24h", 86400))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {} # labelvalues -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        bounds = self.buckets + (float("inf"),)
+        for labelvalues, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), labelvalues + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackMetric:
+    """Gauge or counter whose value is read at scrape time.
+
+    `func` returns a number, or {labelvalues tuple: number} when `labelnames` is set.
+    """
+
+    def __init__(self, name: str, documentation: str, func, kind: str = "gauge", labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        value = self.func()
+        if value is None:
+            return
+        if not self.labelnames:
+            yield f"{self.name} {_format_value(value)}"
+            return
+        for labelvalues, v in value.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(v)}"
+
+
+class ActiveUsers:
+    """Last-seen time per user; counts users seen within each window at scrape time."""
+
+    def __init__(self, windows=ACTIVE_USER_WINDOWS):
+        self.windows = windows
+        self._last_seen = {}
+
+    def touch(self, user_id: int):
+        self._last_seen[user_id] = time.monotonic()
+
+    def counts(self) -> dict:
+        now = time.monotonic()
+        horizon = max(seconds for _, seconds in self.windows)
+        self._last_seen = {uid: seen for uid, seen in self._last_seen.items() if now - seen <= horizon}
+        return {(label,): sum(1 for seen in self._last_seen.values() if now - seen <= seconds)
+                for label, seconds in self.windows}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    "cryptoday_handler_duration_seconds", "Time spent in each update handler.", ("handler",)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "cryptoday_handler_errors_total", "Update handlers that raised.", ("handler",)))
+COINGECKO_LATENCY = REGISTRY.register(Histogram(
+    "cryptoday_coingecko_request_duration_seconds", "CoinGecko request latency.", ("endpoint",)))
+COINGECKO_RESPONSES = REGISTRY.register(Counter(
+    "cryptoday_coingecko_responses_total", "CoinGecko responses by status (or error/timeout).", ("endpoint", "status")))
+ACTIVE_USERS = ActiveUsers()
+REGISTRY.register(CallbackMetric(
+    "cryptoday_active_users", "Distinct users who sent an update within the window.", ACTIVE_USERS.counts,
+    labelnames=("window",)))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: times the matched handler and marks the sending user as active."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None:
+            ACTIVE_USERS.touch(user.id)
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=REGISTRY.render().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
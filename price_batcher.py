@@ -0,0 +1,96 @@
+"""Micro-batching in front of /simple/price: concurrent requests share one upstream call."""
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRICE_BATCH_WINDOW = float(os.getenv("PRICE_BATCH_WINDOW", 0.05)) # Seconds to collect ids before sending
+PRICE_BATCH_MAX_IDS = int(os.getenv("PRICE_BATCH_MAX_IDS", 250)) # Flush immediately once this many distinct ids wait
+PRICE_BATCH_MAX_IDS_LENGTH = 1800 # Max length of the comma-joined ids query value per request, keeps URLs well under 2k
+
+
+def split_ids(coin_ids: list, max_length: int = PRICE_BATCH_MAX_IDS_LENGTH) -> list:
+    """Splits ids into chunks whose comma-joined length stays within `max_length`."""
+    chunks, current, length = [], [], 0
+    for coin_id in coin_ids:
+        extra = len(coin_id) + (1 if current else 0)
+        if current and length + extra > max_length:
+            chunks.append(current)
+            current, length = [], 0
+            extra = len(coin_id)
+        current.append(coin_id)
+        length += extra
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class PriceBatcher:
+    """Collects coin ids requested within a short window and fetches them in one deduplicated call.
+
+    `fetcher(coin_ids)` is the upstream call (CoinGeckoClient.get_simple_price). Each caller of
+    `fetch()` receives only its own coins; if the chunk holding one of its coins failed, it gets that error.
+    """
+
+    def __init__(self, fetcher, window: float = PRICE_BATCH_WINDOW, max_ids: int = PRICE_BATCH_MAX_IDS,
+                 max_ids_length: int = PRICE_BATCH_MAX_IDS_LENGTH):
+        self.fetcher = fetcher
+        self.window = window
+        self.max_ids = max_ids
+        self.max_ids_length = max_ids_length
+        self._pending = {} # Ordered set of ids waiting for the next flush
+        self._waiters = [] # [(coin_ids, future), ...]
+        self._timer = None
+        self._tasks = set() # Running upstream sends (kept referenced until done)
+        self.requests = 0 # fetch() calls
+        self.upstream_calls = 0
+
+    async def fetch(self, coin_ids) -> dict:
+        coin_ids = list(dict.fromkeys(coin_ids))
+        if not coin_ids:
+            return {}
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests += 1
+        self._waiters.append((coin_ids, future))
+        self._pending.update(dict.fromkeys(coin_ids))
+        if len(self._pending) >= self.max_ids:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._waiters:
+            return
+        coin_ids, waiters = list(self._pending), self._waiters
+        self._pending, self._waiters = {}, []
+        task = asyncio.create_task(self._send(coin_ids, waiters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, coin_ids: list, waiters: list):
+        chunks = split_ids(coin_ids, self.max_ids_length)
+        self.upstream_calls += len(chunks)
+        logger.debug("Price batch: %s requests, %s ids, %s upstream calls.", len(waiters), len(coin_ids), len(chunks))
+        results = await asyncio.gather(*(self.fetcher(chunk) for chunk in chunks), return_exceptions=True)
+
+        data, errors = {}, {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                errors.update(dict.fromkeys(chunk, result))
+            elif isinstance(result, dict):
+                data.update(result)
+
+        for waiter_ids, future in waiters:
+            if future.done():
+                continue
+            error = next((errors[c] for c in waiter_ids if c in errors), None)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result({c: data[c] for c in waiter_ids if c in data})
@@ -0,0 +1,129 @@
+"""Per-coin TTL cache for /simple/price with single-flight request coalescing."""
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", 60)) # Seconds a fetched price is served without refetching
+PRICE_STALE_MAX_AGE = float(os.getenv("PRICE_STALE_MAX_AGE", 6 * 3600)) # Oldest price served (marked stale) when fetching fails
+
+
+class PriceEntry:
+    """Prices for one coin ({"usd": 123.4}) and when they were fetched.
+
+    `stale` is set on copies served in place of a failed refresh.
+    """
+    __slots__ = ("prices", "fetched_at", "stale", "_fetched_monotonic")
+
+    def __init__(self, prices: dict, fetched_at: float = None, stale: bool = False):
+        self.prices = prices
+        self.fetched_at = fetched_at if fetched_at is not None else time.time() # Wall clock, for display
+        self.stale = stale
+        self._fetched_monotonic = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self._fetched_monotonic
+
+    def as_stale(self) -> "PriceEntry":
+        entry = PriceEntry(self.prices, self.fetched_at, stale=True)
+        entry._fetched_monotonic = self._fetched_monotonic
+        return entry
+
+
+class PriceCache:
+    """Serves cached prices and shares one in-flight fetch between concurrent misses.
+
+    `fetcher(coin_ids)` must return the /simple/price payload ({coin_id: {"usd": ...}}).
+    Entries are kept per coin id, so the cache is bounded by the size of the coin list.
+    When a refresh fails (including CircuitOpenError, which never reaches CoinGecko), the last
+    known prices up to `stale_max_age` old are returned marked stale instead of the error.
+    """
+
+    def __init__(self, fetcher, ttl: float = PRICE_CACHE_TTL, stale_max_age: float = PRICE_STALE_MAX_AGE, on_prices=None):
+        self.fetcher = fetcher
+        self.on_prices = on_prices # Optional on_prices(payload, fetched_at) after every successful fetch
+        self.ttl = ttl
+        self.stale_max_age = stale_max_age
+        self._entries = {}
+        self._inflight = {} # coin_id -> Future[PriceEntry | None]
+        self._tasks = set() # Running fetches (kept referenced until done)
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+
+    def peek(self, coin_id: str):
+        """Returns the cached entry for `coin_id` regardless of age, or None."""
+        return self._entries.get(coin_id)
+
+    async def get_prices(self, coin_ids) -> dict:
+        """Returns {coin_id: PriceEntry | None}; None means there is no data for the coin.
+
+        Fetch errors (CircuitOpenError, CoinGeckoError, aiohttp.ClientError, asyncio.TimeoutError)
+        are only raised when none of the requested coins has a stale price to fall back to.
+        """
+        result, waiting, to_fetch = {}, {}, []
+        for coin_id in dict.fromkeys(coin_ids):
+            entry = self._entries.get(coin_id)
+            if entry is not None and entry.age() < self.ttl:
+                self.hits += 1
+                result[coin_id] = entry
+                continue
+            self.misses += 1
+            future = self._inflight.get(coin_id)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[coin_id] = future
+                to_fetch.append(coin_id)
+            waiting[coin_id] = future
+
+        if to_fetch:
+            # Run the fetch as its own task so a cancelled caller doesn't strand the other waiters.
+            task = asyncio.create_task(self._fetch(to_fetch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if waiting:
+            entries = await asyncio.gather(*(asyncio.shield(f) for f in waiting.values()), return_exceptions=True)
+            error = None
+            for coin_id, entry in zip(waiting.keys(), entries):
+                if isinstance(entry, Exception):
+                    error = entry
+                    entry = self._stale(coin_id)
+                result[coin_id] = entry
+            if error is not None:
+                if not any(result.values()):
+                    raise error
+                self.stale_served += 1
+                logger.warning(f"⚠️ Serving stale prices after a failed refresh: {error!r}")
+        return result
+
+    def _stale(self, coin_id: str):
+        entry = self._entries.get(coin_id)
+        return entry.as_stale() if entry is not None and entry.age() < self.stale_max_age else None
+
+    async def _fetch(self, coin_ids: list):
+        try:
+            data = await self.fetcher(coin_ids)
+        except BaseException as e:
+            for coin_id in coin_ids:
+                future = self._inflight.pop(coin_id)
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        fetched_at = time.time()
+        if self.on_prices is not None and isinstance(data, dict):
+            try:
+                self.on_prices(data, fetched_at)
+            except Exception as e:
+                logger.exception(f"Price listener failed: {e}")
+        for coin_id in coin_ids:
+            price_data = data.get(coin_id) if isinstance(data, dict) else None
+            entry = PriceEntry(price_data, fetched_at) if price_data else None
+            if entry is not None:
+                self._entries[coin_id] = entry
+            future = self._inflight.pop(coin_id)
+            if not future.done():
+                future.set_result(entry)
@@ -0,0 +1,138 @@
+"""Per-coin price history in fixed-size NumPy ring buffers, fed by the price fetches the bot already makes."""
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+PRICE_HISTORY_RESOLUTION = float(os.getenv("PRICE_HISTORY_RESOLUTION", 300)) # Seconds per stored point; newer fetches overwrite it
+PRICE_HISTORY_WINDOW = 24 * 3600 # Longest period shown (24h change, min/max, sparkline)
+PRICE_HISTORY_MAX_COINS = int(os.getenv("PRICE_HISTORY_MAX_COINS", 1000)) # Least recently updated coin is dropped beyond this
+SPARKLINE_WIDTH = 12
+SPARKLINE_CHARS = "▁▂▃▄▅▆▇█"
+
+
+class PriceSummary:
+    """Movement of one coin's price over the stored history (None where there is not enough data)."""
+    __slots__ = ("change_1h", "change_24h", "low_24h", "high_24h", "sparkline")
+
+    def __init__(self, change_1h=None, change_24h=None, low_24h=None, high_24h=None, sparkline=""):
+        self.change_1h = change_1h
+        self.change_24h = change_24h
+        self.low_24h = low_24h
+        self.high_24h = high_24h
+        self.sparkline = sparkline
+
+
+class PriceHistory:
+    """One row of two preallocated arrays (timestamps, prices) per tracked coin.
+
+    Memory is fixed at `max_coins * points * 16` bytes (~4.6 MB with the defaults) no matter how
+    long the bot runs: each row is a ring of `points` slots, one per `resolution` seconds, and
+    rows are reused for new coins in least-recently-updated order.
+    """
+
+    def __init__(self, max_coins: int = PRICE_HISTORY_MAX_COINS, resolution: float = PRICE_HISTORY_RESOLUTION,
+                 window: float = PRICE_HISTORY_WINDOW):
+        self.resolution = resolution
+        self.window = window
+        self.points = int(window // resolution) + 1
+        self.max_coins = max_coins
+        self._times = np.zeros((max_coins, self.points), dtype=np.float64)
+        self._prices = np.zeros((max_coins, self.points), dtype=np.float64)
+        self._head = np.zeros(max_coins, dtype=np.int64) # Slot of the latest point
+        self._count = np.zeros(max_coins, dtype=np.int64)
+        self._rows = OrderedDict() # coin_id -> row, least recently updated first
+        self._free = list(range(max_coins - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _row(self, coin_id: str) -> int:
+        row = self._rows.get(coin_id)
+        if row is not None:
+            self._rows.move_to_end(coin_id)
+            return row
+        row = self._free.pop() if self._free else self._rows.popitem(last=False)[1]
+        self._count[row] = 0
+        self._rows[coin_id] = row
+        return row
+
+    def record(self, coin_id: str, price: float, timestamp: float = None):
+        """Adds a price; in the same `resolution`-sized time bucket as the latest point it replaces that point."""
+        timestamp = timestamp if timestamp is not None else time.time()
+        row = self._row(coin_id)
+        head, count = self._head[row], self._count[row]
+        if count:
+            last_time = self._times[row, head]
+            if timestamp < last_time:
+                return
+            if timestamp // self.resolution != last_time // self.resolution: # New time bucket
+                head = (head + 1) % self.points
+                self._head[row] = head
+                self._count[row] = min(count + 1, self.points)
+        else:
+            self._count[row] = 1
+        self._times[row, head] = timestamp
+        self._prices[row, head] = price
+
+    def record_many(self, prices: dict, timestamp: float = None, currency: str = "usd"):
+        """Records a /simple/price payload ({coin_id: {"usd": ...}})."""
+        for coin_id, values in prices.items():
+            price = values.get(currency) if isinstance(values, dict) else None
+            if isinstance(price, (int, float)) and price > 0:
+                self.record(coin_id, float(price), timestamp)
+
+    def series(self, coin_id: str):
+        """(timestamps, prices) oldest first, as arrays (empty if the coin is not tracked)."""
+        row = self._rows.get(coin_id)
+        if row is None or not self._count[row]:
+            return np.empty(0), np.empty(0)
+        count = self._count[row]
+        order = (self._head[row] - count + 1 + np.arange(count)) % self.points
+        return self._times[row, order], self._prices[row, order]
+
+    def summary(self, coin_id: str, now: float = None) -> PriceSummary:
+        times, prices = self.series(coin_id)
+        if len(prices) < 2:
+            return PriceSummary()
+        now = now if now is not None else times[-1]
+        latest = prices[-1]
+        recent = times >= now - self.window
+        window_prices = prices[recent]
+        return PriceSummary(
+            change_1h=self._change(times, prices, now, 3600, latest),
+            change_24h=self._change(times, prices, now, self.window, latest),
+            low_24h=float(window_prices.min()) if len(window_prices) else None,
+            high_24h=float(window_prices.max()) if len(window_prices) else None,
+            sparkline=self._sparkline(times[recent], window_prices, now),
+        )
+
+    def _change(self, times, prices, now: float, period: float, latest: float):
+        """% change over `period`, from the last point at or before its start.
+
+        The reference point may be up to a quarter of the period off (prices are only fetched
+        when someone asks): before the start if that is the nearest older point, after it if
+        history begins later. Otherwise there is not enough history and None is returned.
+        """
+        since, slack = now - period, max(self.resolution, period / 4)
+        index = np.searchsorted(times, since, side="right") - 1
+        if index < 0 and times[0] <= since + slack:
+            index = 0
+        if index < 0 or index == len(times) - 1 or times[index] < since - slack:
+            return None
+        return float((latest - prices[index]) / prices[index] * 100)
+
+    def _sparkline(self, times, prices, now: float) -> str:
+        if len(prices) < 2:
+            return ""
+        # Last price at or before the end of each bin; bins before the first point are dropped.
+        edges = now - self.window + (np.arange(1, SPARKLINE_WIDTH + 1) * self.window / SPARKLINE_WIDTH)
+        indexes = np.searchsorted(times, edges, side="right") - 1
+        values = prices[indexes[indexes >= 0]]
+        low, high = values.min(), values.max()
+        if high == low:
+            levels = np.full(len(values), len(SPARKLINE_CHARS) // 2 - 1)
+        else:
+            levels = np.rint((values - low) / (high - low) * (len(SPARKLINE_CHARS) - 1)).astype(np.int64)
+        return "".join(SPARKLINE_CHARS[level] for level in levels)
@@ -0,0 +1,70 @@
+"""Skips Telegram edits that would not change a message, and stops "not modified" from turning into new messages."""
+import os
+import logging
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+RENDER_FINGERPRINT_CACHE = int(os.getenv("RENDER_FINGERPRINT_CACHE", 50000)) # Messages whose last render is remembered
+
+
+def fingerprint(text: str, keyboard=None) -> int:
+    """Hash of what a message shows: its text and its buttons' labels and actions."""
+    buttons = ()
+    if keyboard is not None:
+        buttons = tuple(tuple((b.text, b.callback_data, b.url) for b in row) for row in keyboard.inline_keyboard)
+    return hash((text, buttons))
+
+
+class MessageFingerprints:
+    """Last rendered fingerprint per (chat_id, message_id), LRU-bounded."""
+
+    def __init__(self, max_size: int = RENDER_FINGERPRINT_CACHE):
+        self.max_size = max_size
+        self._fingerprints = OrderedDict()
+        self.skipped = 0
+        self.edited = 0
+        self.resent = 0
+
+    def get(self, chat_id, message_id):
+        return self._fingerprints.get((chat_id, message_id))
+
+    def remember(self, chat_id, message_id, value: int):
+        key = (chat_id, message_id)
+        self._fingerprints[key] = value
+        self._fingerprints.move_to_end(key)
+        if len(self._fingerprints) > self.max_size:
+            self._fingerprints.popitem(last=False)
+
+    async def edit_or_send(self, message, text: str, reply_markup=None, **kwargs) -> bool:
+        """Edits `message` to show `text`/`reply_markup` unless it already does; returns False if skipped.
+
+        Only a real edit failure (deleted or too old message, ...) sends a new message instead;
+        "message is not modified" counts as already rendered.
+        """
+        chat_id, value = message.chat.id, fingerprint(text, reply_markup)
+        if self.get(chat_id, message.message_id) == value:
+            self.skipped += 1
+            return False
+        try:
+            await message.edit_text(text, reply_markup=reply_markup, **kwargs)
+        except Exception as e:
+            if isinstance(e, TelegramBadRequest) and "message is not modified" in str(e):
+                self.skipped += 1
+                self.remember(chat_id, message.message_id, value)
+                return False
+            logger.warning(f"⚠️ Could not edit message {message.message_id} in chat {chat_id}, sending a new one: {e}")
+            self.resent += 1
+            return await self.send(message, text, reply_markup, **kwargs)
+        self.edited += 1
+        self.remember(chat_id, message.message_id, value)
+        return True
+
+    async def send(self, message, text: str, reply_markup=None, **kwargs) -> bool:
+        """Sends a new message to `message`'s chat and remembers what it shows."""
+        sent = await message.answer(text, reply_markup=reply_markup, **kwargs)
+        if sent is not None:
+            self.remember(sent.chat.id, sent.message_id, fingerprint(text, reply_markup))
+        return True
@@ -0,0 +1,194 @@
+"""Delivery engine for the frequency-based auto-updates (2h/12h/24h)."""
+import time
+import heapq
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+FREQUENCY_SECONDS = {"2h": 2 * 3600, "12h": 12 * 3600, "24h": 24 * 3600}
+DELIVERY_CONCURRENCY = 50 # Deliveries started at once within a tick
+SLOT_STEP = 300 # Seconds between the slots users of one frequency are spread over
+MISSED_SLOT_WINDOW = 900 # Seconds over which updates missed while the bot was down are spread after a restart
+
+
+def slot_offset(user_id: int, frequency: str) -> float:
+    """Fixed per-user offset within the period, a multiple of SLOT_STEP.
+
+    Spreads subscribers over the period instead of waking all of them at midnight UTC, while
+    users with the same offset still share one bucket.
+    """
+    steps = FREQUENCY_SECONDS[frequency] // SLOT_STEP
+    return (user_id * 2654435761 % 2 ** 32) % steps * SLOT_STEP
+
+
+def next_slot(frequency: str, now: float, user_id: int = 0) -> float:
+    """Next due time of `user_id` for `frequency`: a period boundary shifted by slot_offset()."""
+    period, offset = FREQUENCY_SECONDS[frequency], slot_offset(user_id, frequency)
+    return (int((now - offset) // period) + 1) * period + offset
+
+
+class AutoUpdateScheduler:
+    """Min-heap of due times, each pointing at a bucket (set) of user ids due at that time.
+
+    One background task sleeps until the earliest bucket is due, reschedules its users and hands
+    the tick to a delivery task, which fetches prices once for the union of all due users' coins and
+    then delivers to each user; the next bucket is not held up by a slow delivery. Memory is one set
+    entry per subscriber; no per-user tasks or timers are created.
+
+    get_coins(user_ids) -> awaitable {user_id: coin ids}; users left out no longer get updates
+    fetch_prices(coin_ids) -> {coin_id: PriceEntry | None}
+    deliver(user_id, coin_ids, price_entries) -> awaitable
+    """
+
+    def __init__(self, get_coins, fetch_prices, deliver, concurrency: int = DELIVERY_CONCURRENCY):
+        self.get_coins = get_coins
+        self.fetch_prices = fetch_prices
+        self.deliver = deliver
+        self.concurrency = concurrency
+        self._heap = []      # Distinct due timestamps
+        self._buckets = {}   # due timestamp -> set of user ids
+        self._user_due = {}  # user id -> (due timestamp, frequency)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._ticks = set() # Running tick deliveries (kept referenced until done)
+        self._stopping = False
+
+    def __len__(self):
+        return len(self._user_due)
+
+    def subscribe(self, user_id: int, frequency: str, due: float = None):
+        """(Re)schedules `user_id`; `due` defaults to the user's next slot for `frequency`."""
+        if frequency not in FREQUENCY_SECONDS:
+            self.unsubscribe(user_id)
+            return
+        self.unsubscribe(user_id)
+        due = due if due is not None else next_slot(frequency, time.time(), user_id)
+        bucket = self._buckets.get(due)
+        if bucket is None:
+            bucket = self._buckets[due] = set()
+            heapq.heappush(self._heap, due)
+            if self._heap[0] == due:
+                self._wakeup.set() # New earliest bucket, the loop must shorten its sleep
+        bucket.add(user_id)
+        self._user_due[user_id] = (due, frequency)
+
+    def frequency(self, user_id: int):
+        """The frequency `user_id` is scheduled with, or None."""
+        scheduled = self._user_due.get(user_id)
+        return scheduled[1] if scheduled is not None else None
+
+    def unsubscribe(self, user_id: int):
+        scheduled = self._user_due.pop(user_id, None)
+        if scheduled is not None:
+            bucket = self._buckets.get(scheduled[0])
+            if bucket is not None:
+                bucket.discard(user_id) # Empty buckets are dropped lazily when they come due
+
+    def resync(self, users, now: float = None):
+        """Rebuilds the schedule from stored settings after a restart.
+
+        `users` yields (user_id, frequency, last_update_at). Users whose slot passed while the bot
+        was down get their update within MISSED_SLOT_WINDOW instead of waiting a whole period, spread
+        by their slot offsets rather than all at once.
+        """
+        now = now if now is not None else time.time()
+        count = 0
+        for user_id, frequency, last_update_at in users:
+            if frequency not in FREQUENCY_SECONDS:
+                continue
+            due = next_slot(frequency, now, user_id)
+            if last_update_at and due - FREQUENCY_SECONDS[frequency] > last_update_at: # A slot was missed during downtime
+                due = now + slot_offset(user_id, frequency) / FREQUENCY_SECONDS[frequency] * MISSED_SLOT_WINDOW
+            self.subscribe(user_id, frequency, due)
+            count += 1
+        logger.info(f"Auto-update schedule re-synced: {count} subscribers, {len(self._buckets)} buckets.")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # The flag covers a cancel racing with a wakeup, which wait_for() may swallow on 3.11.
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for tick in list(self._ticks):
+            tick.cancel()
+        await asyncio.gather(*self._ticks, return_exceptions=True)
+
+    def _take_due(self, now: float) -> list:
+        """Pops every bucket due at `now` and reschedules its users; returns [(user_id, frequency, next due)]."""
+        due_users = []
+        while self._heap and self._heap[0] <= now:
+            due = heapq.heappop(self._heap)
+            for user_id in self._buckets.pop(due, ()):
+                scheduled = self._user_due.get(user_id)
+                if scheduled is not None and scheduled[0] == due:
+                    frequency = scheduled[1]
+                    self.subscribe(user_id, frequency, next_slot(frequency, now, user_id))
+                    due_users.append((user_id, frequency, self._user_due[user_id][0]))
+        return due_users
+
+    async def _run(self):
+        while not self._stopping:
+            delay = self._heap[0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due_users = self._take_due(time.time())
+            if due_users:
+                tick = asyncio.create_task(self._deliver_tick(due_users))
+                self._ticks.add(tick)
+                tick.add_done_callback(self._ticks.discard)
+
+    async def run_tick(self, now: float):
+        """Delivers to every user due at `now` with a single batched price fetch."""
+        due_users = self._take_due(now)
+        if due_users:
+            await self._deliver_tick(due_users)
+
+    async def _deliver_tick(self, due_users: list):
+        try:
+            await self._deliver(due_users)
+        except Exception as e:
+            logger.exception(f"Auto-update tick failed: {e}")
+
+    async def _deliver(self, due_users: list):
+        coins_by_user = await self.get_coins([user_id for user_id, _, _ in due_users])
+        users_coins = []
+        for user_id, frequency, due in due_users:
+            coins = coins_by_user.get(user_id)
+            if coins:
+                users_coins.append((user_id, coins))
+            elif self._user_due.get(user_id) == (due, frequency): # Not rescheduled since; settings say no updates
+                self.unsubscribe(user_id)
+
+        all_coins = list(dict.fromkeys(c for _, coins in users_coins for c in coins))
+        logger.info(f"Auto-update tick: {len(users_coins)} users, {len(all_coins)} distinct coins.")
+        if not all_coins:
+            return
+        try:
+            price_entries = await self.fetch_prices(all_coins)
+        except Exception as e:
+            logger.error(f"Auto-update tick: price fetch failed, skipping this slot: {e}")
+            return
+
+        for start in range(0, len(users_coins), self.concurrency):
+            chunk = users_coins[start:start + self.concurrency]
+            results = await asyncio.gather(
+                *(self.deliver(user_id, coins, {c: price_entries.get(c) for c in coins}) for user_id, coins in chunk),
+                return_exceptions=True)
+            for (user_id, _), result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    logger.error(f"[User {user_id}] Auto-update delivery failed: {result}")
@@ -0,0 +1,254 @@
+"""Outbound Telegram dispatch queue with global and per-chat rate limiting."""
+import os
+import time
+import asyncio
+import logging
+import itertools
+import contextvars
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup, EditMessageText
+
+logger = logging.getLogger(__name__)
+
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30)) # Messages per second across all chats
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1)) # Messages per second to one chat
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", 3)) # Short bursts allowed per chat (e.g. edit + reply)
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", 8)) # Requests to Telegram in flight at once
+SEND_MAX_RETRIES = 3 # Retries after 429 before the error is returned to the caller
+
+PRIORITY_INTERACTIVE = 0 # Replies to what a user just did
+PRIORITY_BULK = 1 # Scheduled updates, alerts, broadcasts
+
+# Priority used for Telegram requests made in the current context; bulk senders set PRIORITY_BULK.
+send_priority = contextvars.ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+# Edits of the bot's own messages; at interactive priority they follow the user's taps and skip the per-chat limit.
+EDIT_METHODS = (EditMessageText, EditMessageReplyMarkup, EditMessageCaption, EditMessageMedia)
+
+
+class SendQueueClosed(RuntimeError):
+    """The queue was stopped before the request was sent."""
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, now: float) -> float:
+        """Takes one token, going into debt if needed; returns how long the caller must wait."""
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def block(self, now: float, seconds: float):
+        """No tokens for `seconds` (server asked us to back off)."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("chat_id", "factory", "priority", "future", "per_chat", "attempts")
+
+    def __init__(self, chat_id, factory, priority, future, per_chat):
+        self.chat_id = chat_id
+        self.factory = factory
+        self.priority = priority
+        self.future = future
+        self.per_chat = per_chat
+        self.attempts = 0
+
+
+class SendQueue:
+    """Priority queue of outbound requests drained by a fixed pool of workers.
+
+    Interactive jobs always go before bulk ones. A job whose chat is over its limit is parked until
+    the chat bucket refills instead of blocking a worker. Errors carrying `retry_after` (aiogram's
+    TelegramRetryAfter) park the chat for that long and retry the job. Jobs submitted with
+    `per_chat=False` only count against the global limit, unless the chat is backing off.
+    stop() fails every job that has not been sent with SendQueueClosed.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 chat_burst: int = SEND_CHAT_BURST, concurrency: int = SEND_CONCURRENCY,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate, time.monotonic())
+        self._chats = {}
+        self._queue = asyncio.PriorityQueue()
+        self._queued = [0, 0] # Jobs waiting per priority (interactive, bulk)
+        self._seq = itertools.count()
+        self._workers = []
+        self._parked = {} # TimerHandle -> parked job
+        self._stopped = False
+        self._in_flight = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.throttled_seconds = 0.0 # Total time jobs spent waiting on the global or per-chat limits
+
+    def start(self):
+        if not self._workers:
+            self._stopped = False
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        self._stopped = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        pending = list(self._parked.values())
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait()[2])
+        for handle in self._parked:
+            handle.cancel()
+        self._parked.clear()
+        self._queued = [0, 0]
+        for job in pending:
+            self._fail_closed(job)
+        if pending:
+            logger.warning(f"Send queue stopped with {len(pending)} unsent requests.")
+
+    @staticmethod
+    def _fail_closed(job: _Job):
+        if not job.future.done():
+            job.future.set_exception(SendQueueClosed("Send queue stopped before the request was sent."))
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def stats(self) -> dict:
+        return {
+            "queued_interactive": self._queued[0], "queued_bulk": self._queued[1], "parked": len(self._parked),
+            "in_flight": self._in_flight, "sent": self.sent, "retried": self.retried, "failed": self.failed,
+            "throttled_seconds": round(self.throttled_seconds, 3), "tracked_chats": len(self._chats),
+        }
+
+    def submit(self, chat_id, factory, priority: int = PRIORITY_INTERACTIVE, per_chat: bool = True) -> asyncio.Future:
+        """Queues `factory()` (a zero-argument callable returning an awaitable) and returns its future."""
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(chat_id, factory, priority, future, per_chat)
+        if self._stopped:
+            self._fail_closed(job)
+        else:
+            self._push(job)
+        return future
+
+    async def send(self, chat_id, factory, priority: int = PRIORITY_INTERACTIVE, per_chat: bool = True):
+        return await self.submit(chat_id, factory, priority, per_chat)
+
+    def _push(self, job: _Job):
+        self._queued[min(job.priority, 1)] += 1
+        self._queue.put_nowait((job.priority, next(self._seq), job))
+
+    def _park(self, job: _Job, delay: float):
+        self.throttled_seconds += delay
+
+        def _unpark():
+            self._parked.pop(handle, None)
+            if self._stopped:
+                self._fail_closed(job)
+            else:
+                self._push(job)
+        handle = asyncio.get_running_loop().call_later(delay, _unpark)
+        self._parked[handle] = job
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 10000:
+                self._chats = {c: b for c, b in self._chats.items() if not b.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            self._queued[min(job.priority, 1)] -= 1
+            if job.future.done(): # Caller gave up
+                continue
+            try:
+                await self._run(job)
+            except asyncio.CancelledError: # stop() while the job was being sent
+                self._fail_closed(job)
+                raise
+
+    async def _run(self, job: _Job):
+        now = time.monotonic()
+        chat_bucket = self._chat_bucket(job.chat_id, now)
+        chat_wait = chat_bucket.wait_time(now) if job.per_chat else max(0.0, chat_bucket.blocked_until - now)
+        if chat_wait > 0:
+            self._park(job, chat_wait)
+            return
+        if job.per_chat:
+            chat_bucket.reserve(now)
+        global_wait = self._global.reserve(now)
+        if global_wait > 0:
+            self.throttled_seconds += global_wait
+            await asyncio.sleep(global_wait)
+
+        self._in_flight += 1
+        try:
+            result = await job.factory()
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is not None and job.attempts < self.max_retries:
+                job.attempts += 1
+                self.retried += 1
+                logger.warning(f"Telegram flood limit for chat {job.chat_id}, retrying in {retry_after}s (attempt {job.attempts}).")
+                chat_bucket.block(time.monotonic(), retry_after)
+                self._park(job, retry_after)
+            else:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight -= 1
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Routes every Telegram request that targets a chat through the SendQueue.
+
+    Requests without a chat_id (answerCallbackQuery, setWebhook, ...) are not chat messages
+    and go straight through.
+    """
+
+    def __init__(self, queue: SendQueue):
+        self.queue = queue
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not self.queue.running:
+            return await make_request(bot, method)
+        priority = send_priority.get()
+        per_chat = not (priority == PRIORITY_INTERACTIVE and isinstance(method, EDIT_METHODS))
+        return await self.queue.send(chat_id, lambda: make_request(bot, method), priority, per_chat)
@@ -0,0 +1,433 @@
+"""Pluggable user settings storage: in-memory, or SQLite (WAL) with an LRU and write-behind flushing.
+
+The SQLite store can also be shared by several worker processes (see workers.py), together with
+SqliteFsmStorage for aiogram's FSM state.
+"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_BACKEND = os.getenv("SETTINGS_BACKEND", "sqlite") # "sqlite" or "memory"
+SETTINGS_DB_PATH = os.getenv("SETTINGS_DB_PATH", "settings.db")
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", 10000)) # Users kept decoded in memory
+SETTINGS_FLUSH_INTERVAL = float(os.getenv("SETTINGS_FLUSH_INTERVAL", 1.0)) # Seconds between write-behind flushes
+SETTINGS_FLUSH_BATCH = 500 # Flush early once this many users are dirty
+SETTINGS_READ_BATCH = 500 # Users per SELECT in bulk reads
+
+
+class SettingsStore(ABC):
+    """Interface used by get_user_data. Settings are plain dicts that handlers mutate in place;
+    callers report mutations with mark_dirty() so the backend can persist them."""
+
+    @abstractmethod
+    def get(self, user_id: int):
+        """Returns the user's settings dict, or None if the user is unknown."""
+
+    @abstractmethod
+    def setdefault(self, user_id: int, default: dict) -> dict:
+        """Returns the user's settings, storing `default` first if the user is unknown."""
+
+    async def get_many(self, user_ids) -> dict:
+        """{user_id: settings} for the known users among `user_ids` (bulk reads such as scheduled deliveries)."""
+        result = {}
+        for user_id in user_ids:
+            data = self.get(user_id)
+            if data is not None:
+                result[user_id] = data
+        return result
+
+    def mark_dirty(self, user_id: int, data: dict = None):
+        """Records that `user_id`'s settings changed; `data` is the dict the caller mutated."""
+        pass
+
+    @abstractmethod
+    def items(self):
+        """Yields (user_id, settings) for every stored user."""
+
+    @abstractmethod
+    async def update(self, user_id: int, change):
+        """Applies `change(settings)` to the user's current settings and persists the result.
+
+        For writes after an await outside a handler (deliveries), where a dict read earlier may be
+        stale. `change` must be idempotent: the SQLite store may apply it to two copies.
+        """
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemorySettingsStore(SettingsStore):
+    """Process-local dict; everything is lost on restart. Used for tests and local runs."""
+
+    def __init__(self):
+        self._data = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, user_id: int):
+        return self._data.get(user_id)
+
+    def setdefault(self, user_id: int, default: dict) -> dict:
+        return self._data.setdefault(user_id, default)
+
+    def items(self):
+        return iter(list(self._data.items()))
+
+    async def update(self, user_id: int, change):
+        data = self._data.get(user_id)
+        if data is not None:
+            change(data)
+
+
+class SqliteSettingsStore(SettingsStore):
+    """SQLite in WAL mode behind an in-memory LRU of decoded settings.
+
+    mark_dirty() only records the user id; a background task serializes dirty users on the event
+    loop and writes them in one transaction from a worker thread, so handlers never wait on disk.
+    Dirty users evicted from the LRU keep their serialized row until the next flush.
+
+    With `shared=True` (several processes on one file) a user's settings stay in memory only while
+    one of their updates is handled here (enter()/leave(), see SettingsScopeMiddleware) or while
+    they have unwritten changes; every other read goes to the file. leave() writes the user's
+    changes at once, and changes made outside an update (auto-updates, alerts) are flushed right away.
+    """
+
+    def __init__(self, path: str = SETTINGS_DB_PATH, cache_size: int = SETTINGS_CACHE_SIZE,
+                 flush_interval: float = SETTINGS_FLUSH_INTERVAL, flush_batch: int = SETTINGS_FLUSH_BATCH,
+                 shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._scopes = {} # user_id -> updates of the user being handled in this process (shared mode)
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._evicted = {} # user_id -> serialized settings waiting to be written
+        self._write_lock = threading.Lock()
+        self._reader = _connect(path)
+        self._writer = _connect(path, check_same_thread=False)
+        self._bulk_reader = _connect(path, check_same_thread=False) # get_many() reads from worker threads
+        self._bulk_lock = threading.Lock()
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS user_settings ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+        self._writer.commit()
+        self._flush_now = None
+        self._task = None
+        self._closing = False
+        self.flushes = 0
+        self.rows_written = 0
+
+    def __len__(self):
+        return self._reader.execute("SELECT COUNT(*) FROM user_settings").fetchone()[0]
+
+    def _cached(self, user_id: int) -> bool:
+        """Whether the in-memory copy may be used (always, unless another process may have changed it)."""
+        return not self.shared or user_id in self._scopes or user_id in self._dirty
+
+    def get(self, user_id: int):
+        data = self._cache.get(user_id)
+        if data is not None and self._cached(user_id):
+            self._cache.move_to_end(user_id)
+            return data
+        raw = self._evicted.get(user_id)
+        if raw is None:
+            row = self._reader.execute("SELECT data FROM user_settings WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            raw = row[0]
+        data = json.loads(raw)
+        if self._cached(user_id):
+            self._remember(user_id, data)
+        return data
+
+    async def get_many(self, user_ids) -> dict:
+        """Rows not held in memory are read and decoded in a worker thread; nothing is added to the LRU."""
+        result, missing = {}, []
+        for user_id in user_ids:
+            data = self._cache.get(user_id)
+            if data is not None and self._cached(user_id):
+                result[user_id] = data
+            elif user_id in self._evicted:
+                result[user_id] = json.loads(self._evicted[user_id])
+            else:
+                missing.append(user_id)
+        if missing:
+            rows = await asyncio.to_thread(self._read_many, missing)
+            for user_id, data in rows.items():
+                cached = self._cache.get(user_id)
+                result[user_id] = cached if cached is not None and self._cached(user_id) else data # Changed meanwhile
+        return result
+
+    def _read_many(self, user_ids: list) -> dict:
+        result = {}
+        with self._bulk_lock:
+            for start in range(0, len(user_ids), SETTINGS_READ_BATCH):
+                chunk = user_ids[start:start + SETTINGS_READ_BATCH]
+                rows = self._bulk_reader.execute(
+                    f"SELECT user_id, data FROM user_settings WHERE user_id IN ({','.join('?' * len(chunk))})", chunk)
+                result.update((user_id, json.loads(raw)) for user_id, raw in rows)
+        return result
+
+    def setdefault(self, user_id: int, default: dict) -> dict:
+        data = self.get(user_id)
+        if data is None:
+            data = default
+            self._remember(user_id, data)
+            self.mark_dirty(user_id)
+        return data
+
+    def mark_dirty(self, user_id: int, data: dict = None):
+        if user_id not in self._cache:
+            if data is None:
+                return
+            self._remember(user_id, data) # Evicted while the handler was still using it
+        self._dirty.add(user_id)
+        if self._flush_now is not None and (len(self._dirty) >= self.flush_batch or
+                                            (self.shared and user_id not in self._scopes)):
+            self._flush_now.set()
+
+    def enter(self, user_id: int):
+        self._scopes[user_id] = self._scopes.get(user_id, 0) + 1
+
+    async def leave(self, user_id: int):
+        """Ends an update of `user_id`: writes their pending changes now and forgets the in-memory copy."""
+        remaining = self._scopes.pop(user_id, 1) - 1
+        if remaining:
+            self._scopes[user_id] = remaining
+            return
+        if user_id in self._dirty:
+            self._dirty.discard(user_id)
+            raw = json.dumps(self._cache[user_id], ensure_ascii=False)
+            try:
+                await asyncio.to_thread(self._write, [(user_id, raw)])
+                self.rows_written += 1
+            except Exception as e:
+                logger.error(f"Failed to write settings of user {user_id}, will retry: {e}")
+                if user_id not in self._dirty:
+                    self._evicted.setdefault(user_id, raw)
+        if user_id not in self._scopes and user_id not in self._dirty:
+            self._cache.pop(user_id, None)
+
+    async def update(self, user_id: int, change):
+        if self._cached(user_id): # The in-memory copy is the current one
+            data = self.get(user_id)
+            if data is not None:
+                change(data)
+                self.mark_dirty(user_id)
+            return
+        raw = self._evicted.get(user_id)
+        if raw is not None: # A failed write waiting for a retry; it will replace the row
+            data = json.loads(raw)
+            change(data)
+            self._evicted[user_id] = json.dumps(data, ensure_ascii=False)
+            return
+        if await asyncio.to_thread(self._update_row, user_id, change):
+            self.rows_written += 1
+        data = self._cache.get(user_id)
+        if data is not None and self._cached(user_id):
+            change(data) # An update of the user started here meanwhile and may have read the old row
+
+    def changed_since(self, since: float) -> list:
+        """(user_id, settings, updated_at) of rows written after `since`, oldest first."""
+        rows = self._reader.execute(
+            "SELECT user_id, data, updated_at FROM user_settings WHERE updated_at > ? ORDER BY updated_at", (since,))
+        return [(user_id, json.loads(raw), updated_at) for user_id, raw, updated_at in rows]
+
+    def items(self):
+        pending = {uid: json.loads(raw) for uid, raw in self._evicted.items()}
+        pending.update((uid, self._cache[uid]) for uid in self._dirty)
+        yield from pending.items()
+        for user_id, raw in self._reader.execute("SELECT user_id, data FROM user_settings"):
+            if user_id not in pending:
+                yield user_id, (self._cache.get(user_id) if self._cached(user_id) else None) or json.loads(raw)
+
+    def _remember(self, user_id: int, data: dict):
+        if self._evicted.pop(user_id, None) is not None:
+            self._dirty.add(user_id) # Its pending write now comes from the cached copy
+        self._cache[user_id] = data
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            old_id, old_data = self._cache.popitem(last=False)
+            if old_id in self._dirty:
+                self._dirty.discard(old_id)
+                self._evicted[old_id] = json.dumps(old_data, ensure_ascii=False)
+
+    def _take_batch(self) -> list:
+        rows = [(uid, json.dumps(self._cache[uid], ensure_ascii=False)) for uid in self._dirty]
+        rows.extend(self._evicted.items())
+        self._dirty.clear()
+        self._evicted.clear()
+        return rows
+
+    def _write(self, rows: list):
+        now = time.time()
+        with self._write_lock:
+            self._writer.executemany(
+                "INSERT INTO user_settings (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(user_id, raw, now) for user_id, raw in rows])
+            self._writer.commit()
+
+    def _update_row(self, user_id: int, change) -> bool:
+        """Read-modify-write of one row in a single transaction, so no other process writes in between."""
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._writer.execute("SELECT data FROM user_settings WHERE user_id = ?", (user_id,)).fetchone()
+                if row is not None:
+                    data = json.loads(row[0])
+                    change(data)
+                    self._writer.execute("UPDATE user_settings SET data = ?, updated_at = ? WHERE user_id = ?",
+                                         (json.dumps(data, ensure_ascii=False), time.time(), user_id))
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+        return row is not None
+
+    async def flush(self):
+        rows = self._take_batch()
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(rows)} user settings, will retry: {e}")
+            for user_id, raw in rows: # Re-queue unless the user changed again meanwhile
+                if user_id not in self._dirty:
+                    self._evicted.setdefault(user_id, raw)
+            return
+        self.flushes += 1
+        self.rows_written += len(rows)
+
+    async def start(self):
+        if self._task is None:
+            self._flush_now = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def close(self):
+        if self._task is not None:
+            self._closing = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        rows = self._take_batch()
+        if rows:
+            self._write(rows)
+        logger.info(f"Settings store closed ({self.rows_written + len(rows)} rows written in total).")
+        self._reader.close()
+        self._writer.close()
+        self._bulk_reader.close()
+
+
+def _connect(path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class SettingsScopeMiddleware(BaseMiddleware):
+    """Outer update middleware for a shared store: the sender's settings are read once per update
+    and written as soon as it has been handled, so their next update can go to any worker."""
+
+    def __init__(self, store: SqliteSettingsStore):
+        self.store = store
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        self.store.enter(user.id)
+        try:
+            return await handler(event, data)
+        finally:
+            await self.store.leave(user.id)
+
+
+class SqliteFsmStorage(BaseStorage):
+    """aiogram FSM storage in the settings database, so every worker process sees the same state.
+
+    Rows are tiny and written on the event loop; the handlers keep their own flow state in the
+    user settings, so FSM calls are rare.
+    """
+
+    def __init__(self, path: str = SETTINGS_DB_PATH):
+        self._conn = _connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS fsm_state ("
+                           "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}')")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _row(self, key: StorageKey):
+        return self._conn.execute("SELECT state, data FROM fsm_state WHERE key = ?", (self._key(key),)).fetchone()
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        state = state.state if isinstance(state, State) else state
+        self._conn.execute("INSERT INTO fsm_state (key, state) VALUES (?, ?) "
+                           "ON CONFLICT(key) DO UPDATE SET state = excluded.state", (self._key(key), state))
+        self._conn.commit()
+
+    async def get_state(self, key: StorageKey):
+        row = self._row(key)
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        self._conn.execute("INSERT INTO fsm_state (key, data) VALUES (?, ?) "
+                           "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+                           (self._key(key), json.dumps(data, ensure_ascii=False)))
+        self._conn.commit()
+
+    async def get_data(self, key: StorageKey) -> dict:
+        row = self._row(key)
+        return json.loads(row[1]) if row else {}
+
+    async def close(self) -> None:
+        # aiogram calls this before on_shutdown has drained the queued updates, which still read
+        # state; the connection is left to close with the process.
+        self._conn.commit()
+
+
+def create_settings_store(backend: str = SETTINGS_BACKEND, path: str = SETTINGS_DB_PATH, shared: bool = False) -> SettingsStore:
+    """`shared=True` is for several worker processes on one database; only the SQLite backend supports it."""
+    if backend == "memory":
+        if shared:
+            raise RuntimeError("SETTINGS_BACKEND=memory cannot be shared between workers; use sqlite with WEB_WORKERS > 1.")
+        return MemorySettingsStore()
+    if backend == "sqlite":
+        return SqliteSettingsStore(path, shared=shared)
+    raise RuntimeError(f"Unknown SETTINGS_BACKEND: {backend!r} (expected 'sqlite' or 'memory').")
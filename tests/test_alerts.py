@@ -0,0 +1,88 @@
+from alerts import Alert, AlertBook
+
+
+def ids(alerts):
+    return sorted((a.user_id, a.alert_id) for a in alerts)
+
+
+def test_check_fires_at_the_threshold_and_beyond():
+    book = AlertBook()
+    book.add(Alert(1, 1, "bitcoin", 70000, above=True))
+    book.add(Alert(1, 2, "bitcoin", 71000, above=True))
+    book.add(Alert(2, 1, "bitcoin", 60000, above=False))
+    book.add(Alert(2, 2, "bitcoin", 59000, above=False))
+
+    assert book.check("bitcoin", 69999.99) == []
+    assert ids(book.check("bitcoin", 70000)) == [(1, 1)]
+    assert ids(book.check("bitcoin", 60000)) == [(2, 1)]
+    assert ids(book.check("bitcoin", 100000)) == [(1, 2)]
+    assert len(book) == 1
+    assert book.check("bitcoin", 70000) == [] # Alerts fire once
+
+
+def test_check_many_only_looks_at_valid_prices():
+    book = AlertBook()
+    book.add(Alert(1, 1, "bitcoin", 70000, above=True))
+    book.add(Alert(1, 2, "ethereum", 2000, above=False))
+    book.add(Alert(1, 3, "solana", 100, above=True))
+    fired = book.check_many({"bitcoin": {"usd": 75000}, "ethereum": {"eur": 1000}, "solana": None, "dogecoin": {"usd": 1}})
+    assert ids(fired) == [(1, 1)]
+    assert sorted(book.coins()) == ["ethereum", "solana"]
+
+
+def test_add_replaces_same_id_and_remove():
+    book = AlertBook()
+    book.add(Alert(1, 1, "bitcoin", 70000, above=True))
+    book.add(Alert(1, 1, "ethereum", 2000, above=True))
+    assert book.coins() == ["ethereum"]
+    assert not book.remove(1, 1, "bitcoin")
+    assert book.remove(1, 1, "ethereum")
+    assert len(book) == 0 and book.coins() == []
+
+
+def test_equal_thresholds_of_different_users():
+    book = AlertBook()
+    book.add(Alert(1, 1, "bitcoin", 70000, above=True))
+    book.add(Alert(2, 1, "bitcoin", 70000, above=True))
+    assert book.remove(2, 1, "bitcoin")
+    assert ids(book.check("bitcoin", 70000)) == [(1, 1)]
+
+
+def test_set_user_alerts_replaces_only_that_user():
+    book = AlertBook()
+    book.add(Alert(1, 1, "bitcoin", 70000, above=True))
+    book.add(Alert(2, 1, "bitcoin", 70000, above=True))
+    book.set_user_alerts(1, [Alert(1, 5, "ethereum", 2000, above=False).to_dict()])
+    assert ids(book.check("bitcoin", 80000)) == [(2, 1)]
+    assert ids(book.check("ethereum", 1000)) == [(1, 5)]
+    book.add(Alert(1, 6, "ethereum", 2000, above=False))
+    book.set_user_alerts(1, None)
+    assert len(book) == 0
+
+
+def test_resync_rebuilds_from_stored_dicts():
+    book = AlertBook()
+    book.add(Alert(9, 1, "dogecoin", 1, above=True))
+    stored = Alert(1, 3, "bitcoin", 70000.5, above=False).to_dict()
+    book.resync([(1, [stored]), (2, None)])
+    assert book.coins() == ["bitcoin"]
+    (alert,) = book.check("bitcoin", 60000)
+    assert (alert.user_id, alert.alert_id, alert.threshold, alert.above) == (1, 3, 70000.5, False)
+    assert Alert.from_dict(1, alert.to_dict()).to_dict() == stored
+
+
+def test_fired_alert_is_not_restored_from_settings_until_settled():
+    book = AlertBook()
+    stored = [Alert(1, 1, "bitcoin", 70000, above=True).to_dict(), Alert(1, 2, "bitcoin", 90000, above=True).to_dict()]
+    book.set_user_alerts(1, stored)
+    assert ids(book.check("bitcoin", 75000)) == [(1, 1)]
+
+    # Settings still list alert 1 until the delivery has removed it there.
+    book.set_user_alerts(1, stored)
+    book.resync([(1, stored)])
+    assert ids(book.check("bitcoin", 80000)) == []
+    assert len(book) == 1
+
+    book.settle(1, 1)
+    book.set_user_alerts(1, stored[1:])
+    assert ids(book.check("bitcoin", 95000)) == [(1, 2)]
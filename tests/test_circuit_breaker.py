@@ -0,0 +1,110 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def test_opens_after_threshold_and_rejects(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_time=30)
+    for _ in range(2):
+        assert breaker.before_call() is False
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.before_call()
+    assert e.value.retry_after == 30
+    assert breaker.rejected == 1
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.before_call() is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success(True)
+    assert breaker.state == CLOSED
+    assert breaker.before_call() is False
+
+
+def test_failed_probe_reopens_with_doubled_period(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=30, max_recovery_time=100)
+    breaker.record_failure()
+    for period in (60, 100, 100):
+        clock.now += 100
+        probe = breaker.before_call()
+        breaker.record_failure(probe=probe)
+        assert breaker.state == OPEN
+        assert breaker.retry_in() == period
+
+
+def test_released_probe_allows_another(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.release(breaker.before_call())
+    assert breaker.before_call() is True
+
+
+def test_stale_calls_do_not_touch_half_open_state(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=30)
+    stale = breaker.before_call() # Started while closed, finishes after the circuit went half-open
+    breaker.record_failure()
+    clock.now += 30
+    probe = breaker.before_call()
+
+    breaker.record_failure(probe=stale)
+    assert breaker.state == HALF_OPEN
+    breaker.release(stale)
+    breaker.record_success(stale)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError): # The probe is still out, no second one
+        breaker.before_call()
+
+    breaker.record_success(probe)
+    assert breaker.state == CLOSED
+
+
+def test_rate_limit_opens_at_once_for_retry_after(clock):
+    breaker = CircuitBreaker("test", failure_threshold=5, recovery_time=30)
+    breaker.record_failure(retry_after=7, rate_limited=True)
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == 7
+
+
+def test_stale_retry_after_extends_open_period(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=30)
+    breaker.record_failure()
+    breaker.record_failure(retry_after=10, rate_limited=True) # Shorter hint from an older call is ignored
+    assert breaker.retry_in() == 30
+    breaker.record_failure(retry_after=120, rate_limited=True)
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == 120
@@ -0,0 +1,32 @@
+from coin_index import CoinCatalogue
+
+
+COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "", "symbol": "x", "name": "No id"},
+    {"id": "ethereum", "symbol": None, "name": "Ethereum"},
+    {"id": "bitcoin", "symbol": "btc2", "name": "Duplicate"},
+    {"id": "ünï", "symbol": "ü", "name": "Ünicode ☃"},
+]
+
+
+def test_catalogue_keeps_the_coin_list_as_columns():
+    catalogue = CoinCatalogue.from_coins(COINS)
+    assert len(catalogue) == 4 # Coins without an id are dropped
+    assert catalogue.ids == ["bitcoin", "ethereum", "bitcoin", "ünï"]
+    assert catalogue.symbols[1] == "" and catalogue.names[3] == "Ünicode ☃"
+    assert catalogue.handle("bitcoin") == 0 # First occurrence wins, like the old linear scan
+    assert catalogue.get("ünï") == {"id": "ünï", "symbol": "ü", "name": "Ünicode ☃"}
+    assert catalogue.get("missing") is None
+
+
+def test_rows_rebuild_the_same_catalogue():
+    catalogue = CoinCatalogue.from_coins(COINS)
+    rebuilt = CoinCatalogue(catalogue.rows())
+    assert list(rebuilt.rows()) == list(catalogue.rows())
+    assert [rebuilt.coin(h) for h in range(len(rebuilt))] == [catalogue.coin(h) for h in range(len(catalogue))]
+
+
+def test_string_column_contains_stays_within_one_value():
+    catalogue = CoinCatalogue([("a", "ab", "x"), ("b", "cd", "y")])
+    assert catalogue.symbols.contains(0, "ab") and not catalogue.symbols.contains(0, "bc")
@@ -0,0 +1,57 @@
+import random
+
+from coin_index import CoinCatalogue, CoinIndex, DERIVATIVE_FILTERS
+
+
+def linear_search(coins: list, query: str) -> list:
+    """The scan over /coins/list that CoinIndex replaced."""
+    matches = []
+    for coin in coins:
+        coin_id_lower = coin.get('id', '').lower()
+        coin_symbol_lower = coin.get('symbol', '').lower()
+        coin_name_lower = coin.get('name', '').lower()
+        if not coin_id_lower or not coin_symbol_lower or not coin.get('name'): continue
+        if any(f_word in coin_id_lower for f_word in DERIVATIVE_FILTERS): continue
+        if query == coin_symbol_lower or query == coin_id_lower or query in coin_name_lower:
+            matches.append(coin)
+    return sorted(matches, key=lambda c: (query != c.get('symbol', '').lower(), query != c.get('id', '').lower(),
+                                          query not in c.get('name', '').lower()))
+
+
+def random_coins(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    word = lambda: "".join(rng.choice("abcso") for _ in range(rng.randint(1, 5)))
+    coins = []
+    for _ in range(count):
+        coin_id = word() + rng.choice(["", "-" + word(), "-wrapped", "-pool"])
+        coins.append({"id": coin_id if rng.random() > 0.05 else coin_id.upper(),
+                      "symbol": word() if rng.random() > 0.05 else "",
+                      "name": (word() + " " + word()).title() if rng.random() > 0.05 else ""})
+    return coins
+
+
+def test_search_matches_linear_scan():
+    coins = random_coins(3000)
+    index = CoinIndex(CoinCatalogue.from_coins(coins))
+    queries = {"a", "so", "abc", "sos", "obs", "bo c", "-pool", "zzz"} | {c["id"].lower() for c in coins[:50]}
+    for query in queries:
+        expected = [c["id"] for c in linear_search(coins, query)]
+        assert [c["id"] for c in index.search(query)] == expected, query
+        assert [c["id"] for c in index.search(query, limit=5)] == expected[:5], query
+
+
+def test_empty_query_finds_nothing():
+    # The only difference from the linear scan, where "" is a substring of every name.
+    index = CoinIndex(CoinCatalogue.from_coins(random_coins(100)))
+    assert index.search("") == []
+
+
+def test_lookup_and_display_name():
+    index = CoinIndex(CoinCatalogue.from_coins([
+        {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+        {"id": "wrapped-bitcoin", "symbol": "wbtc", "name": "Wrapped Bitcoin"}]))
+    assert index.get("bitcoin") == {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}
+    assert index.get("missing") is None
+    assert index.display_name("bitcoin", with_symbol=True) == "Bitcoin (BTC)"
+    assert index.display_name("unknown-coin") == "Unknown-coin"
+    assert [c["id"] for c in index.search("bitcoin")] == ["bitcoin"] # Derivatives are filtered
@@ -0,0 +1,31 @@
+import os
+import gzip
+
+from coin_index import CoinCatalogue
+from coin_snapshot import load_snapshot, save_snapshot
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "coin_list.json.gz")
+    catalogue = CoinCatalogue.from_coins([{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+                                          {"id": "ethereum", "symbol": "eth", "name": "Ethereum"}])
+    save_snapshot(catalogue.rows(), etag='"abc"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT", path=path)
+    assert os.listdir(tmp_path) == ["coin_list.json.gz"] # Temporary file replaced atomically
+    snapshot = load_snapshot(path)
+    assert snapshot["coins"] == [["bitcoin", "btc", "Bitcoin"], ["ethereum", "eth", "Ethereum"]]
+    assert snapshot["etag"] == '"abc"' and snapshot["last_modified"].startswith("Mon")
+    assert CoinCatalogue(snapshot["coins"]).get("ethereum")["name"] == "Ethereum"
+
+
+def test_missing_corrupt_or_empty_snapshots_are_ignored(tmp_path):
+    assert load_snapshot(str(tmp_path / "missing.json.gz")) is None
+    corrupt = tmp_path / "corrupt.json.gz"
+    corrupt.write_bytes(b"not gzip")
+    assert load_snapshot(str(corrupt)) is None
+    empty = str(tmp_path / "empty.json.gz")
+    save_snapshot([], path=empty)
+    assert load_snapshot(empty) is None
+    old = tmp_path / "old.json.gz"
+    with gzip.open(old, "wt") as f:
+        f.write('{"version": 0, "coins": [["bitcoin", "btc", "Bitcoin"]]}')
+    assert load_snapshot(str(old)) is None
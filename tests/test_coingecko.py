@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from coingecko import CoinGeckoClient, RateLimitError
+
+
+async def serve(handler):
+    app = web.Application()
+    app.router.add_get("/{path:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+def test_calls_share_pooled_connections():
+    async def main():
+        peers = []
+
+        async def handler(request):
+            peers.append(request.transport.get_extra_info("peername"))
+            return web.json_response({"bitcoin": {"usd": 1.0}})
+
+        runner, url = await serve(handler)
+        client = CoinGeckoClient(base_url=url)
+        try:
+            for _ in range(10):
+                assert await client.get_simple_price(["bitcoin"]) == {"bitcoin": {"usd": 1.0}}
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return peers
+
+    peers = asyncio.run(main())
+    assert len(peers) == 10
+    assert len(set(peers)) == 1 # Keep-alive: one TCP connection for sequential calls
+
+
+def test_rate_limit_carries_retry_after():
+    async def main():
+        async def handler(request):
+            return web.Response(status=429, text="slow down", headers={"Retry-After": "7"})
+
+        runner, url = await serve(handler)
+        client = CoinGeckoClient(base_url=url)
+        try:
+            with pytest.raises(RateLimitError) as error:
+                await client.get_json("/simple/price")
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.status == 429 and error.retry_after == 7.0
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import fx_rates
+from fx_rates import FxRates, format_amount
+
+
+def payload(**values):
+    return {"rates": {code: {"name": code.upper(), "unit": code, "value": value, "type": "fiat"}
+                      for code, value in values.items()}}
+
+
+class Fetcher:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_only_base_currency_before_first_refresh():
+    fx = FxRates(Fetcher(None))
+    assert fx.rate("usd") == 1.0
+    assert fx.convert(10, "eur") is None
+    assert fx.format(1234.5, "eur") == "$1,234.50"
+
+
+def test_refresh_converts_through_the_base_currency():
+    fx = FxRates(Fetcher(payload(btc=1.0, usd=65000.0, uah=2_600_000.0, eur=60000.0)))
+    assert asyncio.run(fx.refresh()) is True
+    assert fx.rate("usd") == 1.0
+    assert fx.rate("uah") == pytest.approx(40.0)
+    assert fx.convert(2, "uah") == pytest.approx(80.0)
+    assert fx.format(2, "uah") == "80.00 ₴"
+    assert fx.updated_at is not None
+
+
+@pytest.mark.parametrize("result", [RuntimeError("down"), {"rates": {}}, payload(usd=0.0), {"nope": 1}])
+def test_failed_refresh_keeps_the_last_table(result):
+    fetcher = Fetcher(payload(usd=65000.0, eur=60000.0))
+    fx = FxRates(fetcher)
+    asyncio.run(fx.refresh())
+    fetcher.result = result
+    assert asyncio.run(fx.refresh()) is False
+    assert fx.failures == 1
+    assert fx.rate("eur") == pytest.approx(60000 / 65000)
+
+
+def test_format_amount_falls_back_to_usd():
+    assert format_amount(1500, "pln") == "1,500.00 zł"
+    assert format_amount(1500, "xyz") == "$1,500.00"
+
+
+
+def test_run_retries_sooner_after_a_failure(monkeypatch):
+    fetcher = Fetcher(RuntimeError("down"))
+    fx = FxRates(fetcher, refresh_interval=600)
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+        fetcher.result = payload(usd=65000.0) # Recovers for the next refresh
+        if len(delays) == 2:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(fx_rates.asyncio, "sleep", sleep)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(fx.run())
+    assert delays == [fx_rates.FX_RETRY_INTERVAL, 600]
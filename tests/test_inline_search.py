@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+from coin_index import CoinCatalogue, CoinIndex
+from inline_search import WARM_QUERIES, InlineSuggestions
+
+COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "solana", "symbol": "sol", "name": "Solana"},
+    {"id": "solar", "symbol": "sxp", "name": "Solar"},
+]
+
+
+def make_index(coins=COINS):
+    return CoinIndex(CoinCatalogue.from_coins(coins))
+
+
+def test_nothing_before_an_index_is_installed():
+    suggestions = InlineSuggestions()
+    assert suggestions.handles("sol") == ()
+    assert suggestions.answer("sol") == []
+
+
+def test_repeated_queries_hit_the_cache():
+    suggestions, index = InlineSuggestions(), make_index()
+    suggestions.install(index, OrderedDict())
+    first = suggestions.handles("SOL ")
+    assert first == tuple(index.search_handles("sol", suggestions.limit))
+    assert suggestions.handles("sol") == first
+    assert (suggestions.hits, suggestions.misses) == (1, 1)
+    assert suggestions.handles("  ") == ()
+
+
+def test_lru_drops_least_recently_used_query():
+    suggestions = InlineSuggestions(max_size=2)
+    suggestions.install(make_index(), OrderedDict())
+    suggestions.handles("sol")
+    suggestions.handles("btc")
+    suggestions.handles("sol")
+    suggestions.handles("solar")
+    assert len(suggestions) == 2
+    suggestions.handles("btc") # Was evicted
+    assert (suggestions.hits, suggestions.misses) == (1, 4)
+
+
+def test_rebuild_reranks_hot_queries_for_the_new_index():
+    suggestions = InlineSuggestions()
+    suggestions.install(make_index(), OrderedDict())
+    suggestions.handles("bitcoin")
+    suggestions.handles("sol")
+    assert suggestions.hot_queries()[len(WARM_QUERIES):] == ["sol", "bitcoin"]
+
+    new_index = make_index(COINS[1:])
+    suggestions.rebuild(new_index)
+    hits = suggestions.hits
+    assert suggestions.handles("bitcoin") == ()
+    assert suggestions.handles("sol") == tuple(new_index.search_handles("sol", suggestions.limit))
+    assert suggestions.handles("s") # Warm queries are ranked ahead of time
+    assert suggestions.hits == hits + 3
+
+
+def test_answer_builds_articles_with_coin_ids():
+    suggestions = InlineSuggestions()
+    suggestions.install(make_index(), OrderedDict())
+    results = suggestions.answer("sol")
+    assert [r.description for r in results][0] == "solana"
+    assert results[0].title == "Solana (SOL)"
+    assert results[0].input_message_content.message_text == "solana"
@@ -0,0 +1,63 @@
+import json
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from logging_setup import JsonFormatter, UpdateLogContextMiddleware, _UpdateContextFilter, update_log_context
+
+
+def make_record(level=logging.INFO, msg="price %s", args=("1.5",), **extra):
+    record = logging.LogRecord("bot", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_message_and_extra_fields():
+    payload = json.loads(JsonFormatter().format(make_record(coin="bitcoin")))
+    assert payload["level"] == "INFO"
+    assert payload["logger"] == "bot"
+    assert payload["msg"] == "price 1.5"
+    assert payload["coin"] == "bitcoin"
+    assert "args" not in payload
+
+
+def test_filter_passes_everything_outside_an_update():
+    assert _UpdateContextFilter().filter(make_record(logging.DEBUG))
+
+
+def test_filter_drops_debug_of_unsampled_updates_and_tags_the_rest():
+    log_filter = _UpdateContextFilter()
+    token = update_log_context.set({"update_id": 7, "user_id": 42, "sampled": False})
+    try:
+        assert not log_filter.filter(make_record(logging.DEBUG))
+        record = make_record(logging.INFO)
+        assert log_filter.filter(record)
+        assert (record.update_id, record.user_id) == (7, 42)
+    finally:
+        update_log_context.reset(token)
+
+    token = update_log_context.set({"update_id": 8, "user_id": 42, "sampled": True})
+    try:
+        assert log_filter.filter(make_record(logging.DEBUG))
+    finally:
+        update_log_context.reset(token)
+
+
+def test_middleware_sets_context_for_the_update_only():
+    seen = []
+
+    async def handler(event, data):
+        seen.append(update_log_context.get())
+        return "ok"
+
+    event = SimpleNamespace(update_id=5)
+    data = {"event_from_user": SimpleNamespace(id=42)}
+
+    async def main():
+        assert await UpdateLogContextMiddleware(sample_rate=1.0)(handler, event, data) == "ok"
+        await UpdateLogContextMiddleware(sample_rate=0.0)(handler, event, {})
+
+    asyncio.run(main())
+    assert seen == [{"update_id": 5, "user_id": 42, "sampled": True},
+                    {"update_id": 5, "user_id": None, "sampled": False}]
+    assert update_log_context.get() is None
@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import (ActiveUsers, CallbackMetric, Counter, HandlerMetricsMiddleware, Histogram, Registry,
+                     HANDLER_ERRORS, HANDLER_LATENCY)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("handler",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "start")
+    assert list(histogram.render()) == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{handler="start",le="0.1"} 2',
+        'latency_seconds_bucket{handler="start",le="1.0"} 3',
+        'latency_seconds_bucket{handler="start",le="+Inf"} 4',
+        'latency_seconds_sum{handler="start"} 3.65',
+        'latency_seconds_count{handler="start"} 4',
+    ]
+
+
+def test_registry_renders_counters_and_callbacks():
+    registry = Registry()
+    counter = registry.register(Counter("errors_total", "Errors.", ("handler",)))
+    counter.inc('say "hi"\n')
+    counter.inc('say "hi"\n', amount=2)
+    registry.register(CallbackMetric("queue", "Queue.", lambda: {("sent",): 3}, labelnames=("stat",)))
+    registry.register(CallbackMetric("missing", "Not known yet.", lambda: None))
+    assert registry.render() == (
+        "# HELP errors_total Errors.\n# TYPE errors_total counter\n"
+        'errors_total{handler="say \\"hi\\"\\n"} 3\n'
+        "# HELP queue Queue.\n# TYPE queue gauge\n"
+        'queue{stat="sent"} 3\n'
+        "# HELP missing Not known yet.\n# TYPE missing gauge\n")
+
+
+def test_active_users_are_counted_per_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("metrics.time.monotonic", lambda: now[0])
+    users = ActiveUsers(windows=(("1m", 60), ("1h", 3600)))
+    users.touch(1)
+    now[0] += 120
+    users.touch(2)
+    users.touch(2)
+    assert users.counts() == {("1m",): 1, ("1h",): 2}
+    now[0] += 3600
+    assert users.counts() == {("1m",): 0, ("1h",): 1}
+
+
+def test_middleware_times_handlers_and_counts_errors():
+    async def failing(event, data):
+        raise ValueError("boom")
+
+    def handler_named(name):
+        return SimpleNamespace(callback=SimpleNamespace(__name__=name))
+
+    async def main():
+        middleware = HandlerMetricsMiddleware()
+        assert await middleware(lambda event, data: asyncio.sleep(0, "ok"), None, {"handler": handler_named("test_ok")}) == "ok"
+        with pytest.raises(ValueError):
+            await middleware(failing, None, {"handler": handler_named("test_failing")})
+    asyncio.run(main())
+    assert sum(HANDLER_LATENCY._series[("test_ok",)][:-1]) == 1
+    assert ("test_ok",) not in HANDLER_ERRORS._values
+    assert sum(HANDLER_LATENCY._series[("test_failing",)][:-1]) == 1
+    assert HANDLER_ERRORS._values[("test_failing",)] == 1
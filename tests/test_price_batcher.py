@@ -0,0 +1,59 @@
+import asyncio
+
+from price_batcher import PriceBatcher, split_ids
+
+
+def test_split_ids_respects_max_length():
+    ids = [f"coin-{i}" for i in range(100)]
+    chunks = split_ids(ids, max_length=50)
+    assert [c for chunk in chunks for c in chunk] == ids
+    assert all(len(",".join(chunk)) <= 50 for chunk in chunks)
+
+
+def test_concurrent_fetches_share_one_deduplicated_call():
+    calls = []
+
+    async def upstream(coin_ids):
+        calls.append(list(coin_ids))
+        return {coin_id: {"usd": float(len(coin_id))} for coin_id in coin_ids}
+
+    batcher = PriceBatcher(upstream, window=0.02)
+
+    async def main():
+        return await asyncio.gather(batcher.fetch(["bitcoin", "ethereum"]), batcher.fetch(["ethereum", "solana"]),
+                                    batcher.fetch(["bitcoin"]))
+
+    first, second, third = asyncio.run(main())
+    assert calls == [["bitcoin", "ethereum", "solana"]]
+    assert first == {"bitcoin": {"usd": 7.0}, "ethereum": {"usd": 8.0}}
+    assert second == {"ethereum": {"usd": 8.0}, "solana": {"usd": 6.0}}
+    assert third == {"bitcoin": {"usd": 7.0}}
+    assert batcher.requests == 3 and batcher.upstream_calls == 1
+
+
+def test_max_ids_flushes_without_waiting_for_the_window():
+    calls = []
+
+    async def upstream(coin_ids):
+        calls.append(list(coin_ids))
+        return {}
+
+    batcher = PriceBatcher(upstream, window=10, max_ids=2)
+    asyncio.run(asyncio.wait_for(batcher.fetch(["a", "b"]), timeout=1))
+    assert calls == [["a", "b"]]
+
+
+def test_failed_chunk_only_fails_its_callers():
+    async def upstream(coin_ids):
+        if "bad" in coin_ids:
+            raise ConnectionError("down")
+        return {coin_id: {"usd": 1.0} for coin_id in coin_ids}
+
+    batcher = PriceBatcher(upstream, window=0.01, max_ids_length=4) # One id per upstream call
+
+    async def main():
+        return await asyncio.gather(batcher.fetch(["good"]), batcher.fetch(["bad"]), return_exceptions=True)
+
+    good, bad = asyncio.run(main())
+    assert good == {"good": {"usd": 1.0}}
+    assert isinstance(bad, ConnectionError)
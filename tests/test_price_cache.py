@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from price_cache import PriceCache
+
+
+class Upstream:
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.calls = []
+        self.error = None
+
+    async def __call__(self, coin_ids):
+        self.calls.append(list(coin_ids))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {coin_id: {"usd": 1.0} for coin_id in coin_ids}
+
+
+def test_concurrent_misses_make_one_upstream_call():
+    upstream = Upstream()
+    cache = PriceCache(upstream, ttl=60)
+
+    async def main():
+        return await asyncio.gather(*(cache.get_prices(["bitcoin"]) for _ in range(20)))
+
+    results = asyncio.run(main())
+    assert upstream.calls == [["bitcoin"]]
+    assert all(result["bitcoin"].prices == {"usd": 1.0} for result in results)
+    assert cache.misses == 20
+
+
+def test_fresh_entries_are_served_from_cache():
+    upstream = Upstream()
+    cache = PriceCache(upstream, ttl=60)
+
+    async def main():
+        await cache.get_prices(["bitcoin", "ethereum"])
+        return await cache.get_prices(["bitcoin"])
+
+    result = asyncio.run(main())
+    assert len(upstream.calls) == 1 and result["bitcoin"] is not None
+    assert cache.hits == 1
+
+
+def test_failed_refresh_serves_stale_prices_or_raises():
+    upstream = Upstream()
+    cache = PriceCache(upstream, ttl=0, stale_max_age=60)
+
+    async def main():
+        await cache.get_prices(["bitcoin"])
+        upstream.error = ConnectionError("down")
+        stale = await cache.get_prices(["bitcoin"])
+        with pytest.raises(ConnectionError):
+            await cache.get_prices(["ethereum"]) # Nothing to fall back to
+        return stale
+
+    stale = asyncio.run(main())
+    assert stale["bitcoin"].stale and stale["bitcoin"].prices == {"usd": 1.0}
+    assert cache.stale_served == 1
+
+
+def test_cancelled_caller_does_not_strand_other_waiters():
+    upstream = Upstream(delay=0.05)
+    cache = PriceCache(upstream, ttl=60)
+
+    async def main():
+        first = asyncio.create_task(cache.get_prices(["bitcoin"]))
+        second = asyncio.create_task(cache.get_prices(["bitcoin"]))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main())["bitcoin"] is not None
@@ -0,0 +1,78 @@
+import numpy as np
+
+from price_history import SPARKLINE_CHARS, SPARKLINE_WIDTH, PriceHistory
+
+HOUR = 3600
+
+
+def test_ring_buffer_keeps_the_newest_points_in_order():
+    history = PriceHistory(max_coins=2, resolution=60, window=240) # 5 slots
+    for i in range(8):
+        history.record("bitcoin", 100.0 + i, timestamp=i * 60)
+    times, prices = history.series("bitcoin")
+    assert list(times) == [180, 240, 300, 360, 420]
+    assert list(prices) == [103, 104, 105, 106, 107]
+
+
+def test_same_time_bucket_replaces_the_latest_point():
+    history = PriceHistory(resolution=60)
+    history.record("bitcoin", 1.0, timestamp=60)
+    history.record("bitcoin", 2.0, timestamp=90)
+    history.record("bitcoin", 3.0, timestamp=30) # Older than the latest point: ignored
+    times, prices = history.series("bitcoin")
+    assert list(times) == [90]
+    assert list(prices) == [2.0]
+
+
+def test_least_recently_updated_coin_is_dropped():
+    history = PriceHistory(max_coins=2)
+    history.record("a", 1.0, timestamp=0)
+    history.record("b", 1.0, timestamp=0)
+    history.record("a", 2.0, timestamp=600)
+    history.record("c", 5.0, timestamp=600)
+    assert len(history) == 2
+    assert len(history.series("b")[0]) == 0
+    assert list(history.series("c")[1]) == [5.0] # The reused row starts empty
+
+
+def test_record_many_skips_missing_and_bad_prices():
+    history = PriceHistory()
+    history.record_many({"a": {"usd": 2}, "b": {"usd": None}, "c": {"eur": 1.0}, "d": {"usd": 0}, "e": None}, timestamp=0)
+    assert len(history) == 1
+    assert list(history.series("a")[1]) == [2.0]
+
+
+def test_summary_changes_and_range():
+    history = PriceHistory(resolution=300)
+    now = 100 * HOUR
+    for i in range(25):
+        history.record("bitcoin", 100.0 + i, timestamp=now - (24 - i) * HOUR)
+    summary = history.summary("bitcoin", now=now)
+    assert np.isclose(summary.change_1h, (124 - 123) / 123 * 100)
+    assert np.isclose(summary.change_24h, 24.0)
+    assert (summary.low_24h, summary.high_24h) == (100.0, 124.0)
+    assert len(summary.sparkline) == SPARKLINE_WIDTH
+    assert summary.sparkline[0] == SPARKLINE_CHARS[0] and summary.sparkline[-1] == SPARKLINE_CHARS[-1]
+
+
+def test_summary_without_enough_history():
+    history = PriceHistory()
+    assert history.summary("bitcoin").change_1h is None
+    history.record("bitcoin", 1.0, timestamp=0)
+    history.record("bitcoin", 1.0, timestamp=600)
+    summary = history.summary("bitcoin", now=600)
+    assert summary.change_1h is None and summary.change_24h is None
+    assert set(summary.sparkline) == {SPARKLINE_CHARS[len(SPARKLINE_CHARS) // 2 - 1]} # Flat price
+
+
+def test_change_falls_back_to_history_starting_within_the_slack():
+    history = PriceHistory(resolution=300)
+    now = 100 * HOUR
+    history.record("bitcoin", 100.0, timestamp=now - 20 * HOUR) # 4h short of 24h, within a quarter period
+    history.record("bitcoin", 110.0, timestamp=now)
+    assert np.isclose(history.summary("bitcoin", now=now).change_24h, 10.0)
+
+    history = PriceHistory(resolution=300)
+    history.record("bitcoin", 100.0, timestamp=now - 12 * HOUR)
+    history.record("bitcoin", 110.0, timestamp=now)
+    assert history.summary("bitcoin", now=now).change_24h is None
@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from render_cache import MessageFingerprints, fingerprint
+
+
+class FakeMessage:
+    """Stands in for aiogram's Message: records edits and answers."""
+
+    def __init__(self, chat_id=1, message_id=10, edit_error=None):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.message_id = message_id
+        self.edit_error = edit_error
+        self.edits = []
+        self.answers = []
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.edits.append(text)
+        if self.edit_error is not None:
+            raise self.edit_error
+
+    async def answer(self, text, reply_markup=None, **kwargs):
+        self.answers.append(text)
+        return SimpleNamespace(chat=self.chat, message_id=self.message_id + len(self.answers))
+
+
+def keyboard(*callbacks):
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="b", callback_data=c) for c in callbacks]])
+
+
+def test_fingerprint_covers_text_and_buttons():
+    assert fingerprint("a", keyboard("x")) == fingerprint("a", keyboard("x"))
+    assert fingerprint("a", keyboard("x")) != fingerprint("a", keyboard("y"))
+    assert fingerprint("a") != fingerprint("b")
+
+
+def test_identical_render_skips_the_edit():
+    renders, message = MessageFingerprints(), FakeMessage()
+
+    async def main():
+        assert await renders.edit_or_send(message, "menu", keyboard("x")) is True
+        assert await renders.edit_or_send(message, "menu", keyboard("x")) is False
+        assert await renders.edit_or_send(message, "menu", keyboard("y")) is True
+
+    asyncio.run(main())
+    assert message.edits == ["menu", "menu"]
+    assert (renders.edited, renders.skipped) == (2, 1)
+
+
+def test_not_modified_counts_as_rendered():
+    error = TelegramBadRequest(EditMessageText(text="menu"), "Bad Request: message is not modified")
+    renders, message = MessageFingerprints(), FakeMessage(edit_error=error)
+
+    async def main():
+        assert await renders.edit_or_send(message, "menu") is False
+        assert await renders.edit_or_send(message, "menu") is False
+
+    asyncio.run(main())
+    assert len(message.edits) == 1
+    assert message.answers == []
+    assert renders.skipped == 2
+
+
+def test_failed_edit_sends_a_new_message():
+    error = TelegramBadRequest(EditMessageText(text="menu"), "Bad Request: message to edit not found")
+    renders, message = MessageFingerprints(), FakeMessage(edit_error=error)
+
+    asyncio.run(renders.edit_or_send(message, "menu"))
+    assert message.answers == ["menu"]
+    assert renders.resent == 1
+    assert renders.get(1, 11) == fingerprint("menu")
+
+
+def test_fingerprints_are_lru_bounded():
+    renders = MessageFingerprints(max_size=2)
+    renders.remember(1, 1, 1)
+    renders.remember(1, 2, 2)
+    renders.remember(1, 1, 1) # Refreshes (1, 1)
+    renders.remember(1, 3, 3)
+    assert renders.get(1, 2) is None
+    assert renders.get(1, 1) == 1
+
+    disabled = MessageFingerprints(max_size=0) # Multi-worker mode: another worker may have edited the message
+    disabled.remember(1, 1, 1)
+    assert disabled.get(1, 1) is None
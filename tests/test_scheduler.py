@@ -0,0 +1,98 @@
+import time
+import asyncio
+from collections import Counter
+
+from scheduler import (AutoUpdateScheduler, FREQUENCY_SECONDS, MISSED_SLOT_WINDOW, SLOT_STEP, next_slot,
+                       slot_offset)
+
+
+def make_scheduler(coins=None, deliver=None):
+    delivered = []
+
+    async def get_coins(user_ids):
+        return {user_id: ["bitcoin"] for user_id in user_ids if coins is None or user_id in coins}
+
+    async def fetch_prices(coin_ids):
+        return {coin_id: None for coin_id in coin_ids}
+
+    async def record(user_id, coin_ids, price_entries):
+        delivered.append(user_id)
+
+    return AutoUpdateScheduler(get_coins, fetch_prices, deliver or record), delivered
+
+
+def test_next_slot_is_the_users_offset_within_the_next_period():
+    for frequency, period in FREQUENCY_SECONDS.items():
+        for user_id in (1, 42, 123456789):
+            offset = slot_offset(user_id, frequency)
+            assert 0 <= offset < period and offset % SLOT_STEP == 0
+            for now in (0.0, 1_700_000_000.0, 1_700_000_000.0 + offset):
+                due = next_slot(frequency, now, user_id)
+                assert now < due <= now + period
+                assert (due - offset) % period == 0
+
+
+def test_subscribers_are_spread_but_share_buckets():
+    now = 1_700_000_000.0
+    buckets = Counter(next_slot("24h", now, user_id) for user_id in range(10_000))
+    assert len(buckets) == FREQUENCY_SECONDS["24h"] // SLOT_STEP
+    assert max(buckets.values()) < 100
+
+    async def main():
+        scheduler, _ = make_scheduler()
+        for user_id in range(1000):
+            scheduler.subscribe(user_id, "2h")
+        return scheduler
+    scheduler = asyncio.run(main())
+    assert len(scheduler) == 1000
+    assert len(scheduler._buckets) == FREQUENCY_SECONDS["2h"] // SLOT_STEP
+
+
+def test_resync_spreads_missed_slots_over_the_catch_up_window():
+    now = 1_700_000_000.0
+
+    async def main():
+        scheduler, _ = make_scheduler()
+        scheduler.resync([(user_id, "24h", now - 2 * 86400) for user_id in range(1000)] +
+                         [(5000, "24h", now), (5001, "2h", None), (5002, "1w", None)], now=now)
+        return scheduler
+    scheduler = asyncio.run(main())
+    missed = [scheduler._user_due[user_id][0] for user_id in range(1000)]
+    assert all(now <= due < now + MISSED_SLOT_WINDOW for due in missed)
+    assert 1 < len(set(missed)) < 1000 # Spread, yet grouped into shared buckets
+    assert scheduler._user_due[5000][0] == next_slot("24h", now, 5000) # Not missed: regular slot
+    assert scheduler.frequency(5001) == "2h" and scheduler.frequency(5002) is None
+
+
+def test_tick_delivers_reschedules_and_drops_users_without_coins():
+    now = time.time()
+
+    async def main():
+        scheduler, delivered = make_scheduler(coins={1, 2})
+        for user_id in (1, 2, 3):
+            scheduler.subscribe(user_id, "2h", due=now)
+        await scheduler.run_tick(now)
+        return scheduler, delivered
+    scheduler, delivered = asyncio.run(main())
+    assert sorted(delivered) == [1, 2]
+    assert scheduler._user_due[1][0] == next_slot("2h", now, 1)
+    assert scheduler.frequency(3) is None
+
+
+def test_slow_delivery_does_not_hold_up_the_next_bucket():
+    async def main():
+        started = []
+
+        async def slow_deliver(user_id, coin_ids, price_entries):
+            started.append(user_id)
+            await asyncio.sleep(10)
+
+        scheduler, _ = make_scheduler(deliver=slow_deliver)
+        now = time.time()
+        scheduler.subscribe(1, "2h", due=now)
+        scheduler.subscribe(2, "2h", due=now + 0.05)
+        scheduler.start()
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return started
+    assert asyncio.run(main()) == [1, 2]
@@ -0,0 +1,114 @@
+import time
+import asyncio
+
+import pytest
+
+from send_queue import PRIORITY_BULK, PRIORITY_INTERACTIVE, SendQueue, SendQueueClosed, TokenBucket
+
+
+class RetryAfter(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=2, capacity=3, now=0.0)
+    assert [bucket.reserve(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.wait_time(0.0) == pytest.approx(0.5)
+    assert bucket.reserve(0.0) == pytest.approx(0.5) # Goes into debt
+    assert bucket.wait_time(0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(100.0) == 0.0 and bucket.tokens == 3
+    assert bucket.is_idle(100.0)
+
+
+def test_token_bucket_block_backs_off_for_the_given_time():
+    bucket = TokenBucket(rate=1, capacity=3, now=0.0)
+    bucket.block(0.0, 5)
+    assert bucket.wait_time(0.0) == pytest.approx(5)
+    assert bucket.blocked_until == 5
+    assert bucket.wait_time(5.0) == 0.0
+
+
+def test_interactive_jobs_go_before_bulk():
+    async def main():
+        queue = SendQueue(global_rate=1000, chat_rate=1000, chat_burst=1000, concurrency=1)
+        order = []
+
+        def job(name):
+            async def send():
+                order.append(name)
+            return send
+
+        futures = [queue.submit(1, job("bulk-1"), PRIORITY_BULK), queue.submit(2, job("bulk-2"), PRIORITY_BULK),
+                   queue.submit(3, job("reply"), PRIORITY_INTERACTIVE)]
+        queue.start()
+        await asyncio.gather(*futures)
+        await queue.stop()
+        return order
+    assert asyncio.run(main()) == ["reply", "bulk-1", "bulk-2"]
+
+
+def test_retry_after_parks_the_chat_and_retries():
+    async def main():
+        queue = SendQueue(global_rate=1000, chat_rate=1000, chat_burst=1000, max_retries=2)
+        attempts = []
+
+        async def flaky():
+            attempts.append(asyncio.get_running_loop().time())
+            if len(attempts) == 1:
+                raise RetryAfter(0.1)
+            return "sent"
+
+        async def always_limited():
+            raise RetryAfter(0.01)
+
+        queue.start()
+        result = await queue.send(1, flaky)
+        with pytest.raises(RetryAfter):
+            await queue.send(2, always_limited)
+        await queue.stop()
+        return result, attempts, queue.stats()
+    result, attempts, stats = asyncio.run(main())
+    assert result == "sent"
+    assert attempts[1] - attempts[0] >= 0.09
+    assert stats["retried"] == 3 and stats["failed"] == 1 and stats["sent"] == 1
+
+
+def test_edits_skip_the_per_chat_limit_but_not_a_backoff():
+    async def main():
+        queue = SendQueue(global_rate=1000, chat_rate=1, chat_burst=1)
+        queue.start()
+
+        async def send():
+            return asyncio.get_running_loop().time()
+
+        started = asyncio.get_running_loop().time()
+        await queue.send(1, send)
+        edits = await asyncio.gather(*(queue.send(1, send, per_chat=False) for _ in range(5)))
+        queue._chats[1].block(time.monotonic(), 0.2) # Telegram asked this chat to back off
+        blocked = await queue.send(1, send, per_chat=False)
+        await queue.stop()
+        return started, edits, blocked
+    started, edits, blocked = asyncio.run(main())
+    assert max(edits) - started < 0.1
+    assert blocked - started >= 0.19
+
+
+def test_stop_fails_queued_and_parked_jobs():
+    async def main():
+        queue = SendQueue(global_rate=1000, chat_rate=0.1, chat_burst=1)
+        queue.start()
+
+        async def send():
+            return "sent"
+
+        assert await queue.send(1, send) == "sent"
+        parked = queue.submit(1, send) # Over the chat limit for 10s
+        await asyncio.sleep(0.01)
+        await queue.stop()
+        late = queue.submit(1, send)
+        return await asyncio.gather(parked, late, return_exceptions=True), queue.stats()
+    results, stats = asyncio.run(main())
+    assert all(isinstance(r, SendQueueClosed) for r in results)
+    assert stats["parked"] == 0
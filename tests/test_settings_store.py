@@ -0,0 +1,184 @@
+import json
+import time
+import asyncio
+import sqlite3
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from settings_store import (MemorySettingsStore, SettingsStore, SqliteFsmStorage, SqliteSettingsStore,
+                            create_settings_store)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "settings.db")
+
+
+def stored(path: str, user_id: int):
+    with sqlite3.connect(path) as conn:
+        row = conn.execute("SELECT data FROM user_settings WHERE user_id = ?", (user_id,)).fetchone()
+    return row and json.loads(row[0])
+
+
+def test_settings_store_is_abstract():
+    with pytest.raises(TypeError):
+        SettingsStore()
+    with pytest.raises(RuntimeError):
+        create_settings_store("memory", shared=True)
+
+
+def test_write_behind_flushes_dirty_users_in_one_batch(path):
+    async def main():
+        store = SqliteSettingsStore(path, flush_interval=0.05)
+        await store.start()
+        store.setdefault(1, {"coins": ["bitcoin"]})
+        data = store.get(1)
+        data["frequency"] = "2h"
+        store.mark_dirty(1)
+        assert stored(path, 1) is None # Not written yet
+        await asyncio.sleep(0.2)
+        written = stored(path, 1)
+        await store.close()
+        return store, written
+    store, written = asyncio.run(main())
+    assert written == {"coins": ["bitcoin"], "frequency": "2h"}
+    assert store.flushes == 1 and store.rows_written == 1
+
+
+def test_close_writes_pending_changes(path):
+    async def main():
+        store = SqliteSettingsStore(path, flush_interval=60)
+        await store.start()
+        store.setdefault(1, {"coins": []})
+        await store.close()
+    asyncio.run(main())
+    assert stored(path, 1) == {"coins": []}
+
+
+def test_dirty_user_read_back_after_eviction_is_still_written(path):
+    async def main():
+        store = SqliteSettingsStore(path, cache_size=2)
+        store.setdefault(1, {"coins": ["bitcoin"]})
+        store.setdefault(2, {})
+        store.setdefault(3, {}) # Evicts user 1 before its first flush
+        assert store.get(1) == {"coins": ["bitcoin"]} # Loaded back from the pending row
+        store.get(2)
+        store.get(3) # Evicts user 1 again
+        await store.flush()
+        await store.close()
+    asyncio.run(main())
+    assert stored(path, 1) == {"coins": ["bitcoin"]}
+
+
+def test_get_many_reads_cached_pending_and_stored_users(path):
+    async def main():
+        store = SqliteSettingsStore(path, cache_size=2)
+        for user_id in range(5):
+            store.setdefault(user_id, {"n": user_id})
+        await store.flush()
+        store.setdefault(10, {"n": 10}) # Dirty, in memory
+        result = await store.get_many([0, 1, 2, 3, 4, 10, 99])
+        await store.close()
+        return result
+    assert asyncio.run(main()) == {user_id: {"n": user_id} for user_id in (0, 1, 2, 3, 4, 10)}
+
+
+def test_changed_since_returns_rows_written_later(path):
+    async def main():
+        store = SqliteSettingsStore(path)
+        store.setdefault(1, {"n": 1})
+        await store.flush()
+        since = time.time()
+        await asyncio.sleep(0.01)
+        store.setdefault(2, {"n": 2})
+        store.get(1)["n"] = 11
+        store.mark_dirty(1)
+        await store.flush()
+        changed = store.changed_since(since)
+        await store.close()
+        return changed
+    changed = asyncio.run(main())
+    assert sorted((user_id, data) for user_id, data, _ in changed) == [(1, {"n": 11}), (2, {"n": 2})]
+
+
+def test_update_in_shared_mode_keeps_changes_made_by_another_process(path):
+    async def main():
+        handler = SqliteSettingsStore(path, shared=True)
+        delivery = SqliteSettingsStore(path, shared=True)
+        handler.setdefault(1, {"current_step": "SETUP_COMPLETE", "frequency": "2h"})
+        await handler.flush()
+        stale = delivery.get(1) # Read before a slow send
+        handler.enter(1)
+        handler.get(1).update(current_step="INIT", frequency=None) # Reset on another worker meanwhile
+        handler.mark_dirty(1)
+        await handler.leave(1)
+        await delivery.update(1, lambda data: data.update(last_update_at=123.0))
+        result = handler.get(1)
+        await handler.close()
+        await delivery.close()
+        return stale, result
+    stale, result = asyncio.run(main())
+    assert stale["frequency"] == "2h"
+    assert result == {"current_step": "INIT", "frequency": None, "last_update_at": 123.0}
+
+
+def test_update_transaction_holds_off_other_writers(path):
+    async def main():
+        store = SqliteSettingsStore(path, shared=True)
+        store.setdefault(1, {"n": 0})
+        await store.flush()
+        writes = []
+
+        def change(data):
+            # Runs inside BEGIN IMMEDIATE: another connection cannot write until it commits.
+            other = sqlite3.connect(path, timeout=0)
+            try:
+                other.execute("UPDATE user_settings SET data = '{}' WHERE user_id = 1")
+            except sqlite3.OperationalError as e:
+                writes.append(str(e))
+            finally:
+                other.close()
+            data["n"] += 1
+
+        await store.update(1, change)
+        await store.close()
+        return writes
+    assert asyncio.run(main()) == ["database is locked"]
+    assert stored(path, 1) == {"n": 1}
+
+
+def test_update_uses_the_in_memory_copy_when_it_is_current(path):
+    async def main():
+        memory = MemorySettingsStore()
+        memory.setdefault(1, {"n": 0})
+        await memory.update(1, lambda data: data.update(n=1))
+        await memory.update(2, lambda data: data.update(n=1)) # Unknown user: nothing to change
+
+        store = SqliteSettingsStore(path)
+        data = store.setdefault(1, {"n": 0})
+        await store.update(1, lambda data: data.update(n=1))
+        same = store.get(1) is data
+        await store.close()
+        return memory.get(1), memory.get(2), same
+    assert asyncio.run(main()) == ({"n": 1}, None, True)
+    assert stored(path, 1) == {"n": 1}
+
+
+def test_fsm_storage_is_shared_between_instances(path):
+    key = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+    async def main():
+        first, second = SqliteFsmStorage(path), SqliteFsmStorage(path)
+        assert await first.get_state(key) is None and await first.get_data(key) == {}
+        await first.set_state(key, "Form:coins")
+        await first.set_data(key, {"query": "sol"})
+        result = await second.get_state(key), await second.get_data(key)
+        await second.set_state(key, None)
+        cleared = await first.get_state(key), await first.get_data(key)
+        await first.close()
+        await second.close()
+        return result, cleared
+    result, cleared = asyncio.run(main())
+    assert result == ("Form:coins", {"query": "sol"})
+    assert cleared == (None, {"query": "sol"})
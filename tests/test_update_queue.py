@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from update_queue import UpdateQueueFull, UpdateScheduler, update_key
+
+
+def job(log, name, delay=0.0, result=None):
+    async def run():
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+        return result
+    return run
+
+
+def test_update_key_prefers_the_sender():
+    assert update_key({"update_id": 1, "message": {"from": {"id": 5}, "chat": {"id": -100}}}) == 5
+    assert update_key({"update_id": 2, "channel_post": {"chat": {"id": -100}}}) == -100
+    assert update_key({"update_id": 3, "inline_query": {"from": {"id": 7}, "query": "sol"}}) == 7
+    assert update_key({"update_id": 4}) is None
+
+
+def test_jobs_run_in_order_per_key_and_in_parallel_across_keys():
+    async def main():
+        scheduler, log = UpdateScheduler(), []
+        futures = [scheduler.submit(1, 1, job(log, "a1", 0.05, "first")), scheduler.submit(1, 2, job(log, "a2")),
+                   scheduler.submit(2, 3, job(log, "b1"))]
+        results = await asyncio.gather(*futures)
+        return results, log, scheduler.stats()
+    results, log, stats = asyncio.run(main())
+    assert results == ["first", None, None]
+    assert log.index(("end", "a1")) < log.index(("start", "a2")) # In order for user 1
+    assert log.index(("end", "b1")) < log.index(("end", "a1")) # User 2 did not wait for user 1
+    assert stats["processed"] == 3 and stats["pending"] == 0 and stats["active_users"] == 0
+
+
+def test_duplicates_within_the_window_are_dropped():
+    async def main():
+        scheduler, log = UpdateScheduler(dedup_window=0.05), []
+        await scheduler.submit(1, 10, job(log, "first"))
+        duplicate = await scheduler.submit(1, 10, job(log, "again"))
+        await asyncio.sleep(0.1)
+        await scheduler.submit(1, 10, job(log, "after window"))
+        return duplicate, log, scheduler.duplicates
+    duplicate, log, duplicates = asyncio.run(main())
+    assert duplicate is None and duplicates == 1
+    assert [name for step, name in log if step == "start"] == ["first", "after window"]
+
+
+def test_full_queue_rejects_and_forgets_the_update_id():
+    async def main():
+        scheduler, log = UpdateScheduler(max_pending=3, max_per_key=2), []
+        scheduler.submit(1, 1, job(log, "a1", 0.05))
+        scheduler.submit(1, 2, job(log, "a2"))
+        with pytest.raises(UpdateQueueFull):
+            scheduler.submit(1, 3, job(log, "a3")) # Per-user limit
+        scheduler.submit(2, 4, job(log, "b1", 0.05))
+        with pytest.raises(UpdateQueueFull):
+            scheduler.submit(3, 5, job(log, "c1")) # Overall limit
+        await asyncio.sleep(0.1)
+        redelivered = scheduler.submit(1, 3, job(log, "a3", result="redelivered"))
+        return await redelivered, scheduler.rejected
+    assert asyncio.run(main()) == ("redelivered", 2)
+
+
+def test_paused_scheduler_holds_jobs_until_resumed():
+    async def main():
+        first = []
+        scheduler, log = UpdateScheduler(paused=True, on_first_processed=lambda: first.append(True)), []
+        future = scheduler.submit(1, 1, job(log, "held"))
+        await asyncio.sleep(0.05)
+        held = list(log)
+        scheduler.resume()
+        await future
+        return held, log, first
+    held, log, first = asyncio.run(main())
+    assert held == [] and log == [("start", "held"), ("end", "held")] and first == [True]
+
+
+def test_close_cancels_running_and_queued_jobs_and_their_futures():
+    async def main():
+        scheduler, log = UpdateScheduler(), []
+        futures = [scheduler.submit(1, 1, job(log, "a1", 10)), scheduler.submit(1, 2, job(log, "a2")),
+                   scheduler.submit(None, 3, job(log, "unkeyed", 10))]
+        await asyncio.sleep(0.01)
+        await scheduler.close(timeout=0.05)
+        results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), timeout=1)
+        return results, scheduler.pending
+    results, pending = asyncio.run(main())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert pending == 0
@@ -0,0 +1,34 @@
+import asyncio
+
+from workers import LeaderLock
+
+
+def test_leader_lock_is_exclusive_until_released(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    leader, follower = LeaderLock(path), LeaderLock(path)
+    assert leader.try_acquire()
+    assert leader.try_acquire() # Already held
+    assert not follower.try_acquire()
+    assert not follower.held
+    leader.release()
+    assert follower.try_acquire()
+    follower.release()
+
+
+def test_follower_takes_over_when_the_lock_is_freed(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    leader, follower = LeaderLock(path), LeaderLock(path)
+    leader.try_acquire()
+
+    async def main():
+        waiter = asyncio.create_task(follower.wait(interval=0.01))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        leader.release()
+        await asyncio.wait_for(waiter, timeout=1)
+
+    asyncio.run(main())
+    assert follower.held
+    with open(path) as f:
+        assert f.read().isdigit() # Holder's pid, for debugging
+    follower.release()
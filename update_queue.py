@@ -0,0 +1,190 @@
+"""Webhook update scheduling: parallel across users, in order per user, with dedup and backpressure."""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+logger = logging.getLogger(__name__)
+
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", 64)) # Updates processed at the same time (across users)
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", 1000)) # Accepted but unfinished updates before answering 503
+UPDATE_MAX_PER_USER = int(os.getenv("UPDATE_MAX_PER_USER", 20)) # Same, per user
+UPDATE_DEDUP_WINDOW = float(os.getenv("UPDATE_DEDUP_WINDOW", 600)) # Seconds an update_id is remembered
+UPDATE_DEDUP_MAX = 100_000 # Hard cap on remembered update_ids
+
+
+class UpdateQueueFull(Exception):
+    """Too many pending updates (overall or for one user); the update was not accepted."""
+
+
+def update_key(update: dict):
+    """Ordering key of a raw update: the sender's user id, else the chat id, else None."""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        sender = event.get("from") or event.get("user")
+        if sender and "id" in sender:
+            return sender["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+    return None
+
+
+class UpdateScheduler:
+    """Runs jobs concurrently across keys (users) but strictly one after another per key.
+
+    `submit()` returns a future with the job's result, None for an update_id already seen
+    within the dedup window, or raises UpdateQueueFull when the pending limits are reached.
+    Jobs without a key run without ordering but still count towards the limits.
+    A paused scheduler accepts jobs but holds them until `resume()` (used while the bot starts up).
+    """
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_MAX_PENDING,
+                 max_per_key: int = UPDATE_MAX_PER_USER, dedup_window: float = UPDATE_DEDUP_WINDOW,
+                 dedup_max: int = UPDATE_DEDUP_MAX, paused: bool = False, on_first_processed=None):
+        self.max_pending = max_pending
+        self.max_per_key = max_per_key
+        self.dedup_window = dedup_window
+        self.dedup_max = dedup_max
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._queues = {} # key -> deque of (job, future); present while the key's drain task runs
+        self._tasks = set()
+        self._seen = OrderedDict() # update_id -> monotonic time first seen
+        self._running = asyncio.Event()
+        if not paused:
+            self._running.set()
+        self.on_first_processed = on_first_processed # Optional on_first_processed() once the first job has finished
+        self.pending = 0
+        self.processed = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "active_users": len(self._queues), "processed": self.processed,
+                "duplicates": self.duplicates, "rejected": self.rejected, "paused": int(self.paused)}
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def _is_duplicate(self, update_id, now: float) -> bool:
+        seen = self._seen
+        while seen and (len(seen) >= self.dedup_max or now - next(iter(seen.values())) > self.dedup_window):
+            seen.popitem(last=False)
+        return update_id in seen
+
+    def submit(self, key, update_id, job) -> asyncio.Future:
+        """Schedules `job()` (a coroutine function) after earlier jobs with the same key."""
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        if update_id is not None and self._is_duplicate(update_id, now):
+            self.duplicates += 1
+            future.set_result(None)
+            return future
+        queue = self._queues.get(key) if key is not None else None
+        if self.pending >= self.max_pending or (queue is not None and len(queue) >= self.max_per_key):
+            self.rejected += 1
+            raise UpdateQueueFull(f"{self.pending} updates pending" if queue is None else f"{len(queue)} updates pending for {key}")
+        if update_id is not None:
+            self._seen[update_id] = now # Only accepted updates are remembered, so a rejected one can be redelivered
+        self.pending += 1
+        if key is None:
+            self._spawn(self._run_one(job, future))
+        elif queue is not None:
+            queue.append((job, future))
+        else:
+            self._queues[key] = deque([(job, future)])
+            self._spawn(self._drain(key))
+        return future
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_one(self, job, future: asyncio.Future):
+        try:
+            if not self._running.is_set():
+                await self._running.wait()
+            async with self._semaphore:
+                result = await job()
+        except asyncio.CancelledError: # close() at shutdown; whoever awaits the future must not hang
+            future.cancel()
+            raise
+        except Exception as e:
+            logger.exception(f"❌ Update processing failed: {e}")
+            result = None
+        finally:
+            self.pending -= 1
+        self.processed += 1
+        if self.processed == 1 and self.on_first_processed is not None:
+            self.on_first_processed()
+        if not future.done():
+            future.set_result(result)
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                job, future = queue.popleft()
+                await self._run_one(job, future)
+        finally:
+            del self._queues[key]
+            for _, future in queue: # Only left over when cancelled on shutdown
+                self.pending -= 1
+                future.cancel()
+
+    async def close(self, timeout: float = 10):
+        """Waits up to `timeout` seconds for accepted updates to finish, then cancels the rest."""
+        if not self._tasks:
+            return
+        _, still_running = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            logger.warning(f"⚠️ Cancelled {len(still_running)} update task(s) still running at shutdown.")
+            await asyncio.gather(*still_running, return_exceptions=True)
+
+
+class OrderedRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler that feeds updates through an UpdateScheduler.
+
+    Answers 503 when the scheduler is full so Telegram redelivers the update later.
+    """
+
+    def __init__(self, dispatcher, bot, scheduler: UpdateScheduler, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, **kwargs)
+        self.scheduler = scheduler
+
+    def _submit(self, bot, update: dict, job) -> asyncio.Future:
+        return self.scheduler.submit(update_key(update), update.get("update_id"), job)
+
+    async def _handle_request_background(self, bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        try:
+            self._submit(bot, update, lambda: self._background_feed_update(bot=bot, update=update))
+        except UpdateQueueFull as e:
+            logger.warning(f"⚠️ Update {update.get('update_id')} rejected, asking Telegram to retry: {e}")
+            return web.Response(status=503, text="Busy")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _handle_request(self, bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        try:
+            future = self._submit(bot, update, lambda: self.dispatcher.feed_webhook_update(bot, update, **self.data))
+        except UpdateQueueFull as e:
+            logger.warning(f"⚠️ Update {update.get('update_id')} rejected, asking Telegram to retry: {e}")
+            return web.Response(status=503, text="Busy")
+        result = await future
+        return web.Response(body=self._build_response_writer(bot=bot, result=result))
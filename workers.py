@@ -0,0 +1,100 @@
+"""Multi-worker mode: WEB_WORKERS processes serve the webhook on one port, one of them is the leader.
+
+Every worker handles updates (the kernel spreads connections with SO_REUSEPORT) and keeps user
+settings in the shared SQLite file. Work that must happen once per bot (coin list downloads,
+scheduled auto-updates, price alerts) runs only in the process holding the leader lock; the other
+workers keep trying to take the lock, so a new leader takes over if the current one dies.
+"""
+import os
+import time
+import fcntl
+import signal
+import asyncio
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+_WEB_WORKERS = os.getenv("WEB_WORKERS", "1") # Processes serving the webhook ("auto": one per CPU); 1 keeps everything in one process
+WEB_WORKERS = (os.cpu_count() or 1) if _WEB_WORKERS == "auto" else max(1, int(_WEB_WORKERS))
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "cryptoday.leader.lock")
+LEADER_POLL_INTERVAL = 5 # Seconds between attempts of a follower to take over leadership
+WORKER_RESTART_DELAY = 1 # Seconds before a crashed worker is started again
+
+
+class LeaderLock:
+    """Exclusive flock on a file. The OS releases it when the holder exits, even on a crash."""
+
+    def __init__(self, path: str = LEADER_LOCK_PATH):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    async def wait(self, interval: float = LEADER_POLL_INTERVAL):
+        """Returns once this process holds the lock."""
+        while not self.try_acquire():
+            await asyncio.sleep(interval)
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def run_workers(target, count: int = WEB_WORKERS):
+    """Runs `target()` in `count` spawned processes and restarts any that exits, until SIGTERM/SIGINT.
+
+    `target` must be a module-level function; each worker imports the bot module afresh, so no
+    sockets, SQLite connections or event loop state are shared through fork.
+    """
+    context = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def start(number: int):
+        process = context.Process(target=target, name=f"worker-{number}")
+        process.start()
+        logger.info(f"👷 Started worker {number} (pid {process.pid}).")
+        return process
+
+    processes = {number: start(number) for number in range(count)}
+    while not stopping:
+        time.sleep(0.5)
+        for number, process in processes.items():
+            if not process.is_alive() and not stopping:
+                logger.error(f"❌ Worker {number} (pid {process.pid}) exited with code {process.exitcode}, restarting.")
+                time.sleep(WORKER_RESTART_DELAY)
+                processes[number] = start(number)
+
+    logger.info("Stopping workers...")
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate() # SIGTERM: aiohttp shuts the app down and flushes settings
+    for process in processes.values():
+        process.join(timeout=30)
+        if process.is_alive():
+            process.kill()